@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Admission control for concurrent recordings.
+
+`max_concurrent_recordings` caps how many channels record at once. A newly
+live channel that finds no free slot preempts the lowest-priority running
+recording below it, or waits in the queue until a slot frees up. Channels
+at or above the protected priority are never queued, downgraded or
+preempted; they are admitted over the cap if nothing can make room.
+
+Under load (more than `admission_downgrade_above` recordings, or variant
+bandwidths above `link_capacity_mbps`) unprotected recordings are held to
+their quality floor (`min_height`, else `admission_downgrade_height`),
+lowest priority first.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+ADMIT = 'admit'
+QUEUE = 'queue'
+PREEMPT = 'preempt'
+DEFAULT_PRIORITY = 1
+
+
+def protected_priority(config: Optional[dict]) -> Optional[float]:
+    """Priority from which channels are protected (None = no channel is).
+
+    `admission_protected_priority` sets it; otherwise it is the highest
+    priority in `CHANNEL_OPTIONS`, provided that is above the default.
+    """
+    cfg = config or {}
+    explicit = cfg.get('admission_protected_priority')
+    if explicit is not None:
+        return float(explicit)
+    prios = [float(o.get('priority', DEFAULT_PRIORITY))
+             for o in (cfg.get('CHANNEL_OPTIONS') or {}).values() if isinstance(o, dict)]
+    top = max(prios, default=DEFAULT_PRIORITY)
+    return top if top > DEFAULT_PRIORITY else None
+
+
+def is_protected(priority: float, protected_at: Optional[float]) -> bool:
+    return protected_at is not None and priority >= protected_at
+
+
+def decide(priority: float, running: Dict[str, float], cap: int, waiting: Dict[str, float],
+           protected_at: Optional[float] = None, preemptible: Optional[set] = None) -> Tuple[str, Optional[str]]:
+    """Admission of one channel: `(ADMIT|QUEUE|PREEMPT, victim)`.
+
+    `running` maps recordings (including starts already admitted) to their
+    priority, `waiting` the other queued channels that are still live. A
+    free slot goes to the candidate unless enough higher-priority channels
+    are waiting for it. Only ids in `preemptible` (default: all of
+    `running`) can be the victim.
+    """
+    protected = is_protected(priority, protected_at)
+    if cap <= 0:
+        return ADMIT, None
+    free = cap - len(running)
+    if free > 0:
+        ahead = sum(1 for p in waiting.values() if p > priority)
+        if protected or ahead < free:
+            return ADMIT, None
+        return QUEUE, None
+    victims = [(p, cid) for cid, p in running.items()
+               if p < priority and not is_protected(p, protected_at)
+               and (preemptible is None or cid in preemptible)]
+    if victims:
+        return PREEMPT, min(victims)[1]
+    return (ADMIT if protected else QUEUE), None
+
+
+def downgrade_order(running: Dict[str, float], protected_at: Optional[float]) -> List[str]:
+    """Unprotected recordings, lowest priority first: who gives up quality first."""
+    return [cid for p, cid in sorted((p, cid) for cid, p in running.items())
+            if not is_protected(p, protected_at)]
+
+
+def floor_height(opts: dict, config: Optional[dict]) -> int:
+    """Height an unprotected channel is held to under load."""
+    return int(opts.get('min_height') or (config or {}).get('admission_downgrade_height', 720))
+
+
+def under_load(running_count: int, bandwidth_bps: float, config: Optional[dict]) -> bool:
+    """More recordings than `admission_downgrade_above`, or more bandwidth than the link has."""
+    cfg = config or {}
+    above = int(cfg.get('admission_downgrade_above', 0))
+    if above and running_count > above:
+        return True
+    capacity = cfg.get('link_capacity_mbps')
+    return bool(capacity) and bandwidth_bps > float(capacity) * 1_000_000
@@ -2,13 +2,15 @@ import os
 import json
 from playwright.sync_api import sync_playwright, TimeoutError
 
-def get_session_cookies(config_path, session_path, headless=True):
+def get_session_cookies(config_path, session_path, headless=True, credentials=None):
     """
     Launches a browser, automatically logs in, and saves the session state.
     Can be run in headless mode for automated renewal.
+    `credentials` ({"CHZZK_ID": ..., "CHZZK_PW": ...}) logs in a pool account
+    other than the one in config.json.
     """
     try:
-        config = load_config(config_path)
+        config = dict(load_config(config_path), **(credentials or {}))
         if not config.get("CHZZK_ID") or not config.get("CHZZK_PW"):
             raise ValueError("CHZZK_ID and CHZZK_PW must be set in config.")
     except (FileNotFoundError, ValueError) as e:
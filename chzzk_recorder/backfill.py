@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Recover the restart gap of an interrupted recording from the DVR window.
+
+A restarted downloader joins at the live edge, but the media playlist still
+lists the last few minutes of segments. Before the new part is spawned, the
+interrupted part's timeline index says which media sequence was being
+recorded last (`seq` of the newest scanned entry, advanced by the media
+written after that scan). Every segment after it that is still in the
+window is fetched in parallel and written in order to
+`<previous basename>_backfill.ts`, which sorts between the two parts and
+gets its own sidecar when done. The downloader itself is told to start at
+the live edge, so only what already left the server window is lost.
+
+The estimate errs towards refetching a segment that was already written
+(`backfill_overlap_segments`) rather than leaving a hole.
+"""
+
+import os
+import time
+import threading
+import datetime as _dt
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import requests
+
+import journal
+import llhls
+import timeline
+import variants
+from ts_check import PTS_HZ
+
+BACKFILL_SUFFIX = '_backfill'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+# index entries used to estimate the bitrate of the unindexed tail
+TAIL_RATE_ENTRIES = 64
+
+
+def backfill_path_for(ts_path: str) -> str:
+    root, ext = os.path.splitext(ts_path)
+    return root + BACKFILL_SUFFIX + (ext or '.ts')
+
+
+def last_written(ts_path: str) -> Optional[dict]:
+    """Where `ts_path` stopped, from its timeline index.
+
+    `anchor_seq` is the live-edge sequence of the newest scanned entry and
+    `seconds_after_anchor` the media written after that scan (the unindexed
+    tail is sized from the file length and the recent bitrate); `plan` turns
+    them into a sequence number. None without sequence-stamped entries.
+    An LL-HLS capture's progress file gives the sequence exactly: the segment
+    it was in when it stopped is refetched whole.
+    """
+    progress = llhls.read_progress(llhls.progress_path_for(ts_path))
+    if progress and progress.get('msn') is not None:
+        return {'anchor_seq': int(progress['msn']) - 1, 'seconds_after_anchor': 0.0, 'media': None, 'exact': True}
+    idx_path = timeline.index_path_for(ts_path)
+    if not os.path.exists(idx_path):
+        return None
+    idx = timeline.TimelineIndex(idx_path)
+    if not len(idx):
+        return None
+    rec = idx.records
+    with_seq = np.flatnonzero(rec['seq'] >= 0)
+    if not len(with_seq):
+        return None
+    anchor = rec[with_seq[-1]]
+    end_media = int(rec['media'][-1])
+    try:
+        size = os.path.getsize(ts_path)
+    except OSError:
+        size = int(rec['offset'][-1])
+    tail = rec[-TAIL_RATE_ENTRIES:]
+    span_media = int(tail['media'][-1] - tail['media'][0])
+    span_bytes = int(tail['offset'][-1] - tail['offset'][0])
+    if span_media > 0 and span_bytes > 0 and size > int(rec['offset'][-1]):
+        end_media += int((size - int(rec['offset'][-1])) * span_media / span_bytes)
+    return {
+        'anchor_seq': int(anchor['seq']),
+        'seconds_after_anchor': (end_media - int(anchor['media'])) / PTS_HZ,
+        'media': end_media / PTS_HZ,
+    }
+
+
+def plan(playlist: dict, written: dict, overlap: int = 2) -> dict:
+    """Segments of `playlist` to fetch after `written` (see `last_written`).
+
+    Returns `{'segments', 'last_seq', 'lost'}`; `lost` counts segments that
+    already left the window.
+    """
+    segments = playlist.get('segments') or []
+    durations = [s['duration'] for s in segments if s.get('duration')]
+    seg_seconds = (sum(durations) / len(durations)) if durations else (playlist.get('target_duration') or 2.0)
+    last_seq = written['anchor_seq'] + int(written['seconds_after_anchor'] / seg_seconds)
+    if not segments or last_seq >= segments[-1]['seq']:
+        # nothing newer, or the sequence restarted and cannot be lined up
+        return {'segments': [], 'last_seq': last_seq, 'lost': 0}
+    if written.get('exact'):
+        overlap = 0
+    wanted = [s for s in segments if s['seq'] > last_seq - overlap]
+    return {'segments': wanted, 'last_seq': last_seq, 'lost': max(0, segments[0]['seq'] - last_seq - 1)}
+
+
+class Backfill(threading.Thread):
+    """Fetch planned segments in parallel and append them in sequence order."""
+
+    def __init__(self, segments: List[dict], out_path: str, hdrs: Dict[str, str], meta: dict,
+                 workers: int = 8, retries: int = 2, timeout: float = 10):
+        super().__init__(name=f'backfill-{os.path.basename(out_path)}', daemon=True)
+        self.segments = segments
+        self.out_path = out_path
+        self.meta_path = os.path.splitext(out_path)[0] + journal.META_SUFFIX
+        self.hdrs = hdrs
+        self.meta = meta
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.timeout = timeout
+        self.written = 0
+        self.missing: List[int] = []
+        self.bytes = 0
+        self.state = STATUS_RUNNING
+        self._callbacks: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+        self._http = requests.Session()
+
+    def add_done_callback(self, fn: Callable[[str], None]):
+        """Call `fn(meta_path)` once the backfill file is complete (now, if it already is)."""
+        with self._lock:
+            if self.state == STATUS_RUNNING:
+                self._callbacks.append(fn)
+                return
+        if self.state == STATUS_DONE:
+            fn(self.meta_path)
+
+    def status(self) -> dict:
+        return {'output': self.out_path, 'status': self.state, 'segments': len(self.segments),
+                'written': self.written, 'missing': len(self.missing), 'bytes': self.bytes}
+
+    def _fetch(self, seg: dict) -> Optional[bytes]:
+        for attempt in range(self.retries + 1):
+            try:
+                r = self._http.get(seg['url'], headers=self.hdrs, timeout=self.timeout)
+                if r.ok:
+                    return r.content
+                if r.status_code in (403, 404, 410):
+                    # already left the window (or the CDN token expired)
+                    return None
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.5 * (attempt + 1))
+        return None
+
+    def run(self):
+        started = time.time()
+        done: Dict[int, Optional[bytes]] = {}
+        order = [s['seq'] for s in self.segments]
+        nxt = 0
+        try:
+            with open(self.out_path, 'wb') as out, \
+                    ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backfill') as pool:
+                futures = {pool.submit(self._fetch, s): s['seq'] for s in self.segments}
+                for fut in as_completed(futures):
+                    done[futures[fut]] = fut.result()
+                    # write the contiguous run that is ready, oldest first
+                    while nxt < len(order) and order[nxt] in done:
+                        data = done.pop(order[nxt])
+                        if data is None:
+                            self.missing.append(order[nxt])
+                        else:
+                            out.write(data)
+                            self.written += 1
+                            self.bytes += len(data)
+                        nxt += 1
+        except Exception as e:
+            print(f"[BACKFILL] {self.out_path}: {e}")
+            self._finish(STATUS_FAILED)
+            return
+        if not self.written:
+            try:
+                os.remove(self.out_path)
+            except OSError:
+                pass
+            print(f"[BACKFILL] None of {len(order)} segment(s) could be fetched for {self.out_path}.")
+            self._finish(STATUS_FAILED)
+            return
+        meta = dict(self.meta)
+        meta.update({
+            'output': self.out_path,
+            'status': journal.STATUS_ENDED,
+            'ended_at': _dt.datetime.now().isoformat(timespec='seconds'),
+            'backfill': {'first_seq': order[0], 'last_seq': order[-1], 'segments': self.written,
+                         'missing_seqs': self.missing, 'bytes': self.bytes,
+                         'seconds': round(time.time() - started, 3)},
+        })
+        try:
+            journal.write_meta(self.meta_path, meta)
+        except Exception as e:
+            print(f"[BACKFILL] Failed to write {self.meta_path}: {e}")
+        print(f"[BACKFILL] {self.written}/{len(order)} segment(s), {self.bytes} bytes in "
+              f"{time.time() - started:.1f}s -> {self.out_path}")
+        self._finish(STATUS_DONE)
+
+    def _finish(self, state: str):
+        with self._lock:
+            self.state = state
+            callbacks, self._callbacks = self._callbacks, []
+        if state != STATUS_DONE:
+            return
+        for fn in callbacks:
+            try:
+                fn(self.meta_path)
+            except Exception as e:
+                print(f"[BACKFILL] Callback failed for {self.meta_path}: {e}")
+
+
+def prepare(continuation: Optional[dict], media_url: str, hdrs: Dict[str, str], meta: dict,
+            config: Optional[dict] = None) -> Optional[Backfill]:
+    """Plan the backfill for a continuation; None when there is nothing to recover.
+
+    Call before spawning the downloader so the playlist snapshot is at or
+    behind the downloader's first segment; `Backfill.start()` afterwards.
+    """
+    cfg = config or {}
+    if not continuation or not continuation.get('interrupted') or not bool(cfg.get('backfill_enabled', True)):
+        return None
+    prev_output = continuation.get('output')
+    if not prev_output or not os.path.exists(prev_output):
+        return None
+    written = last_written(prev_output)
+    if written is None:
+        print(f"[BACKFILL] No sequence-stamped index for {prev_output}; skipping backfill.")
+        return None
+    try:
+        r = variants.http.get(media_url, headers=hdrs, timeout=5)
+        if not r.ok or '#EXTINF' not in r.text:
+            return None
+        if '#EXT-X-MAP' in r.text:
+            # fMP4 segments cannot be concatenated into a .ts
+            print("[BACKFILL] fMP4 playlist; skipping backfill.")
+            return None
+        playlist = variants.parse_media_playlist(r.text, media_url)
+    except requests.exceptions.RequestException as e:
+        print(f"[BACKFILL] Could not read the media playlist: {e}")
+        return None
+    p = plan(playlist, written, int(cfg.get('backfill_overlap_segments', 2)))
+    if p['lost']:
+        print(f"[BACKFILL] ~{p['lost']} segment(s) after seq {p['last_seq']} already left the window.")
+    if not p['segments']:
+        return None
+    out_path = backfill_path_for(prev_output)
+    bf_meta = dict(meta, basename=continuation.get('basename'), part=int(continuation.get('part', 2)) - 1,
+                   backfill_of=continuation.get('meta_path'), lost_segments=p['lost'])
+    print(f"[BACKFILL] Fetching {len(p['segments'])} segment(s) from seq {p['segments'][0]['seq']} -> {out_path}")
+    return Backfill(p['segments'], out_path, hdrs, bf_meta, workers=int(cfg.get('backfill_workers', 8)))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Global download-thread budget shared by all concurrent recordings."""
+
+import os
+import math
+from typing import Dict, Optional
+
+
+def total_threads(config: Optional[dict], link_bps: Optional[float] = None,
+                  per_connection_bps: Optional[float] = None) -> int:
+    """Threads available to all N_m3u8DL-RE processes together.
+
+    The CPU side allows `download_threads_per_core` per core. The link side
+    allows enough parallel connections to fill the link, twice over so a
+    slow connection does not idle the pipe. It needs the link capacity
+    (`link_capacity_mbps`, or `link_bps` from the caller) and a measured
+    per-connection throughput. Probes only measure one connection, so
+    without `link_capacity_mbps` the budget is CPU-bound. The smaller of the
+    two wins; `download_thread_budget` overrides both.
+    """
+    cfg = config or {}
+    explicit = cfg.get('download_thread_budget')
+    if explicit:
+        return max(1, int(explicit))
+    cores = os.cpu_count() or 2
+    budget = cores * int(cfg.get('download_threads_per_core', 4))
+    capacity = cfg.get('link_capacity_mbps')
+    if capacity:
+        link_bps = float(capacity) * 1_000_000
+    if link_bps and per_connection_bps and per_connection_bps > 0:
+        budget = min(budget, max(1, math.ceil(link_bps / per_connection_bps) * 2))
+    return max(1, budget)
+
+
+def allocate(priorities: Dict[str, float], total: int, min_per: int = 1,
+             max_per: int = 16) -> Dict[str, int]:
+    """Split `total` threads across recordings in proportion to priority.
+
+    Every recording gets at least `min_per` and at most `max_per` threads;
+    leftovers go to the largest fractional shares first (highest priority
+    breaks ties). The sum never exceeds `total`: when the recordings cannot
+    all get `min_per`, the floor drops to `total // n`, and threads lifted to
+    the floor are taken back from the lowest priorities above it. The one
+    exception is more recordings than threads (n > total), where each still
+    gets a single thread.
+    """
+    if not priorities:
+        return {}
+    weights = {k: max(float(w), 0.01) for k, w in priorities.items()}
+    wsum = sum(weights.values())
+    floor = min(min_per, max(1, total // len(weights)))
+    shares = {k: total * w / wsum for k, w in weights.items()}
+    alloc = {k: min(max_per, max(floor, int(s))) for k, s in shares.items()}
+    excess = sum(alloc.values()) - total
+    while excess > 0:
+        above = [k for k in alloc if alloc[k] > floor]
+        if not above:
+            break
+        k = min(above, key=lambda k: (weights[k], -alloc[k]))
+        alloc[k] -= 1
+        excess -= 1
+    remaining = total - sum(alloc.values())
+    order = sorted(shares, key=lambda k: (shares[k] - int(shares[k]), weights[k]), reverse=True)
+    while remaining > 0:
+        grew = False
+        for k in order:
+            if remaining <= 0:
+                break
+            if alloc[k] < max_per:
+                alloc[k] += 1
+                remaining -= 1
+                grew = True
+        if not grew:
+            break
+    return alloc
@@ -2,50 +2,245 @@
 import json
 import os
 import requests
+import threading
 import time
 
+DEFAULT_BASE_URL = "https://api.chzzk.naver.com"
+# Points the client at a stand-in (e.g. tools/replay_server.py) instead of the real API
+BASE_URL_ENV = "CHZZK_API_BASE_URL"
+DEFAULT_DEVICE_ID = "4438f666-fa96-4d28-9cc8-39c460399cc8"
+
+# Session health: transient failures bench a session briefly (doubling up to
+# BENCH_MAX_SECONDS), throttling for Retry-After, rejected cookies until refreshed
+# (or, when no other session is usable, retried with the same backoff).
+MAX_CONSECUTIVE_FAILURES = 3
+BENCH_BASE_SECONDS = 30
+BENCH_MAX_SECONDS = 900
+THROTTLE_DEFAULT_SECONDS = 60
+
+
+def load_session_headers(session_path):
+    """Request headers and cookie dict from a Playwright storage-state file."""
+    with open(session_path, "r") as f:
+        storage_state = json.load(f)
+
+    cookies = {cookie['name']: cookie['value'] for cookie in storage_state['cookies']}
+    cookie_string = "; ".join([f"{name}={value}" for name, value in cookies.items()])
+
+    # Find the specific deviceId from cookies if it exists, otherwise use a default.
+    # Based on cURL.txt, a static deviceId seems to work.
+    device_id = cookies.get("ba.uuid", DEFAULT_DEVICE_ID)
+
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
+        'Accept': 'application/json, text/plain, */*',
+        'Accept-Language': 'ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7',
+        'Origin': 'https://chzzk.naver.com',
+        'Referer': 'https://chzzk.naver.com/',
+        'Cookie': cookie_string,
+        'deviceid': device_id,
+        'front-client-platform-type': 'PC',
+        'front-client-product-type': 'web'
+    }
+    return headers, cookies
+
+
+class ApiSession:
+    """One logged-in account (session file) and its health."""
+
+    def __init__(self, session_path, account=None):
+        self.path = session_path
+        self.account = account or {}
+        self.http = requests.Session()
+        self.headers = None
+        self.adult = False
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.benched_until = 0.0
+        self.bench_reason = None
+        self.needs_refresh = False
+        self.last_refresh_attempt = 0.0
+        self.latency_ms = None
+        self.inflight = 0
+        self.load()
+
+    def load(self):
+        """(Re)read the session file; a readable file clears the bench."""
+        try:
+            self.headers, cookies = load_session_headers(self.path)
+        except (OSError, ValueError, KeyError) as e:
+            self.headers = None
+            self.needs_refresh = True
+            self.bench_reason = f"session file unusable: {e}"
+            return False
+        # Adult-gated channels only play for a full login
+        self.adult = "NID_SES" in cookies
+        self.needs_refresh = False
+        self.benched_until = 0.0
+        self.bench_reason = None
+        self.consecutive_failures = 0
+        return True
+
+    def benched(self, now):
+        return self.headers is None or self.needs_refresh or now < self.benched_until
+
+    def status(self):
+        now = time.time()
+        return {
+            'adult': self.adult,
+            'requests': self.requests,
+            'failures': self.failures,
+            'benched_for': max(0, int(self.benched_until - now)) if self.benched(now) else 0,
+            'bench_reason': self.bench_reason if self.benched(now) else None,
+            'needs_refresh': self.needs_refresh,
+            'latency_ms': self.latency_ms,
+        }
+
+
+class SessionPool:
+    """Spreads requests over healthy sessions; benches failing or throttled ones."""
+
+    def __init__(self, sessions):
+        self.sessions = list(sessions)
+        self.lock = threading.Lock()
+
+    def has_adult(self):
+        return any(s.adult for s in self.sessions)
+
+    def acquire(self, adult=False, exclude=()):
+        now = time.time()
+        with self.lock:
+            pool = [s for s in self.sessions if s not in exclude and s.headers is not None and (s.adult or not adult)]
+            healthy = [s for s in pool if not s.benched(now)]
+            if not healthy:
+                # everything is benched: keep going with the one that recovers first
+                # rather than stopping (a single-session setup behaves as before);
+                # rejected sessions only once their backoff has run out
+                healthy = sorted((s for s in pool if not s.needs_refresh or now >= s.benched_until),
+                                 key=lambda s: (s.needs_refresh, s.benched_until))[:1]
+            if not healthy:
+                return None
+            session = min(healthy, key=lambda s: (s.inflight, s.requests))
+            session.inflight += 1
+            session.requests += 1
+            return session
+
+    def release(self, session, ok, reason=None, bench_seconds=None, invalid=False, latency=None):
+        with self.lock:
+            session.inflight -= 1
+            if ok:
+                session.consecutive_failures = 0
+                if session.needs_refresh:
+                    # the rejection was transient: the cookies work again
+                    session.needs_refresh = False
+                    session.benched_until = 0.0
+                    session.bench_reason = None
+                if latency is not None:
+                    ms = latency * 1000
+                    session.latency_ms = round(ms if session.latency_ms is None else 0.8 * session.latency_ms + 0.2 * ms, 1)
+                return
+            session.failures += 1
+            session.consecutive_failures += 1
+            if invalid:
+                session.needs_refresh = True
+            if bench_seconds is None and (invalid or session.consecutive_failures >= MAX_CONSECUTIVE_FAILURES):
+                exponent = session.consecutive_failures - (1 if invalid else MAX_CONSECUTIVE_FAILURES)
+                bench_seconds = min(BENCH_MAX_SECONDS, BENCH_BASE_SECONDS * (2 ** exponent))
+            if bench_seconds:
+                session.benched_until = time.time() + (bench_seconds or 0)
+                session.bench_reason = reason
+                print(f"[SESSIONS] Benched {os.path.basename(session.path)}: {reason}"
+                      + f" for {int(bench_seconds)}s" + (" (needs refresh)" if invalid else ""))
+
+    def needing_refresh(self):
+        with self.lock:
+            return [s for s in self.sessions if s.needs_refresh]
+
+
 class ChzzkAPI:
-    def __init__(self, config_dir):
+    def __init__(self, config_dir, base_url=None, accounts=None):
         self.session_path = os.path.join(config_dir, "session.json")
-        self.headers = self._prepare_headers()
-
-    def _prepare_headers(self):
-        """Loads cookies from session file and prepares headers for API requests."""
+        self.base_url = (base_url or os.environ.get(BASE_URL_ENV) or DEFAULT_BASE_URL).rstrip('/')
         if not os.path.exists(self.session_path):
             raise FileNotFoundError(f"Session file not found at {self.session_path}. Please run install.py first.")
+        self.pool = SessionPool([ApiSession(self.session_path)])
+        # channels known to be adult-gated are only asked through sessions that can see them
+        self.adult_channels = set()
+        self.set_accounts(accounts or [])
 
-        with open(self.session_path, "r") as f:
-            storage_state = json.load(f)
-        
-        cookies = {cookie['name']: cookie['value'] for cookie in storage_state['cookies']}
-        cookie_string = "; ".join([f"{name}={value}" for name, value in cookies.items()])
-
-        # Find the specific deviceId from cookies if it exists, otherwise use a default.
-        # Based on cURL.txt, a static deviceId seems to work.
-        device_id = cookies.get("ba.uuid", "4438f666-fa96-4d28-9cc8-39c460399cc8")
-
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Origin': 'https://chzzk.naver.com',
-            'Referer': 'https://chzzk.naver.com/',
-            'Cookie': cookie_string,
-            'deviceid': device_id,
-            'front-client-platform-type': 'PC',
-            'front-client-product-type': 'web'
-        }
-        return headers
+    @property
+    def headers(self):
+        """Headers of the primary session."""
+        return self.pool.sessions[0].headers
+
+    def set_accounts(self, accounts):
+        """Add/remove extra accounts (`[{"session_path": ..., "CHZZK_ID": ..., "CHZZK_PW": ...}]`)."""
+        wanted = {a['session_path']: a for a in accounts if a.get('session_path')}
+        with self.pool.lock:
+            primary, extra = self.pool.sessions[0], self.pool.sessions[1:]
+            kept = [s for s in extra if s.path in wanted]
+            known = {s.path for s in kept}
+            for s in kept:
+                s.account = wanted[s.path]
+            added = [ApiSession(path, account) for path, account in wanted.items()
+                     if path not in known and path != primary.path]
+            self.pool.sessions = [primary] + kept + added
+        for s in added:
+            print(f"[SESSIONS] Added {s.path}" + ("" if s.headers else f" ({s.bench_reason})"))
+
+    def reload_sessions(self, sessions=None):
+        for s in sessions or self.pool.sessions:
+            s.load()
+
+    def pool_status(self):
+        return {s.path: s.status() for s in self.pool.sessions}
+
+    def _get(self, url, params=None, timeout=10, adult=False):
+        """GET through the pool: `(response, session)`; fails over to the next session.
+
+        Raises the last `RequestException` when no session could answer.
+        """
+        tried = []
+        last_error = None
+        while True:
+            session = self.pool.acquire(adult=adult, exclude=tried)
+            if session is None:
+                raise last_error or requests.exceptions.ConnectionError("no usable API session")
+            tried.append(session)
+            started = time.time()
+            try:
+                response = session.http.get(url, headers=session.headers, params=params, timeout=timeout)
+            except requests.exceptions.RequestException as e:
+                self.pool.release(session, False, reason=str(e))
+                last_error = e
+                continue
+            if response.status_code == 429:
+                retry_after = response.headers.get('Retry-After')
+                seconds = float(retry_after) if retry_after and retry_after.isdigit() else THROTTLE_DEFAULT_SECONDS
+                self.pool.release(session, False, reason="HTTP 429", bench_seconds=seconds)
+                last_error = requests.exceptions.HTTPError("429 Too Many Requests", response=response)
+                continue
+            if response.status_code in (401, 403):
+                self.pool.release(session, False, reason=f"HTTP {response.status_code}", invalid=True)
+                last_error = requests.exceptions.HTTPError(f"{response.status_code} rejected session", response=response)
+                continue
+            if response.status_code >= 500:
+                self.pool.release(session, False, reason=f"HTTP {response.status_code}")
+                last_error = requests.exceptions.HTTPError(f"{response.status_code} Server Error", response=response)
+                continue
+            self.pool.release(session, True, latency=time.time() - started)
+            return response, session
 
     def get_followed_channels(self):
         """
         Fetches the list of followed channels that are currently live.
         Based on the cURL command provided.
         """
-        url = "https://api.chzzk.naver.com/service/v1/channels/followings?page=0&size=500&sortType=FOLLOW"
+        url = f"{self.base_url}/service/v1/channels/followings?page=0&size=500&sortType=FOLLOW"
         
         try:
-            response = requests.get(url, headers=self.headers)
+            response, _ = self._get(url)
             response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
             
             data = response.json()
@@ -61,8 +256,9 @@ class ChzzkAPI:
 
     def get_channel_info(self, channel_id):
         """Fetches channel information for a given channel_id."""
+        url = f"{self.base_url}/service/v1/channels/{channel_id}"
         try:
-            response = requests.get(url, headers=self.headers)
+            response, _ = self._get(url)
             response.raise_for_status()
             return response.json().get('content', {})
         except requests.exceptions.RequestException as e:
@@ -77,11 +273,11 @@ class ChzzkAPI:
         Fetches live stream details for a given channel_id.
         Includes retry logic for temporary API inconsistencies.
         """
-        url = f"https://api.chzzk.naver.com/service/v1/channels/{channel_id}/live-detail"
+        url = f"{self.base_url}/service/v1/channels/{channel_id}/live-detail"
         
         for attempt in range(retries):
             try:
-                response = requests.get(url, headers=self.headers, timeout=10)
+                response, session = self._get(url, adult=channel_id in self.adult_channels)
                 response.raise_for_status()
                 data = response.json()
                 content = data.get('content')
@@ -91,16 +287,20 @@ class ChzzkAPI:
                     # This is a definitive offline status, no need to retry.
                     return None
 
-                # Adult channel check
-                if content.get("adult") and not self.headers.get("Cookie", "").__contains__("NID_SES"):
-                     print(f"WARNING: Channel {channel_id} is for adults and requires full authentication (NID_SES cookie). Skipping.")
-                     return None
+                # Adult channel check: route to a fully authenticated session if the pool has one
+                if content.get("adult") and not session.adult:
+                    if self.pool.has_adult():
+                        self.adult_channels.add(channel_id)
+                        print(f"DEBUG: Channel {channel_id} is adult-gated; asking an authenticated session.")
+                        continue
+                    print(f"WARNING: Channel {channel_id} is for adults and requires full authentication (NID_SES cookie). Skipping.")
+                    return None
 
                 live_playback_json_str = content.get("livePlaybackJson")
                 if not live_playback_json_str:
                     # This could be a temporary state, especially if status is not 'ENDED'
-                    if content.get('status') == 'ENDED':
-                        print(f"DEBUG: Channel {channel_id} status is 'ENDED'. No retry needed.")
+                    if content.get('status') in ('ENDED', 'CLOSE'):
+                        print(f"DEBUG: Channel {channel_id} status is '{content.get('status')}'. No retry needed.")
                         return None # Stream has definitively ended.
                     
                     print(f"DEBUG: 'livePlaybackJson' is missing for channel {channel_id}, retrying... ({attempt + 1}/{retries})")
@@ -109,11 +309,14 @@ class ChzzkAPI:
 
                 live_playback_data = json.loads(live_playback_json_str)
                 m3u8_url = None
+                llhls_url = None
                 if live_playback_data.get("media") and isinstance(live_playback_data["media"], list):
                     for media_item in live_playback_data["media"]:
-                        if media_item.get("mediaId", "").lower() == "hls":
+                        media_id = media_item.get("mediaId", "").lower()
+                        if media_id == "hls" and not m3u8_url:
                             m3u8_url = media_item.get("path")
-                            break
+                        elif media_id == "llhls" and not llhls_url:
+                            llhls_url = media_item.get("path")
 
                 if m3u8_url:
                     # Success, return details
@@ -121,7 +324,13 @@ class ChzzkAPI:
                         "liveTitle": content.get("liveTitle"),
                         "channelName": content.get("channel", {}).get("channelName"),
                         "videoId": live_playback_data.get("meta", {}).get("videoId"),
-                        "m3u8_url": m3u8_url
+                        "m3u8_url": m3u8_url,
+                        # Low-Latency HLS master, if the stream offers one
+                        "llhls_url": llhls_url,
+                        # the recording uses the same account's cookies
+                        "session_path": session.path,
+                        # start of the detection -> first byte measurement
+                        "detected_at": time.time(),
                     }
                 else:
                     # m3u8_url not found, could be temporary
@@ -146,7 +355,7 @@ class ChzzkAPI:
         Fetch VOD list for a channel. Returns a list of entries that contain at least 'videoId'.
         The API structure may evolve, so parsing is defensive.
         """
-        base = f"https://api.chzzk.naver.com/service/v1/channels/{channel_id}/videos"
+        base = f"{self.base_url}/service/v1/channels/{channel_id}/videos"
         params = {
             'sortType': sort,
             'pagingType': 'PAGE',
@@ -156,7 +365,7 @@ class ChzzkAPI:
             'videoType': ''
         }
         try:
-            r = requests.get(base, headers=self.headers, params=params, timeout=10)
+            r, _ = self._get(base, params=params)
             r.raise_for_status()
             data = r.json()
 
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Local runtime control API for the watcher.
+
+A small JSON-over-HTTP server bound to 127.0.0.1. Every request becomes a
+command on a queue that the watcher's `control` duty executes, so handlers
+never touch recording state from the HTTP thread.
+
+    GET  /status
+    POST /channels/add       {"channel_id": "...", "persist": true}
+    POST /channels/remove    {"channel_id": "...", "persist": true}
+    POST /recordings/start   {"channel_id": "..."}
+    POST /recordings/stop    {"channel_id": "..."}
+    POST /polling/pause
+    POST /polling/resume
+    POST /config/reload
+    POST /profile            {"mode": "cprofile|sample", "seconds": 30}
+                             {"mode": "timers|tracemalloc", "enable": true} / {"mode": "snapshot"}
+
+Client usage inside the container:
+
+    python3 control.py status
+    python3 control.py add <channel_id>
+    python3 control.py stop <channel_id>
+    python3 control.py profile cprofile 30     # or: sample 30 / timers on / tracemalloc off / snapshot
+"""
+
+import sys
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+DEFAULT_PORT = 8765
+REPLY_TIMEOUT = 60
+
+ROUTES = {
+    ('GET', '/status'): 'status',
+    ('POST', '/channels/add'): 'add_channel',
+    ('POST', '/channels/remove'): 'remove_channel',
+    ('POST', '/recordings/start'): 'start',
+    ('POST', '/recordings/stop'): 'stop',
+    ('POST', '/polling/pause'): 'pause',
+    ('POST', '/polling/resume'): 'resume',
+    ('POST', '/config/reload'): 'reload',
+    ('POST', '/profile'): 'profile',
+}
+
+
+class ControlServer:
+    """HTTP front end; commands are consumed with `get_command`."""
+
+    def __init__(self, port: int = DEFAULT_PORT, token: Optional[str] = None, host: str = '127.0.0.1'):
+        self.commands: 'queue.Queue' = queue.Queue()
+        self.token = token
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                pass
+
+            def _reply(self, code: int, body: dict):
+                data = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _dispatch(self, method: str):
+                name = ROUTES.get((method, self.path.split('?', 1)[0].rstrip('/') or '/'))
+                if not name:
+                    return self._reply(404, {'ok': False, 'error': 'unknown endpoint'})
+                if server.token and self.headers.get('X-Control-Token') != server.token:
+                    return self._reply(403, {'ok': False, 'error': 'bad token'})
+                args = {}
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    try:
+                        args = json.loads(self.rfile.read(length).decode('utf-8')) or {}
+                    except ValueError:
+                        return self._reply(400, {'ok': False, 'error': 'invalid JSON'})
+                reply: 'queue.Queue' = queue.Queue(maxsize=1)
+                server.commands.put((name, args, reply))
+                try:
+                    result = reply.get(timeout=REPLY_TIMEOUT)
+                except queue.Empty:
+                    return self._reply(504, {'ok': False, 'error': 'watcher did not answer'})
+                self._reply(200 if result.get('ok', True) else 400, result)
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='control-api', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        host, port = self._httpd.server_address[:2]
+        print(f"[CONTROL] Listening on http://{host}:{port}")
+
+    def stop(self):
+        self._httpd.shutdown()
+
+    def get_command(self, timeout: Optional[float] = None):
+        """Next `(name, args, reply_queue)` or None after `timeout` seconds."""
+        try:
+            return self.commands.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+def _profile_args(argv) -> dict:
+    args = {'mode': argv[0] if argv else 'cprofile'}
+    if len(argv) > 1:
+        if args['mode'] in ('timers', 'tracemalloc'):
+            args['enable'] = argv[1].lower() in ('on', 'true', '1', 'yes')
+        else:
+            args['seconds'] = float(argv[1])
+    return args
+
+
+def _cli(argv) -> int:
+    commands = {
+        'status': ('GET', '/status', False),
+        'add': ('POST', '/channels/add', True),
+        'remove': ('POST', '/channels/remove', True),
+        'start': ('POST', '/recordings/start', True),
+        'stop': ('POST', '/recordings/stop', True),
+        'pause': ('POST', '/polling/pause', False),
+        'resume': ('POST', '/polling/resume', False),
+        'reload': ('POST', '/config/reload', False),
+        'profile': ('POST', '/profile', False),
+    }
+    port = DEFAULT_PORT
+    if '--port' in argv:
+        i = argv.index('--port')
+        port = int(argv[i + 1])
+        argv = argv[:i] + argv[i + 2:]
+    if not argv or argv[0] not in commands or (commands[argv[0]][2] and len(argv) < 2):
+        print(__doc__)
+        return 2
+    method, path, needs_channel = commands[argv[0]]
+    if argv[0] == 'profile':
+        args = _profile_args(argv[1:])
+    else:
+        args = {'channel_id': argv[1]} if needs_channel else {}
+    body = json.dumps(args).encode('utf-8')
+    req = Request(f'http://127.0.0.1:{port}{path}', data=body if method == 'POST' else None, method=method,
+                  headers={'Content-Type': 'application/json'})
+    try:
+        with urlopen(req, timeout=REPLY_TIMEOUT + 5) as r:
+            print(r.read().decode('utf-8'))
+    except HTTPError as e:
+        print(e.read().decode('utf-8'))
+        return 1
+    except Exception as e:
+        print(f"Control request failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_cli(sys.argv[1:]))
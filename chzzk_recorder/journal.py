@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Durable journal of active recordings built on the `.meta.json` sidecars.
+
+Each sidecar carries the downloader PID and its kernel start time while the
+recording is active. After a watcher restart the sidecars are scanned, live
+downloader processes are reattached and dead ones are closed so the next
+recording can continue into a new part file instead of starting over.
+"""
+
+import os
+import json
+import signal
+import threading
+import datetime as _dt
+from pathlib import Path
+from typing import Dict, List, Optional
+
+META_SUFFIX = '.meta.json'
+
+STATUS_RECORDING = 'recording'
+STATUS_ENDED = 'ended'
+STATUS_INTERRUPTED = 'interrupted'
+
+# Sidecars are updated from the watcher loop and from background workers
+_meta_lock = threading.RLock()
+
+
+def read_meta(meta_path) -> Optional[dict]:
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def write_meta(meta_path, meta: dict) -> None:
+    """Atomically replace the sidecar so a crash never leaves half-written JSON."""
+    meta_path = str(meta_path)
+    head, tail = os.path.split(meta_path)
+    tmp_path = os.path.join(head, f'.{tail}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, meta_path)
+
+
+def update_meta(meta_path, **fields) -> Optional[dict]:
+    """Merge `fields` into an existing sidecar. Returns the new content or None."""
+    with _meta_lock:
+        meta = read_meta(meta_path)
+        if meta is None:
+            return None
+        meta.update(fields)
+        try:
+            write_meta(meta_path, meta)
+        except Exception as e:
+            print(f"[JOURNAL] Failed to update {meta_path}: {e}")
+            return None
+        return meta
+
+
+def punched_bytes(meta: Optional[dict]) -> int:
+    """Leading bytes of the output that were hole-punched after upload.
+
+    They read back as zeros; readers of the local file start after them.
+    """
+    return int(((meta or {}).get('upload') or {}).get('punched', 0))
+
+
+def process_start_time(pid: int) -> Optional[int]:
+    """Start time of `pid` in clock ticks since boot (field 22 of /proc/<pid>/stat).
+
+    Used together with the PID to make sure a reattached process is the one
+    we launched and not an unrelated process that reused the PID.
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            stat = f.read()
+        # comm may contain spaces; fields after the closing paren are fixed
+        fields = stat[stat.rindex(')') + 2:].split()
+        return int(fields[19])
+    except Exception:
+        return None
+
+
+def pid_matches(pid: Optional[int], start_time: Optional[int]) -> bool:
+    if not pid:
+        return False
+    current = process_start_time(pid)
+    if current is None:
+        return False
+    if start_time is None:
+        return True
+    return current == start_time
+
+
+class AttachedProcess:
+    """Minimal `subprocess.Popen` stand-in for a downloader we did not spawn.
+
+    A reattached process is not our child, so there is no exit status to
+    collect; `poll()` only reports whether the same PID is still running.
+    """
+
+    def __init__(self, pid: int, start_time: Optional[int] = None):
+        self.pid = pid
+        self.start_time = start_time
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None and not pid_matches(self.pid, self.start_time):
+            self.returncode = -1
+        return self.returncode
+
+    def kill(self):
+        if self.poll() is None:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self.returncode = -signal.SIGKILL
+
+    def terminate(self):
+        if self.poll() is None:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+def mark_ended(meta_path, status: str = STATUS_ENDED, reason: str = '') -> Optional[dict]:
+    if not meta_path:
+        return None
+    fields = {
+        'status': status,
+        'ended_at': _dt.datetime.now().isoformat(timespec='seconds'),
+    }
+    if reason:
+        fields['end_reason'] = reason
+    return update_meta(meta_path, **fields)
+
+
+def iter_meta_files(base_dirs: List[str]):
+    for base in base_dirs:
+        if not base or not os.path.isdir(base):
+            continue
+        for root, dirs, files in os.walk(base):
+            for fname in files:
+                if fname.endswith(META_SUFFIX):
+                    yield os.path.join(root, fname)
+
+
+def scan_active(base_dirs: List[str]) -> List[dict]:
+    """Return sidecars still marked as recording, newest first.
+
+    Every entry gets a `meta_path` key. Only one entry per channel is kept;
+    older leftovers for the same channel are marked interrupted.
+    """
+    active: Dict[str, dict] = {}
+    for meta_path in iter_meta_files(base_dirs):
+        meta = read_meta(meta_path)
+        if not meta or meta.get('status') != STATUS_RECORDING:
+            continue
+        meta['meta_path'] = meta_path
+        cid = meta.get('channelId') or meta_path
+        prev = active.get(cid)
+        if prev is None or (meta.get('started_at') or '') > (prev.get('started_at') or ''):
+            if prev is not None:
+                mark_ended(prev['meta_path'], STATUS_INTERRUPTED, 'superseded by newer journal entry')
+            active[cid] = meta
+        else:
+            mark_ended(meta_path, STATUS_INTERRUPTED, 'superseded by newer journal entry')
+    return sorted(active.values(), key=lambda m: m.get('started_at') or '', reverse=True)
+
+
+def reattach(meta: dict) -> Optional[AttachedProcess]:
+    """Return a handle to the journaled downloader if it is still running."""
+    pid = meta.get('pid')
+    if pid_matches(pid, meta.get('pid_start_time')):
+        return AttachedProcess(int(pid), meta.get('pid_start_time'))
+    return None
+
+
+def continuation_of(meta: dict, interrupted: bool = True) -> dict:
+    """Describe the next part of an interrupted recording for `start_recording`.
+
+    `interrupted` is False for make-before-break restarts, where the previous
+    part is still running and there is no gap to backfill.
+    """
+    return {
+        'basename': meta.get('basename') or Path(meta.get('output') or 'unknown.ts').stem,
+        'part': int(meta.get('part', 1)) + 1,
+        'videoId': meta.get('videoId'),
+        'meta_path': meta.get('meta_path'),
+        'output': meta.get('output'),
+        'interrupted': interrupted,
+    }
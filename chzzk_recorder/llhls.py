@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Low-Latency HLS capture: partial segments with blocking playlist reloads.
+
+Used instead of N_m3u8DL-RE when `llhls_enabled` is set and the chosen
+media playlist advertises `#EXT-X-PART` together with
+`CAN-BLOCK-RELOAD=YES`. Rather than polling the playlist every target
+duration and downloading whole segments, the playlist is requested with
+`_HLS_msn`/`_HLS_part` for the next partial segment; the server answers as
+soon as that part exists and the part is appended right away. Data reaches
+disk a part (typically 0.3-1 s) after it was produced instead of a segment
+later, a crash loses at most the part in flight, and the progress file
+(`.NAME.llhls.json`, next msn/part and when it advanced) gives the watcher
+a sub-second liveness signal.
+
+MPEG-TS parts are appended through `writer.OutputWriter` (preallocation
+and fsync policy as configured); fMP4 parts (`#EXT-X-MAP`) are remuxed to
+TS by an `ffmpeg -c copy` pipe. Runs detached like the downloader:
+
+    python3 llhls.py URL --out NAME.ts [--header "K: V"]... [--progress .NAME.llhls.json]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import requests
+
+import writer
+
+PROGRESS_SUFFIX = '.llhls.json'
+_ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def progress_path_for(out_path: str) -> str:
+    """Hidden progress file next to `out_path` (skipped by archiving)."""
+    root = os.path.splitext(os.path.basename(out_path))[0]
+    return os.path.join(os.path.dirname(out_path), f".{root}{PROGRESS_SUFFIX}")
+
+
+def read_progress(path: Optional[str]) -> Optional[dict]:
+    if not path:
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _attrs(line: str) -> Dict[str, str]:
+    body = line.split(':', 1)[1] if ':' in line else ''
+    return {k: v.strip('"') for k, v in _ATTR_RE.findall(body)}
+
+
+def _byterange(value: Optional[str]) -> Optional[Tuple[int, Optional[int]]]:
+    if not value:
+        return None
+    length, _, offset = value.partition('@')
+    try:
+        return int(length), (int(offset) if offset else None)
+    except ValueError:
+        return None
+
+
+def is_low_latency(text: str) -> bool:
+    """True for a media playlist that lists parts and supports blocking reloads."""
+    if '#EXT-X-PART:' not in text:
+        return False
+    for line in text.splitlines():
+        if line.startswith('#EXT-X-SERVER-CONTROL:'):
+            return _attrs(line).get('CAN-BLOCK-RELOAD', '').upper() == 'YES'
+    return False
+
+
+def parse_playlist(text: str, playlist_url: str) -> dict:
+    """Parse an LL-HLS media playlist.
+
+    Every segment carries its `parts`; the trailing entry with `url` None is
+    the segment still being produced. Byte-range parts get explicit offsets.
+    """
+    base = playlist_url.rsplit('/', 1)[0] + '/'
+    media_sequence = 0
+    target_duration = None
+    part_target = None
+    init = None
+    ended = False
+    segments: List[dict] = []
+    parts: List[dict] = []
+    duration = None
+    range_end: Dict[str, int] = {}
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            try:
+                media_sequence = int(line.split(':', 1)[1])
+            except ValueError:
+                pass
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            try:
+                target_duration = float(line.split(':', 1)[1])
+            except ValueError:
+                pass
+        elif line.startswith('#EXT-X-PART-INF:'):
+            try:
+                part_target = float(_attrs(line).get('PART-TARGET', ''))
+            except ValueError:
+                pass
+        elif line.startswith('#EXT-X-MAP:'):
+            uri = _attrs(line).get('URI')
+            init = urljoin(base, uri) if uri else None
+        elif line.startswith('#EXT-X-PART:'):
+            a = _attrs(line)
+            if 'URI' not in a:
+                continue
+            url = urljoin(base, a['URI'])
+            br = _byterange(a.get('BYTERANGE'))
+            if br:
+                length, offset = br
+                offset = range_end.get(url, 0) if offset is None else offset
+                range_end[url] = offset + length
+                br = (length, offset)
+            try:
+                dur = float(a.get('DURATION', 0))
+            except ValueError:
+                dur = 0.0
+            parts.append({'url': url, 'duration': dur, 'byterange': br,
+                          'independent': a.get('INDEPENDENT', '').upper() == 'YES'})
+        elif line.startswith('#EXTINF:'):
+            try:
+                duration = float(line.split(':', 1)[1].split(',', 1)[0])
+            except ValueError:
+                duration = None
+        elif line.startswith('#EXT-X-ENDLIST'):
+            ended = True
+        elif not line.startswith('#'):
+            segments.append({'msn': media_sequence + len(segments), 'url': urljoin(base, line),
+                             'duration': duration, 'parts': parts})
+            parts = []
+            duration = None
+    if parts:
+        segments.append({'msn': media_sequence + len(segments), 'url': None, 'duration': None, 'parts': parts})
+    return {
+        'media_sequence': media_sequence,
+        'target_duration': target_duration,
+        'part_target': part_target,
+        'init': init,
+        'segments': segments,
+        'ended': ended,
+    }
+
+
+def blocking_url(playlist_url: str, msn: int, part: int) -> str:
+    sep = '&' if '?' in playlist_url else '?'
+    return f"{playlist_url}{sep}_HLS_msn={msn}&_HLS_part={part}"
+
+
+def start_position(playlist: dict) -> Tuple[int, int]:
+    """Join at the start of the newest segment whose parts are all listed (a keyframe)."""
+    for seg in reversed(playlist['segments']):
+        if seg['parts'] and seg['parts'][0]['independent']:
+            return seg['msn'], 0
+    segs = playlist['segments']
+    if segs:
+        return segs[-1]['msn'], 0
+    return playlist['media_sequence'], 0
+
+
+class _Ffmpeg:
+    """fMP4 parts -> MPEG-TS through `ffmpeg -c copy` reading stdin."""
+
+    def __init__(self, out_path: str):
+        self.proc = subprocess.Popen(
+            ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-fflags', '+genpts',
+             '-i', 'pipe:0', '-c', 'copy', '-f', 'mpegts', '-y', out_path],
+            stdin=subprocess.PIPE)
+
+    def feed(self, data: bytes):
+        self.proc.stdin.write(data)
+        self.proc.stdin.flush()
+
+    def tick(self):
+        pass
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        finally:
+            self.proc.wait(timeout=30)
+
+
+class Capture:
+    def __init__(self, url: str, out_path: str, hdrs: Dict[str, str], progress_path: Optional[str] = None,
+                 stall_seconds: float = 30.0, writer_args: Optional[dict] = None):
+        self.url = url
+        self.out_path = out_path
+        self.hdrs = hdrs
+        self.progress_path = progress_path
+        self.stall_seconds = stall_seconds
+        self.writer_args = writer_args or {}
+        self.http = requests.Session()
+        self.sink = None
+        self.init_url = None
+        self.msn = 0
+        self.part = 0
+        self.progress_at = time.time()
+        self.progress_written = 0.0
+        self.stats = {'parts': 0, 'segments': 0, 'bytes': 0, 'skipped_segments': 0, 'reloads': 0}
+
+    def _get(self, url: str, timeout: float, byterange=None) -> Optional[requests.Response]:
+        hdrs = self.hdrs
+        if byterange:
+            length, offset = byterange
+            hdrs = dict(hdrs, Range=f"bytes={offset}-{offset + length - 1}")
+        try:
+            r = self.http.get(url, headers=hdrs, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"[LLHLS] {url}: {e}", flush=True)
+            return None
+        return r if r.ok else None
+
+    def _open_sink(self, playlist: dict):
+        self.init_url = playlist['init']
+        if self.init_url:
+            self.sink = _Ffmpeg(self.out_path)
+            r = self._get(self.init_url, 10)
+            if r is None:
+                raise RuntimeError(f"init segment {self.init_url} unavailable")
+            self.sink.feed(r.content)
+        else:
+            self.sink = writer.OutputWriter(self.out_path, **self.writer_args)
+
+    def _append(self, data: bytes, whole_segment: bool = False):
+        self.sink.feed(data)
+        if isinstance(self.sink, writer.OutputWriter):
+            # one part is the unit of latency here, not the buffer size
+            self.sink.flush()
+        self.stats['bytes'] += len(data)
+        self.stats['segments' if whole_segment else 'parts'] += 1
+        self.progress_at = time.time()
+
+    def _save_progress(self, force: bool = False):
+        if not self.progress_path or (not force and time.time() - self.progress_written < 0.5):
+            return
+        self.progress_written = time.time()
+        tmp = self.progress_path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'msn': self.msn, 'part': self.part, 'at': self.progress_at, **self.stats}, f)
+            os.replace(tmp, self.progress_path)
+        except OSError:
+            pass
+
+    def _advance(self, playlist: dict) -> bool:
+        """Append everything from (msn, part) that `playlist` already lists; True if anything was."""
+        moved = False
+        segs = playlist['segments']
+        if segs and self.msn < segs[0]['msn']:
+            lost = segs[0]['msn'] - self.msn
+            print(f"[LLHLS] Fell {lost} segment(s) behind the playlist window; skipping ahead.", flush=True)
+            self.stats['skipped_segments'] += lost
+            self.msn, self.part = segs[0]['msn'], 0
+        for seg in segs:
+            if seg['msn'] != self.msn:
+                continue
+            parts = seg['parts']
+            if not parts and seg['url'] and self.part == 0:
+                # parts are only kept for the newest segments; take the whole one
+                r = self._get(seg['url'], 15)
+                if r is None:
+                    return moved
+                self._append(r.content, whole_segment=True)
+                self.msn += 1
+                moved = True
+                continue
+            while self.part < len(parts):
+                p = parts[self.part]
+                r = self._get(p['url'], 10, p['byterange'])
+                if r is None:
+                    # listed but not servable yet; the next reload returns at once
+                    time.sleep(0.2)
+                    return moved
+                self._append(r.content)
+                self.part += 1
+                moved = True
+            if seg['url'] is not None and self.part >= len(parts):
+                if not parts and self.part:
+                    print(f"[LLHLS] Parts of segment {self.msn} left the playlist; its tail is lost.", flush=True)
+                self.msn, self.part = self.msn + 1, 0
+                moved = True
+        return moved
+
+    def run(self) -> int:
+        r = self._get(self.url, 10)
+        if r is None or '#EXTM3U' not in r.text:
+            print(f"[LLHLS] Cannot read {self.url}", flush=True)
+            return 1
+        playlist = parse_playlist(r.text, self.url)
+        can_block = is_low_latency(r.text)
+        self.msn, self.part = start_position(playlist)
+        print(f"[LLHLS] Joining at msn {self.msn} (part target {playlist['part_target']}s, "
+              f"blocking={'yes' if can_block else 'no'}) -> {self.out_path}", flush=True)
+        try:
+            self._open_sink(playlist)
+            while True:
+                self._advance(playlist)
+                self._save_progress()
+                if playlist['ended']:
+                    print("[LLHLS] Playlist ended.", flush=True)
+                    return 0
+                if time.time() - self.progress_at > self.stall_seconds:
+                    print(f"[LLHLS] No new part for {self.stall_seconds:.0f}s; giving up.", flush=True)
+                    return 1
+                if playlist['init'] != self.init_url:
+                    print("[LLHLS] Initialization section changed; restarting the capture.", flush=True)
+                    return 1
+                target = playlist['target_duration'] or 6.0
+                if can_block:
+                    # held by the server until (msn, part) exists
+                    r = self._get(blocking_url(self.url, self.msn, self.part), timeout=3 * target)
+                else:
+                    time.sleep(playlist['part_target'] or target / 2)
+                    r = self._get(self.url, 10)
+                self.stats['reloads'] += 1
+                self.sink.tick()
+                if r is None:
+                    time.sleep(0.5)
+                    continue
+                playlist = parse_playlist(r.text, self.url)
+        except (KeyboardInterrupt, BrokenPipeError):
+            return 0
+        finally:
+            if self.sink is not None:
+                self.sink.close()
+            self._save_progress(force=True)
+
+
+def main(argv) -> int:
+    ap = argparse.ArgumentParser(description='Low-Latency HLS partial segment capture.')
+    ap.add_argument('url')
+    ap.add_argument('--out', required=True)
+    ap.add_argument('--header', action='append', default=[], help='"Name: value", repeatable')
+    ap.add_argument('--progress')
+    ap.add_argument('--stall-seconds', type=float, default=30)
+    ap.add_argument('--extent-mb', type=float, default=0)
+    ap.add_argument('--fsync-seconds', type=float, default=10)
+    ap.add_argument('--fsync-mb', type=float, default=0)
+    args = ap.parse_args(argv)
+    hdrs = {}
+    for h in args.header:
+        k, _, v = h.partition(':')
+        hdrs[k.strip()] = v.strip()
+    cap = Capture(args.url, args.out, hdrs, args.progress or progress_path_for(args.out), args.stall_seconds,
+                  writer_args={'extent_bytes': int(args.extent_mb * 1048576),
+                               'fsync_seconds': args.fsync_seconds,
+                               'fsync_bytes': int(args.fsync_mb * 1048576)})
+    # a plain stop still flushes and trims the output
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    started = time.time()
+    code = cap.run()
+    s = cap.stats
+    print(f"[LLHLS] {args.out}: {s['parts']} parts + {s['segments']} whole segments, {s['bytes']} bytes, "
+          f"{s['reloads']} reloads, {s['skipped_segments']} skipped, {time.time() - started:.0f}s", flush=True)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Opt-in instrumentation for the watcher.
+
+Three independent tools, all writing under the profiling directory
+(`/app/logs/profile` in the container) and all switchable at runtime through
+config.json hot reload, the control API or a signal, so a production
+slowdown can be diagnosed without a redeploy:
+
+- Phase timers: every duty run is a "cycle"; `with phase('poll.api'):`
+  blocks inside it are timed and written together with the GC pauses of
+  the cycle as one JSON line to `timings-YYYYMMDD.jsonl`.
+- tracemalloc: periodic snapshots, the top allocation growth since the
+  previous snapshot goes to `tracemalloc-YYYYMMDD.log`.
+- Captures: `cprofile` (deterministic, every duty thread, merged into one
+  `.pstats`) or `sample` (wall-clock stack sampler over all threads,
+  collapsed `.folded` stacks for flamegraph.pl / speedscope).
+
+    kill -USR1 <watcher pid>   # cProfile capture
+    kill -USR2 <watcher pid>   # sampling capture
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import signal
+import cProfile
+import pstats
+import threading
+import tracemalloc
+import datetime as _dt
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'profile')
+MODES = ('cprofile', 'sample')
+
+
+class _Capture:
+    def __init__(self, mode: str, seconds: float, path: str):
+        self.mode = mode
+        self.seconds = seconds
+        self.path = path
+        self.deadline = time.monotonic() + seconds
+        self.profiles = []
+        self.samples: Counter = Counter()
+
+    @property
+    def active(self) -> bool:
+        return time.monotonic() < self.deadline
+
+
+class Profiler:
+    def __init__(self):
+        self.timers = False
+        self.out_dir = DEFAULT_DIR
+        self.capture_seconds = 30.0
+        self.sample_interval = 0.005
+        self.tracemalloc_top = 15
+        self.tracemalloc_frames = 5
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._capture: Optional[_Capture] = None
+        self._snapshot = None
+        self._summary = {}
+        self._gc_hooked = False
+        # duties that mostly block waiting for work; only cycles that entered a phase are logged
+        self.wait_duties = set()
+
+    # --- configuration ---------------------------------------------------------
+    def configure(self, config: dict):
+        cfg = config or {}
+        self.out_dir = cfg.get('profiling_dir') or DEFAULT_DIR
+        self.capture_seconds = float(cfg.get('profiling_capture_seconds', 30))
+        self.sample_interval = float(cfg.get('profiling_sample_interval_ms', 5)) / 1000.0
+        self.tracemalloc_top = int(cfg.get('profiling_tracemalloc_top', 15))
+        self.tracemalloc_frames = int(cfg.get('profiling_tracemalloc_frames', 5))
+        self.set_timers(bool(cfg.get('profiling_enabled', False)))
+        self.set_tracemalloc(bool(cfg.get('profiling_tracemalloc', False)))
+
+    def set_timers(self, enabled: bool):
+        if enabled and not self._gc_hooked:
+            gc.callbacks.append(self._on_gc)
+            self._gc_hooked = True
+        elif not enabled and self._gc_hooked:
+            gc.callbacks.remove(self._on_gc)
+            self._gc_hooked = False
+        if enabled != self.timers:
+            print(f"[PROFILE] Phase timers {'enabled' if enabled else 'disabled'}.")
+        self.timers = enabled
+
+    def set_tracemalloc(self, enabled: bool):
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+            self._snapshot = None
+            print(f"[PROFILE] tracemalloc started ({self.tracemalloc_frames} frames).")
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._snapshot = None
+            print("[PROFILE] tracemalloc stopped.")
+
+    def install_signals(self):
+        """SIGUSR1 -> cProfile capture, SIGUSR2 -> sampling capture (main thread only)."""
+        try:
+            signal.signal(signal.SIGUSR1, lambda *_: self.start_capture('cprofile'))
+            signal.signal(signal.SIGUSR2, lambda *_: self.start_capture('sample'))
+        except (ValueError, AttributeError, OSError) as e:
+            print(f"[PROFILE] Signal triggers unavailable: {e}")
+
+    def status(self) -> dict:
+        cap = self._capture
+        return {
+            'timers': self.timers,
+            'tracemalloc': tracemalloc.is_tracing(),
+            'capture': {'mode': cap.mode, 'path': cap.path} if cap and cap.active else None,
+            'dir': self.out_dir,
+            'phases': self._summary,
+        }
+
+    # --- phase timers ------------------------------------------------------------
+    def run(self, name: str, fn: Callable[[], None]):
+        """Run one duty cycle under the active instruments (a Scheduler run_hook)."""
+        cap = self._capture
+        prof = cProfile.Profile() if cap is not None and cap.mode == 'cprofile' and cap.active else None
+        if not self.timers and prof is None:
+            return fn()
+        cycle = {'phases': {}, 'gc': 0.0, 'gc_count': 0, 'gc_start': None}
+        self._local.cycle = cycle if self.timers else None
+        started = time.perf_counter()
+        try:
+            if prof is not None:
+                prof.enable()
+            try:
+                return fn()
+            finally:
+                if prof is not None:
+                    prof.disable()
+                    with self._lock:
+                        cap.profiles.append(prof)
+        finally:
+            self._local.cycle = None
+            if self.timers:
+                self._record(name, time.perf_counter() - started, cycle)
+
+    @contextmanager
+    def phase(self, name: str):
+        cycle = getattr(self._local, 'cycle', None)
+        if cycle is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases = cycle['phases']
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - started
+
+    def _on_gc(self, stage: str, info: dict):
+        cycle = getattr(self._local, 'cycle', None)
+        if cycle is None:
+            return
+        if stage == 'start':
+            cycle['gc_start'] = time.perf_counter()
+        elif cycle['gc_start'] is not None:
+            cycle['gc'] += time.perf_counter() - cycle['gc_start']
+            cycle['gc_count'] += 1
+            cycle['gc_start'] = None
+
+    def _record(self, duty: str, total: float, cycle: dict):
+        if duty in self.wait_duties and not cycle['phases']:
+            return
+        line = {
+            'ts': _dt.datetime.now().isoformat(timespec='milliseconds'),
+            'duty': duty,
+            'total_ms': round(total * 1000, 3),
+            'phases_ms': {k: round(v * 1000, 3) for k, v in cycle['phases'].items()},
+            'gc_ms': round(cycle['gc'] * 1000, 3),
+            'gc_collections': cycle['gc_count'],
+        }
+        with self._lock:
+            s = self._summary.setdefault(duty, {'cycles': 0, 'last_ms': 0.0, 'max_ms': 0.0, 'avg_ms': 0.0})
+            s['cycles'] += 1
+            s['last_ms'] = line['total_ms']
+            s['max_ms'] = max(s['max_ms'], line['total_ms'])
+            s['avg_ms'] = round(s['avg_ms'] + (line['total_ms'] - s['avg_ms']) / s['cycles'], 3)
+        self._append(f"timings-{_dt.date.today():%Y%m%d}.jsonl", json.dumps(line, ensure_ascii=False) + "\n")
+
+    # --- tracemalloc -------------------------------------------------------------
+    def memory_snapshot(self):
+        """Log the top allocation growth since the previous snapshot (no-op when off)."""
+        if not tracemalloc.is_tracing():
+            return
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        out = [f"=== {_dt.datetime.now().isoformat(timespec='seconds')} "
+               f"current={current / 1048576:.1f}MiB peak={peak / 1048576:.1f}MiB"]
+        if self._snapshot is None:
+            stats = snap.statistics('lineno')[:self.tracemalloc_top]
+            out += [f"  {s}" for s in stats]
+        else:
+            stats = snap.compare_to(self._snapshot, 'lineno')[:self.tracemalloc_top]
+            out += [f"  {s}" for s in stats if s.size_diff]
+        self._snapshot = snap
+        self._append(f"tracemalloc-{_dt.date.today():%Y%m%d}.log", "\n".join(out) + "\n")
+
+    # --- captures ----------------------------------------------------------------
+    def start_capture(self, mode: str = 'cprofile', seconds: Optional[float] = None) -> dict:
+        if mode not in MODES:
+            raise ValueError(f"unknown capture mode {mode!r}")
+        seconds = float(seconds or self.capture_seconds)
+        with self._lock:
+            if self._capture is not None:
+                return {'ok': False, 'error': f'{self._capture.mode} capture already running'}
+            ext = 'pstats' if mode == 'cprofile' else 'folded'
+            path = os.path.join(self.out_dir, f"{mode}-{_dt.datetime.now():%Y%m%d_%H%M%S}.{ext}")
+            cap = self._capture = _Capture(mode, seconds, path)
+        target = self._sample if mode == 'sample' else self._wait_and_dump
+        threading.Thread(target=target, args=(cap,), name=f'profile-{mode}', daemon=True).start()
+        print(f"[PROFILE] {mode} capture for {seconds:g}s -> {path}")
+        return {'ok': True, 'mode': mode, 'seconds': seconds, 'path': path}
+
+    def _wait_and_dump(self, cap: _Capture):
+        time.sleep(cap.seconds)
+        with self._lock:
+            profiles = list(cap.profiles)
+            self._capture = None
+        try:
+            if not profiles:
+                print("[PROFILE] cProfile capture saw no duty runs; nothing written.")
+                return
+            os.makedirs(self.out_dir, exist_ok=True)
+            stats = pstats.Stats(profiles[0])
+            for prof in profiles[1:]:
+                stats.add(prof)
+            stats.dump_stats(cap.path)
+            print(f"[PROFILE] cProfile capture written: {cap.path} ({len(profiles)} duty runs)")
+        except Exception as e:
+            print(f"[PROFILE] Failed to write cProfile capture: {e}")
+
+    def _sample(self, cap: _Capture):
+        me = threading.get_ident()
+        try:
+            while cap.active:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                        frame = frame.f_back
+                    stack.append(names.get(ident, str(ident)))
+                    cap.samples[';'.join(reversed(stack))] += 1
+                time.sleep(self.sample_interval)
+            os.makedirs(self.out_dir, exist_ok=True)
+            with open(cap.path, 'w', encoding='utf-8') as f:
+                for stack, count in cap.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            print(f"[PROFILE] Sampling capture written: {cap.path} ({sum(cap.samples.values())} samples)")
+        except Exception as e:
+            print(f"[PROFILE] Failed to write sampling capture: {e}")
+        finally:
+            with self._lock:
+                self._capture = None
+
+    def _append(self, name: str, text: str):
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            with open(os.path.join(self.out_dir, name), 'a', encoding='utf-8') as f:
+                f.write(text)
+        except Exception as e:
+            print(f"[PROFILE] Failed to write {name}: {e}")
+
+
+profiler = Profiler()
+phase = profiler.phase
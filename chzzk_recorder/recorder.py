@@ -3,15 +3,25 @@
 
 import os
 import re
+import sys
 import json
 import time
+import threading
+import collections
 import datetime as _dt
+import shutil
 import subprocess
 from pathlib import Path
 from typing import Dict, Optional
-from urllib.parse import urljoin
 
-import requests
+import backfill
+import journal
+import llhls
+import uploader
+import variants
+import writer
+from thumbnails import THUMBS_SUFFIX
+from profiling import phase
 
 UA = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -20,6 +30,11 @@ UA = (
 )
 CHZZK_ORIGIN = "https://chzzk.naver.com"
 
+# session file path -> (mtime, headers)
+_session_header_cache: Dict[str, tuple] = {}
+# Detection -> first byte on disk of recent starts (seconds), newest last
+start_latencies = collections.deque(maxlen=200)
+
 
 def _sanitize_name(name: str) -> str:
     if not name:
@@ -47,46 +62,239 @@ def _headers(cookie_str: str, device_id: str) -> Dict[str, str]:
     }
 
 
-def _select_best_variant(master_url: str, hdrs: Dict[str, str]) -> str:
+def channel_options(config: Optional[dict], channel_id: Optional[str]) -> dict:
+    """Per-channel settings: global defaults overridden by `CHANNEL_OPTIONS[channel_id]`."""
+    cfg = config or {}
+    opts = {
+        'min_height': cfg.get('min_height'),
+        'max_height': cfg.get('max_height'),
+        'priority': 1,
+        'storage_path': None,
+    }
+    per_channel = (cfg.get('CHANNEL_OPTIONS') or {}).get(channel_id or '') or {}
+    opts.update({k: v for k, v in per_channel.items() if v is not None})
+    return opts
+
+
+def session_headers(config: Optional[dict], session_path: Optional[str] = None) -> Dict[str, str]:
+    """Playback headers for `session_path` (a pool account) or the configured primary session.
+
+    Parsed once per session-file version (path + mtime), so starts and ABR
+    checks do not re-read the file.
+    """
+    session_path = session_path or (config or {}).get('session_path', '/app/config/session.json')
+    mtime = os.path.getmtime(session_path)
+    cached = _session_header_cache.get(session_path)
+    if cached is None or cached[0] != mtime:
+        with open(session_path, 'r', encoding='utf-8') as f:
+            st = json.load(f)
+        cookies = {c['name']: c['value'] for c in st.get('cookies', [])}
+        cookie_str = "; ".join([f"{k}={v}" for k, v in cookies.items()])
+        device_id = cookies.get('ba.uuid', '4438f666-fa96-4d28-9cc8-39c460399cc8')
+        cached = _session_header_cache[session_path] = (mtime, _headers(cookie_str, device_id))
+    return dict(cached[1])
+
+
+def _select_best_variant(master_url: str, hdrs: Dict[str, str], opts: Optional[dict] = None,
+                         config: Optional[dict] = None):
+    """Pick the variant to record: `(url, variant, variants)`.
+
+    With `abr_enabled` the top allowed variant is probed and the choice is
+    capped by the measured throughput; otherwise the best allowed variant wins.
+    `fast_start_enabled` skips the probe while a shared measurement is fresh
+    (younger than `abr_upgrade_interval_seconds`); without one it still probes.
+    """
+    opts = opts or {}
+    cfg = config or {}
+    probe = bool(cfg.get('abr_enabled', True))
+    throughput = None
+    if probe and bool(cfg.get('fast_start_enabled', True)):
+        # no segment download on the start path when a recent measurement can
+        # cap the choice; the live ABR check corrects it later
+        throughput = variants.recent_throughput(float(cfg.get('abr_upgrade_interval_seconds', 300)))
+        probe = throughput is None
+    chosen, all_variants = variants.select_variant(
+        master_url, hdrs,
+        min_height=opts.get('min_height'),
+        max_height=opts.get('max_height'),
+        probe=probe,
+        headroom=float(cfg.get('abr_headroom', 1.2)),
+        throughput=throughput,
+    )
+    if not chosen:
+        return master_url, None, []
+    return chosen['url'], chosen, all_variants
+
+
+def _select_llhls(live_details: dict, hdrs: Dict[str, str], opts: dict, config: Optional[dict]):
+    """`(url, variant, variants)` of the LL-HLS rendition to capture, or None.
+
+    Only with `llhls_enabled`, and only if the chosen media playlist really
+    lists parts and supports blocking reloads.
+    """
+    ll_master = (live_details or {}).get('llhls_url')
+    if not ll_master or not bool((config or {}).get('llhls_enabled', False)):
+        return None
+    url, variant, all_variants = _select_best_variant(ll_master, hdrs, opts, config)
     try:
-        r = requests.get(master_url, headers=hdrs, timeout=8)
-        if not r.ok:
-            return master_url
-        text = r.text
-        if '#EXT-X-STREAM-INF' not in text:
-            return master_url
-        base = master_url.rsplit('/', 1)[0] + '/'
-        lines = text.splitlines()
-        best = None
-        best_score = (-1, 0.0, -1)  # (height, fps, bandwidth)
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            if line.startswith('#EXT-X-STREAM-INF'):
-                m_res = re.search(r'RESOLUTION=\s*(\d+)x(\d+)', line)
-                h = int(m_res.group(2)) if m_res else -1
-                m_bw = re.search(r'BANDWIDTH=\s*(\d+)', line)
-                bw = int(m_bw.group(1)) if m_bw else -1
-                m_fps = re.search(r'FRAME-RATE=\s*([0-9.]+)', line)
-                fps = float(m_fps.group(1)) if m_fps else 0.0
-                j = i + 1
-                while j < len(lines) and lines[j].strip().startswith('#'):
-                    j += 1
-                if j < len(lines):
-                    uri = lines[j].strip()
-                    cand = urljoin(base, uri)
-                    score = (h, fps, bw)
-                    if score > best_score:
-                        best_score = score
-                        best = cand
-                i = j
-            i += 1
-        return best or master_url
-    except Exception:
-        return master_url
-
-
-def start_recording(live_details: dict, config: Optional[dict] = None):
+        r = variants.http.get(url, headers=hdrs, timeout=5)
+    except Exception as e:
+        print(f"[LLHLS] Cannot read {url}: {e}")
+        return None
+    if not r.ok or not llhls.is_low_latency(r.text):
+        return None
+    return url, variant, all_variants
+
+
+def _protected_basenames(streamer_dir: Path, continuation: Optional[dict], config: Optional[dict] = None) -> set:
+    """Basenames that the previous-files policy must leave alone.
+
+    Files of recordings the journal still marks as active, and earlier parts
+    of the broadcast being continued, belong to the current session. With
+    uploads on, files not uploaded yet stay until the uploader is done with
+    them, including ones whose upload has not started (a short recording
+    gets its `upload` state only at the next upload tick).
+    """
+    names = set()
+    if continuation and continuation.get('basename'):
+        names.add(continuation['basename'])
+    for meta_path in streamer_dir.glob(f"*{journal.META_SUFFIX}"):
+        meta = journal.read_meta(meta_path)
+        if meta and meta.get('status') == journal.STATUS_RECORDING:
+            names.add(meta.get('basename') or meta_path.name[:-len(journal.META_SUFFIX)])
+        elif meta and uploader.needs_local_file(meta, config):
+            # the uploader still reads this file (resume_pending only scans storage dirs)
+            names.add(meta_path.name[:-len(journal.META_SUFFIX)])
+    return names
+
+
+def _prepare_writer_fifo(streamer_dir: Path, basename: str, config: Optional[dict]) -> Optional[Path]:
+    """FIFO the downloader writes into when `output_writer_enabled` (None = write directly)."""
+    if not bool((config or {}).get('output_writer_enabled', False)):
+        return None
+    fifo = streamer_dir / f"{writer.pipe_name_for(basename)}.ts"
+    try:
+        if fifo.exists() or fifo.is_symlink():
+            fifo.unlink()
+        os.mkfifo(fifo)
+        return fifo
+    except OSError as e:
+        print(f"[WRITER] Cannot create {fifo} ({e}); the downloader writes {basename}.ts directly.")
+        return None
+
+
+def _spawn_writer(fifo: Path, out_path: Path, owner_pid: int, log, config: Optional[dict]):
+    cfg = config or {}
+    cmd = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'writer.py'),
+        '--fifo', str(fifo), '--out', str(out_path), '--owner-pid', str(owner_pid),
+        '--extent-mb', str(cfg.get('output_extent_mb', 256)),
+        '--buffer-mb', str(cfg.get('output_buffer_mb', 8)),
+        '--flush-ms', str(cfg.get('output_flush_ms', 1000)),
+        '--fsync-seconds', str(cfg.get('output_fsync_seconds', 10)),
+        '--fsync-mb', str(cfg.get('output_fsync_mb', 0)),
+    ]
+    return subprocess.Popen(cmd, stdout=log, stderr=log, start_new_session=True)
+
+
+def _track_first_byte(out_path: Path, meta_path: Path, detected_at: Optional[float], spawned_at: float,
+                      channel_name: str, timeout: float = 120.0):
+    """Record detection -> first byte on disk of a new start (sidecar `start_latency`, `start_latencies`)."""
+    def wait():
+        while time.time() - spawned_at < timeout:
+            try:
+                if os.path.getsize(out_path) > 0:
+                    break
+            except OSError:
+                pass
+            time.sleep(0.05)
+        else:
+            print(f"[START] {channel_name}: no data within {timeout:.0f}s of starting the downloader.")
+            return
+        now = time.time()
+        latency = {
+            'first_byte_at': _dt.datetime.fromtimestamp(now).isoformat(timespec='milliseconds'),
+            'spawn_to_first_byte': round(now - spawned_at, 3),
+        }
+        if detected_at:
+            latency['detect_to_spawn'] = round(spawned_at - detected_at, 3)
+            latency['detect_to_first_byte'] = round(now - detected_at, 3)
+            start_latencies.append(now - detected_at)
+        journal.update_meta(meta_path, start_latency=latency)
+        print(f"[START] {channel_name}: first byte {latency.get('detect_to_first_byte', '?')}s after detection "
+              f"(downloader +{latency['spawn_to_first_byte']}s)")
+
+    threading.Thread(target=wait, name=f'first-byte-{channel_name}', daemon=True).start()
+
+
+def _previous_files(streamer_dir: Path, continuation: Optional[dict], config: Optional[dict]) -> list:
+    """Earlier recordings in `streamer_dir` that `on_start_previous` archives or deletes."""
+    if (config or {}).get('on_start_previous', 'archive') not in ('archive', 'delete'):
+        return []
+    try:
+        protected = _protected_basenames(streamer_dir, continuation, config)
+        return [
+            p for p in streamer_dir.glob('*')
+            if (p.is_file() or (p.is_dir() and p.name.endswith(THUMBS_SUFFIX)))
+            and not p.name.startswith('.')
+            and not any(p.name.startswith(b) for b in protected)
+        ]
+    except Exception as e:
+        print(f"[WARN] Failed to list previous files: {e}")
+        return []
+
+
+def _handle_previous_files(streamer_dir: Path, channel_name: str, continuation: Optional[dict], config: Optional[dict],
+                           old_files: Optional[list] = None):
+    """Archive or delete earlier recordings in `streamer_dir` per `on_start_previous`.
+
+    `old_files` is a listing taken earlier (see `_previous_files`), so the
+    moves can run after the new downloader has started.
+    """
+    on_start_previous = (config or {}).get('on_start_previous', 'archive')
+    archive_dir_cfg = (config or {}).get('archive_dir', '/app/recordings_archive')
+    archive_dir = Path(archive_dir_cfg) / channel_name / _now_ts()
+    try:
+        if on_start_previous in ('archive', 'delete'):
+            if old_files is None:
+                old_files = _previous_files(streamer_dir, continuation, config)
+            if old_files:
+                if on_start_previous == 'archive':
+                    archive_dir.mkdir(parents=True, exist_ok=True)
+                    for p in old_files:
+                        try:
+                            p.replace(archive_dir / p.name)
+                        except Exception:
+                            pass
+                    print(f"[ARCHIVE] Moved {len(old_files)} file(s) to {archive_dir}")
+                else:
+                    for p in old_files:
+                        try:
+                            if p.is_dir():
+                                shutil.rmtree(p, ignore_errors=True)
+                            else:
+                                p.unlink(missing_ok=True)
+                        except Exception:
+                            pass
+                    print(f"[CLEAN] Deleted {len(old_files)} previous file(s) in {streamer_dir}")
+    except Exception as e:
+        print(f"[WARN] Failed to prepare previous files: {e}")
+
+
+def start_recording(live_details: dict, config: Optional[dict] = None, continuation: Optional[dict] = None,
+                    quality: Optional[dict] = None, threads: Optional[int] = None):
+    """Launch the downloader for a live stream.
+
+    `continuation` (see `journal.continuation_of`) resumes an interrupted
+    recording of the same broadcast into the next `_partN` file. `quality`
+    overrides the channel's `min_height`/`max_height` (used for live variant
+    switches). `threads` is this recording's share of the global download
+    thread budget; without it `n_m3u8dlre_threads` is used. For an
+    interrupted continuation the segments still in the playlist window are
+    backfilled (see backfill.py); the returned `backfill` is that worker.
+    With `llhls_enabled` an LL-HLS rendition is captured part by part by
+    llhls.py instead (`capture` is 'llhls', progress in `progress_path`).
+    """
     try:
         m3u8_url = (live_details or {}).get('m3u8_url')
         channel_name = _sanitize_name((live_details or {}).get('channelName', 'unknown_channel'))
@@ -95,7 +303,9 @@ def start_recording(live_details: dict, config: Optional[dict] = None):
             print(f"[ERROR] m3u8_url not found for {channel_name}.")
             return None
 
-        base_dir = Path('/app/recordings')
+        # per-channel storage_path puts a channel's recordings on its own volume
+        base_dir = Path(channel_options(config, (live_details or {}).get('channelId')).get('storage_path')
+                        or '/app/recordings')
         streamer_dir = base_dir / channel_name
         streamer_dir.mkdir(parents=True, exist_ok=True)
 
@@ -103,33 +313,23 @@ def start_recording(live_details: dict, config: Optional[dict] = None):
         log_dir = Path('/app/logs') / day_dir
         log_dir.mkdir(parents=True, exist_ok=True)
 
-        basename = f"{_now_ts()}_{live_title}"
-
-        # Previous files policy
-        on_start_previous = (config or {}).get('on_start_previous', 'archive')
-        archive_dir_cfg = (config or {}).get('archive_dir', '/app/recordings_archive')
-        archive_dir = Path(archive_dir_cfg) / channel_name / _now_ts()
-        try:
-            if on_start_previous in ('archive', 'delete'):
-                old_files = [p for p in streamer_dir.glob('*') if p.is_file() and not p.name.startswith('.')]
-                if old_files:
-                    if on_start_previous == 'archive':
-                        archive_dir.mkdir(parents=True, exist_ok=True)
-                        for p in old_files:
-                            try:
-                                p.replace(archive_dir / p.name)
-                            except Exception:
-                                pass
-                        print(f"[ARCHIVE] Moved {len(old_files)} file(s) to {archive_dir}")
-                    else:
-                        for p in old_files:
-                            try:
-                                p.unlink(missing_ok=True)
-                            except Exception:
-                                pass
-                        print(f"[CLEAN] Deleted {len(old_files)} previous file(s) in {streamer_dir}")
-        except Exception as e:
-            print(f"[WARN] Failed to prepare previous files: {e}")
+        if continuation:
+            root_basename = continuation['basename']
+            part = int(continuation.get('part', 2))
+            basename = f"{root_basename}_part{part}"
+        else:
+            root_basename = f"{_now_ts()}_{live_title}"
+            part = 1
+            basename = root_basename
+
+        # Previous files policy. With fast start only the listing happens here;
+        # the moves (possibly a copy to another volume) run once the downloader is up.
+        fast = bool((config or {}).get('fast_start_enabled', True))
+        with phase('start.archive'):
+            if fast:
+                old_files = _previous_files(streamer_dir, continuation, config)
+            else:
+                _handle_previous_files(streamer_dir, channel_name, continuation, config)
 
         # Output path (TS)
         out_path = streamer_dir / f"{basename}.ts"
@@ -138,14 +338,20 @@ def start_recording(live_details: dict, config: Optional[dict] = None):
 
         # N_m3u8DL-RE 병렬 다운로더 (우선 사용)
         if bool((config or {}).get('use_n_m3u8dlre', False)):
-            session_path = (config or {}).get('session_path', '/app/config/session.json')
-            with open(session_path, 'r', encoding='utf-8') as f:
-                st = json.load(f)
-            cookies = {c['name']: c['value'] for c in st.get('cookies', [])}
-            cookie_str = "; ".join([f"{k}={v}" for k, v in cookies.items()])
-            device_id = cookies.get('ba.uuid', '4438f666-fa96-4d28-9cc8-39c460399cc8')
-            hdrs = _headers(cookie_str, device_id)
-            sel_url = _select_best_variant(m3u8_url, hdrs)
+            session_path = (live_details or {}).get('session_path')
+            hdrs = session_headers(config, session_path)
+            cookie_str = hdrs['Cookie']
+            opts = channel_options(config, (live_details or {}).get('channelId'))
+            opts.update(quality or {})
+            with phase('start.variant'):
+                ll = _select_llhls(live_details, hdrs, opts, config)
+                if ll:
+                    sel_url, variant, all_variants = ll
+                else:
+                    sel_url, variant, all_variants = _select_best_variant(m3u8_url, hdrs, opts, config)
+            if variant:
+                print(f"[VARIANT] {channel_name}: {variant['height']}p @ {variant['bandwidth']} bps "
+                      f"(throughput={variants.last_throughput_bps and int(variants.last_throughput_bps)})")
 
             headers_cli = []
             for k in ('User-Agent','Origin','Referer','Accept','Accept-Language'):
@@ -154,22 +360,71 @@ def start_recording(live_details: dict, config: Optional[dict] = None):
                     headers_cli += ['--header', f"{k}: {v}"]
             headers_cli += ['--header', f"Cookie: {cookie_str}"]
 
-            threads = int((config or {}).get('n_m3u8dlre_threads', 8))
+            # Interrupted part: plan the gap backfill against the playlist as it is
+            # now, before the new downloader (told to join at the live edge) starts
+            with phase('start.backfill'):
+                gap = backfill.prepare(continuation, sel_url, hdrs, {
+                    'channelId': (live_details or {}).get('channelId'),
+                    'channelName': channel_name,
+                    'videoId': (live_details or {}).get('videoId'),
+                    'liveTitle': live_title,
+                    'm3u8_url': m3u8_url,
+                    'started_at': _dt.datetime.now().isoformat(timespec='seconds'),
+                    'log_dir': str(log_dir),
+                    'session_path': session_path,
+                    'variant': variant,
+                }, config)
+
+            if continuation and continuation.get('interrupted') and continuation.get('output'):
+                # the previous part's LL-HLS position has served the backfill plan
+                Path(llhls.progress_path_for(continuation['output'])).unlink(missing_ok=True)
+
+            threads = int(threads or (config or {}).get('n_m3u8dlre_threads', 8))
             perlog = open(str(log_dir / f"{_now_ts()}_{channel_name}_{live_title}_nmd.log"), 'a', encoding='utf-8')
-            # N_m3u8DL-RE 옵션 정정: 실시간 머지(파이프 TS) 및 병렬 다운로드
-            cmd = [
-                'N_m3u8DL-RE', sel_url,
-                '--live-real-time-merge',    # 실시간 파일 병합
-                '--live-pipe-mux',           # ffmpeg 파이프로 TS 생성
-                '-mt',                       # 오디오/비디오 동시 다운로드 플래그
-                '--thread-count', str(threads),
-                '--save-dir', str(streamer_dir),
-                '--save-name', basename,
-                '--no-ansi-color',           # 로그 제어문자 방지
-            ] + headers_cli
-            print(f"[NMD] Start -> {out_path} (headers redacted)")
-            proc = subprocess.Popen(cmd, stdout=perlog, stderr=perlog)
-            # Write sidecar metadata for later cleanup/reference
+            progress_path = llhls.progress_path_for(str(out_path)) if ll else None
+            if ll:
+                # LL-HLS: 부분 세그먼트 + 블로킹 리로드 캡처 (라이브 엣지에서 시작, 출력 파일에 직접 기록)
+                cfg = config or {}
+                fifo = None
+                cmd = [
+                    sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llhls.py'), sel_url,
+                    '--out', str(out_path),
+                    '--progress', progress_path,
+                    '--stall-seconds', str(cfg.get('llhls_stall_seconds', 10)),
+                    '--extent-mb', str(cfg.get('output_extent_mb', 256) if cfg.get('output_writer_enabled') else 0),
+                    '--fsync-seconds', str(cfg.get('output_fsync_seconds', 10)),
+                    '--fsync-mb', str(cfg.get('output_fsync_mb', 0)),
+                ] + headers_cli
+                print(f"[LLHLS] Start -> {out_path} (headers redacted)")
+            else:
+                # 선할당/write-behind 기록기 사용 시 다운로더는 FIFO로 출력
+                fifo = _prepare_writer_fifo(streamer_dir, basename, config)
+                save_name = writer.pipe_name_for(basename) if fifo else basename
+                # N_m3u8DL-RE 옵션 정정: 실시간 머지(파이프 TS) 및 병렬 다운로드
+                cmd = [
+                    'N_m3u8DL-RE', sel_url,
+                    '--live-real-time-merge',    # 실시간 파일 병합
+                    '--live-pipe-mux',           # ffmpeg 파이프로 TS 생성
+                    '-mt',                       # 오디오/비디오 동시 다운로드 플래그
+                    '--thread-count', str(threads),
+                    '--save-dir', str(streamer_dir),
+                    '--save-name', save_name,
+                    '--no-ansi-color',           # 로그 제어문자 방지
+                ] + headers_cli
+                if gap is not None:
+                    cmd += ['--live-take-count', '1']  # 공백 구간은 backfill이 채움, 라이브 엣지부터 시작
+                print(f"[NMD] Start -> {out_path} (headers redacted)")
+            # 별도 세션으로 실행: watcher가 죽어도 다운로더는 살아남아 재연결(reattach) 가능
+            with phase('start.spawn'):
+                proc = subprocess.Popen(cmd, stdout=perlog, stderr=perlog, start_new_session=True)
+                writer_proc = _spawn_writer(fifo, out_path, proc.pid, perlog, config) if fifo else None
+            spawned_at = time.time()
+            if fast and old_files:
+                threading.Thread(target=_handle_previous_files, name=f'archive-{channel_name}', daemon=True,
+                                 args=(streamer_dir, channel_name, continuation, config, old_files)).start()
+            if gap is not None:
+                gap.start()
+            # Write sidecar metadata (also the crash-safe recording journal)
             try:
                 meta = {
                     'channelId': (live_details or {}).get('channelId'),
@@ -180,11 +435,30 @@ def start_recording(live_details: dict, config: Optional[dict] = None):
                     'started_at': _dt.datetime.now().isoformat(timespec='seconds'),
                     'output': str(out_path),
                     'log_dir': str(log_dir),
+                    'basename': root_basename,
+                    'part': part,
+                    'threads': threads,
+                    'session_path': session_path,
+                    'status': journal.STATUS_RECORDING,
+                    'pid': proc.pid,
+                    'pid_start_time': journal.process_start_time(proc.pid),
                 }
-                with open(meta_path, 'w', encoding='utf-8') as mf:
-                    json.dump(meta, mf, ensure_ascii=False, indent=2)
+                if continuation:
+                    meta['continuation_of'] = continuation.get('meta_path')
+                if gap is not None:
+                    meta['backfill'] = gap.out_path
+                if writer_proc is not None:
+                    meta['writer_pid'] = writer_proc.pid
+                if ll:
+                    meta['capture'] = 'llhls'
+                    meta['llhls_progress'] = progress_path
+                if variant:
+                    meta['variant'] = variant
+                    meta['variants'] = all_variants
+                journal.write_meta(meta_path, meta)
             except Exception as e:
                 print(f"[WARN] Failed to write metadata sidecar: {e}")
+            _track_first_byte(out_path, meta_path, (live_details or {}).get('detected_at'), spawned_at, channel_name)
             return {
                 'process': proc,
                 'output': str(out_path),
@@ -192,6 +466,15 @@ def start_recording(live_details: dict, config: Optional[dict] = None):
                 'title': live_title,
                 'timestamp': _now_ts(),
                 'log_dir': str(log_dir),
+                'meta_path': str(meta_path),
+                'variant': variant,
+                'variants': all_variants,
+                'threads': threads,
+                'session_path': session_path,
+                'backfill': gap,
+                'writer_pid': writer_proc.pid if writer_proc is not None else None,
+                'capture': 'llhls' if ll else 'nmd',
+                'progress_path': progress_path,
             }
 
         # N_m3u8DL-RE가 비활성화된 경우: 현재는 ffmpeg 대체 경로를 제거했으므로 종료
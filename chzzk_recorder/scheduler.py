@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Independent timed duties for the watcher.
+
+Every duty runs in its own thread on its own cadence, so a slow cleanup or
+a hung API call only delays that duty. Overruns are coalesced: if a run
+takes longer than its interval, missed ticks are skipped (and counted)
+instead of piling up. A watchdog on the calling thread reports duties that
+exceed their timeout; Python threads cannot be killed, so a hung duty keeps
+its thread until the call returns while the others carry on.
+"""
+
+import time
+import threading
+import traceback
+from typing import Callable, Dict, Optional, Union
+
+Interval = Union[float, Callable[[], float]]
+
+
+class Duty:
+    def __init__(self, name: str, fn: Callable[[], None], interval: Interval,
+                 timeout: Optional[float] = None, initial_delay: float = 0.0):
+        self.name = name
+        self.fn = fn
+        self._interval = interval
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.running_since: Optional[float] = None
+        self.runs = 0
+        self.overruns = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.last_duration: Optional[float] = None
+        self.max_duration = 0.0
+        self.last_error: Optional[str] = None
+        self._timeout_reported = False
+
+    @property
+    def interval(self) -> float:
+        value = self._interval() if callable(self._interval) else self._interval
+        return max(float(value), 0.0)
+
+    def stats(self) -> dict:
+        return {
+            'interval': self.interval,
+            'timeout': self.timeout,
+            'running_for': round(time.monotonic() - self.running_since, 3) if self.running_since else None,
+            'runs': self.runs,
+            'overruns': self.overruns,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'last_duration': self.last_duration,
+            'max_duration': self.max_duration,
+            'last_error': self.last_error,
+        }
+
+
+class Scheduler:
+    def __init__(self, watchdog_seconds: float = 1.0):
+        self.duties: Dict[str, Duty] = {}
+        self.stop_event = threading.Event()
+        self.watchdog_seconds = watchdog_seconds
+        self._threads = []
+        # Optional hook wrapped around every run: fn(duty_name, callable)
+        self.run_hook: Optional[Callable[[str, Callable[[], None]], None]] = None
+
+    def add(self, name: str, fn: Callable[[], None], interval: Interval,
+            timeout: Optional[float] = None, initial_delay: float = 0.0) -> Duty:
+        duty = Duty(name, fn, interval, timeout, initial_delay)
+        self.duties[name] = duty
+        return duty
+
+    def stats(self) -> dict:
+        return {name: d.stats() for name, d in self.duties.items()}
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run_forever(self):
+        """Start every duty thread and watch them until `stop()`."""
+        for duty in self.duties.values():
+            t = threading.Thread(target=self._duty_loop, args=(duty,), name=f'duty-{duty.name}', daemon=True)
+            t.start()
+            self._threads.append(t)
+        while not self.stop_event.wait(self.watchdog_seconds):
+            self._watchdog()
+
+    # --- internals ----------------------------------------------------------
+    def _duty_loop(self, duty: Duty):
+        next_run = time.monotonic() + duty.initial_delay
+        while not self.stop_event.is_set():
+            delay = next_run - time.monotonic()
+            if delay > 0 and self.stop_event.wait(delay):
+                return
+            started = time.monotonic()
+            duty.running_since = started
+            try:
+                if self.run_hook is not None:
+                    self.run_hook(duty.name, duty.fn)
+                else:
+                    duty.fn()
+            except Exception as e:
+                duty.errors += 1
+                duty.last_error = f"{type(e).__name__}: {e}"
+                print(f"[SCHED] Duty '{duty.name}' failed: {duty.last_error}")
+                traceback.print_exc()
+            finally:
+                ended = time.monotonic()
+                duty.running_since = None
+                duty.runs += 1
+                duty.last_duration = round(ended - started, 3)
+                duty.max_duration = max(duty.max_duration, duty.last_duration)
+                duty._timeout_reported = False
+            interval = duty.interval
+            next_run += interval
+            if next_run < ended:
+                # overran its slot: skip the missed ticks instead of bursting
+                missed = int((ended - next_run) // interval) + 1 if interval > 0 else 0
+                if missed and interval > 0:
+                    duty.overruns += missed
+                    print(f"[SCHED] Duty '{duty.name}' overran ({duty.last_duration}s > {interval}s); skipping {missed} tick(s).")
+                next_run = ended if interval <= 0 else next_run + missed * interval
+
+    def _watchdog(self):
+        now = time.monotonic()
+        for duty in self.duties.values():
+            since = duty.running_since
+            if since and duty.timeout and now - since > duty.timeout and not duty._timeout_reported:
+                duty._timeout_reported = True
+                duty.timeouts += 1
+                print(f"[SCHED] Duty '{duty.name}' exceeded its {duty.timeout}s timeout "
+                      f"(running {int(now - since)}s); other duties continue.")
@@ -108,6 +108,9 @@ def main():
         # 폴링/헬스체크
         "POLLING_INTERVAL_SECONDS": 30,
         "stall_restart_seconds": 180,
+        # 폴링과 별도로 도는 헬스체크/미디어 검사 주기
+        "health_check_interval_seconds": 5,
+        "media_check_interval_seconds": 10,
         # N_m3u8DL-RE 사용/튜닝
         "use_n_m3u8dlre": True,
         "n_m3u8dlre_threads": 8,
@@ -120,7 +123,63 @@ def main():
         "fast_restart_seconds": 30,
         # 일일 정리 스케줄
         "cleanup_enabled": True,
-        "cleanup_hour": 5
+        "cleanup_hour": 5,
+        # 처리량 기반 화질 선택/실시간 전환
+        "abr_enabled": True,
+        "abr_headroom": 1.2,
+        "abr_window_seconds": 60,
+        "abr_downgrade_ratio": 0.5,
+        "abr_upgrade_interval_seconds": 300,
+        "abr_upgrade_headroom": 1.5,
+        # 전체 다운로드 스레드 예산(CPU 코어/회선 용량 기준)을 우선순위대로 분배
+        "dynamic_threads": True,
+        "download_threads_per_core": 4,
+        "min_threads_per_recording": 2,
+        "max_threads_per_recording": 16,
+        "thread_rebalance_restart": False,
+        # TS 무결성 검사(연속성 카운터/PCR 간격) 결과를 .meta.json에 기록
+        "integrity_check_enabled": True,
+        "integrity_check_interval_seconds": 60,
+        # 타임라인 인덱스(.idx): 미디어 시간 -> 바이트 오프셋
+        "timeline_index_enabled": True,
+        # 방송 감지 -> 첫 바이트 단축(시작 시 측정 생략, 아카이브 이동은 시작 후 처리, 병렬 시작)
+        "fast_start_enabled": True,
+        "start_workers": 4,
+        # 재시작 공백 구간을 플레이리스트에 남은 세그먼트로 채움(<이전 파트>_backfill.ts)
+        "backfill_enabled": True,
+        "backfill_workers": 8,
+        # 출력 파일 선할당(fallocate) + write-behind 기록기, fsync 주기(초/MB)
+        "output_writer_enabled": False,
+        "output_extent_mb": 256,
+        "output_fsync_seconds": 10,
+        # LL-HLS(부분 세그먼트 + 블로킹 리로드) 캡처, 진행이 멈춘 것으로 보는 시간(초)
+        "llhls_enabled": False,
+        "llhls_stall_seconds": 10,
+        # 녹화 중 키프레임 썸네일/스프라이트 생성(저우선순위 워커)
+        "thumbnails_enabled": True,
+        "thumbnail_interval_seconds": 60,
+        "thumbnail_workers": 1,
+        # 런타임 제어 API (컨테이너 내부 127.0.0.1)
+        "control_api_enabled": True,
+        "control_api_port": 8765,
+        # 오브젝트 스토리지(S3 호환) 실시간 업로드
+        "upload_enabled": False,
+        "upload_part_size_mb": 16,
+        "upload_max_inflight_mb": 64,
+        # 추가 계정 세션(요청 분산, 실패/제한 시 자동 제외 후 재로그인):
+        # [{"session_path": "/app/config/session_2.json", "CHZZK_ID": "...", "CHZZK_PW": "..."}]
+        "ACCOUNTS": [],
+        "session_refresh_cooldown_seconds": 1800,
+        # 진단용 계측 (logs/profile 에 기록, 재배포 없이 켜고 끌 수 있음)
+        "profiling_enabled": False,
+        "profiling_tracemalloc": False,
+        # 동시 녹화 상한(0=무제한), 부하 시 최저 화질로 낮추는 녹화 수(0=끔)와 기본 높이
+        "max_concurrent_recordings": 0,
+        "admission_downgrade_above": 0,
+        "admission_downgrade_height": 720,
+        # 채널별 화질 범위/우선순위/저장 경로:
+        # {"<channelId>": {"min_height": 720, "max_height": 1080, "priority": 1, "storage_path": "/app/recordings"}}
+        "CHANNEL_OPTIONS": {}
     }
 
     with open(config_path, "w", encoding="utf-8") as f:
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Low-priority keyframe thumbnails and contact-sheet sprites.
+
+While a recording runs, the watcher hands the newest indexed keyframe to a
+small worker pool. A worker feeds ffmpeg just the PAT/PMT plus a slice of
+the output starting at that keyframe, decoding key frames only, under
+`ionice -c3` / `nice`. Thumbnails land in `<basename>.thumbs/` and a sprite
+is rebuilt every few thumbnails and when the recording ends. Both are
+referenced from the sidecar under `thumbnails`, so browsing the archive
+never needs to decode video.
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import journal
+import ts_check
+
+THUMBS_SUFFIX = '.thumbs'
+SLICE_BYTES = 4 * 1024 * 1024
+
+
+def thumbs_dir_for(ts_path: str) -> str:
+    root, _ = os.path.splitext(ts_path)
+    return root + THUMBS_SUFFIX
+
+
+def _low_priority(cmd: list) -> list:
+    prefix = []
+    if shutil.which('ionice'):
+        prefix += ['ionice', '-c3']
+    if shutil.which('nice'):
+        prefix += ['nice', '-n', '19']
+    return prefix + cmd
+
+
+class ThumbnailPool:
+    """Bounded pool; at most one pending job per recording (plus its final job).
+
+    Jobs of one recording run one at a time: each reads, extends and writes
+    back the sidecar's `thumbnails` and numbers the next thumbnail from it.
+    """
+
+    def __init__(self, config: Optional[dict] = None):
+        cfg = config or {}
+        self.enabled = bool(cfg.get('thumbnails_enabled', True)) and shutil.which('ffmpeg') is not None
+        self.interval = float(cfg.get('thumbnail_interval_seconds', 60))
+        self.width = int(cfg.get('thumbnail_width', 320))
+        self.columns = int(cfg.get('thumbnail_sprite_columns', 10))
+        self.sprite_every = int(cfg.get('thumbnail_sprite_every', 10))
+        self._pool = ThreadPoolExecutor(max_workers=int(cfg.get('thumbnail_workers', 1)),
+                                        thread_name_prefix='thumbs')
+        # output path -> outstanding jobs / lock serializing them
+        self._jobs: Dict[str, int] = {}
+        self._path_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def maybe_submit(self, info: dict, final: bool = False):
+        """Queue a thumbnail for the newest keyframe of `info` if one is due."""
+        if not self.enabled or not info.get('output') or not info.get('meta_path'):
+            return
+        key = info['output']
+        keyframe = info.get('last_keyframe')  # (media_seconds, byte_offset)
+        due = keyframe is not None and (
+            info.get('thumb_media') is None or keyframe[0] - info['thumb_media'] >= self.interval)
+        if not due and not final:
+            return
+        with self._lock:
+            # the final sprite job queues behind a running one instead of being dropped
+            if key in self._jobs and not final:
+                return
+            self._jobs[key] = self._jobs.get(key, 0) + 1
+            self._path_locks.setdefault(key, threading.Lock())
+        if due:
+            info['thumb_media'] = keyframe[0]
+        self._pool.submit(self._run, info['output'], info['meta_path'], keyframe if due else None, final)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+    # --- workers ---------------------------------------------------------------
+    def _run(self, ts_path: str, meta_path: str, keyframe, final: bool):
+        with self._lock:
+            path_lock = self._path_locks[ts_path]
+        try:
+            with path_lock:
+                self._run_locked(ts_path, meta_path, keyframe, final)
+        finally:
+            with self._lock:
+                self._jobs[ts_path] -= 1
+                if not self._jobs[ts_path]:
+                    # the last job of this recording
+                    del self._jobs[ts_path]
+                    del self._path_locks[ts_path]
+
+    def _run_locked(self, ts_path: str, meta_path: str, keyframe, final: bool):
+        try:
+            meta = journal.read_meta(meta_path) or {}
+            thumbs = meta.get('thumbnails') or {
+                'dir': os.path.basename(thumbs_dir_for(ts_path)),
+                'interval_seconds': self.interval,
+                'width': self.width,
+                'items': [],
+            }
+            out_dir = thumbs_dir_for(ts_path)
+            os.makedirs(out_dir, exist_ok=True)
+            changed = False
+            if keyframe is not None:
+                name = f"thumb_{len(thumbs['items']) + 1:05d}.jpg"
+                if self._extract(ts_path, meta, keyframe[1], os.path.join(out_dir, name)):
+                    thumbs['items'].append({'t': round(keyframe[0], 3), 'file': name})
+                    changed = True
+            n = len(thumbs['items'])
+            if n and (final or (changed and n % self.sprite_every == 0)):
+                sprite = self._sprite(out_dir, n)
+                if sprite:
+                    thumbs['sprite'] = sprite
+                    thumbs['sprite_columns'] = self.columns
+                    changed = True
+            if changed:
+                thumbs['count'] = n
+                journal.update_meta(meta_path, thumbnails=thumbs)
+        except Exception as e:
+            print(f"[THUMBS] {ts_path}: {e}")
+
+    def _extract(self, ts_path: str, meta: dict, offset: int, out_path: str) -> bool:
+        """Decode the keyframe at `offset` (key frames only) into a JPEG.
+
+        Keyframes in the hole-punched head are skipped: they read back as zeros.
+        """
+        if offset < journal.punched_bytes(meta):
+            return False
+        with open(ts_path, 'rb') as f:
+            f.seek(offset)
+            data = ts_check.psi_packets(ts_path, meta) + f.read(SLICE_BYTES)
+        cmd = _low_priority([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-skip_frame', 'nokey', '-f', 'mpegts', '-i', 'pipe:0',
+            '-frames:v', '1', '-vf', f'scale={self.width}:-2', '-q:v', '5', '-y', out_path,
+        ])
+        r = subprocess.run(cmd, input=data, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=60)
+        return r.returncode == 0 and os.path.exists(out_path)
+
+    def _sprite(self, out_dir: str, count: int) -> Optional[str]:
+        rows = (count + self.columns - 1) // self.columns
+        name = 'sprite.jpg'
+        cmd = _low_priority([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-framerate', '1', '-start_number', '1', '-i', os.path.join(out_dir, 'thumb_%05d.jpg'),
+            '-frames:v', '1', '-vf', f'tile={self.columns}x{rows}', '-q:v', '5', '-y',
+            os.path.join(out_dir, name),
+        ])
+        r = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=300)
+        return name if r.returncode == 0 else None
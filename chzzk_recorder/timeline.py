@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Per-recording timeline index: media time -> byte offset.
+
+Every `.ts` output gets an append-only `.idx` file next to it: fixed-size
+little-endian records, one per indexed keyframe, sorted by media time.
+
+    seq      int64    media sequence of the segment holding the keyframe (-1 unknown)
+    pts      int64    unwrapped 90 kHz PTS of the keyframe
+    media    int64    monotonic media time from the start of the file (90 kHz)
+    offset   int64    byte offset of the TS packet carrying the PES header
+    wall     float64  wall-clock time (epoch seconds) of that moment
+    flags    uint32   START / KEYFRAME / GAP / RESTART (see ts_check.FLAG_*)
+
+`seq` is derived while recording: the newest entry of a scan batch is
+taken to be in the playlist's live-edge segment at scan time, and older
+entries of the batch count back from it by the mean segment duration. It
+is an estimate (the downloader trails the edge by a segment or so), but it
+maps each keyframe to its own segment rather than stamping a whole batch
+with one value. Batch builds have no playlist and leave it at -1.
+
+Lookups memory-map the file and bisect it with `np.searchsorted`, so jumping
+to hour 3 of a 10-hour recording is O(log n). Restarts of the source stream
+show up as RESTART entries; unrecorded stretches as GAP entries.
+
+    python3 timeline.py build FILE.ts        # (re)build an index for a finished file
+    python3 timeline.py seek FILE.ts SECONDS # print the entry at/before SECONDS
+"""
+
+import os
+import sys
+import time
+import datetime as _dt
+from typing import List, Optional
+
+import numpy as np
+
+import journal
+import ts_check
+from ts_check import FLAG_KEYFRAME, FLAG_GAP, FLAG_RESTART, PTS_HZ
+
+INDEX_SUFFIX = '.idx'
+INDEX_FORMAT = 'chzzk-tsidx-v1'
+RECORD = np.dtype([
+    ('seq', '<i8'),
+    ('pts', '<i8'),
+    ('media', '<i8'),
+    ('offset', '<i8'),
+    ('wall', '<f8'),
+    ('flags', '<u4'),
+    ('_pad', '<u4'),
+])
+
+
+def index_path_for(ts_path: str) -> str:
+    root, _ = os.path.splitext(ts_path)
+    return root + INDEX_SUFFIX
+
+
+class TimelineWriter:
+    """Append scanner entries to an `.idx` file.
+
+    Live (`wall_anchor=None`): wall-clock times are back-computed from the
+    moment of the scan. Batch: `wall_anchor + media time`. `media_seq` is
+    the live-edge sequence at the time of the batch's newest entry; with
+    `segment_seconds` older entries count back one sequence per segment.
+    """
+
+    def __init__(self, path: str, truncate: bool = False):
+        self.path = path
+        mode = 'wb' if truncate else 'ab'
+        self._f = open(path, mode)
+        self.count = self._f.tell() // RECORD.itemsize
+        self._last_wall = 0.0
+
+    def append(self, entries: List[tuple], media_seq: int = -1, wall_anchor: Optional[float] = None,
+               segment_seconds: Optional[float] = None) -> int:
+        if not entries:
+            return 0
+        rec = np.zeros(len(entries), dtype=RECORD)
+        arr = np.asarray(entries, dtype=np.int64)
+        rec['seq'] = media_seq
+        if media_seq >= 0 and segment_seconds:
+            behind = (arr[-1, 1] - arr[:, 1]) // int(segment_seconds * PTS_HZ)
+            rec['seq'] = np.maximum(media_seq - behind, 0)
+        rec['pts'] = arr[:, 0]
+        rec['media'] = arr[:, 1]
+        rec['offset'] = arr[:, 2]
+        rec['flags'] = arr[:, 3]
+        if wall_anchor is None:
+            rec['wall'] = time.time() - (arr[-1, 1] - arr[:, 1]) / PTS_HZ
+        else:
+            rec['wall'] = wall_anchor + arr[:, 1] / PTS_HZ
+        # keep the column sorted for searchsorted even if scans jitter
+        rec['wall'] = np.maximum.accumulate(np.maximum(rec['wall'], self._last_wall))
+        return self.write_records(rec)
+
+    def write_records(self, rec: np.ndarray) -> int:
+        if not len(rec):
+            return 0
+        self._last_wall = float(rec['wall'][-1])
+        self._f.write(rec.tobytes())
+        self._f.flush()
+        self.count += len(rec)
+        return len(rec)
+
+    def close(self):
+        try:
+            self._f.close()
+        except Exception:
+            pass
+
+
+class TimelineIndex:
+    """Read-only view of an `.idx` file with O(log n) lookups."""
+
+    def __init__(self, path: str):
+        self.path = path
+        n = os.path.getsize(path) // RECORD.itemsize
+        self.records = np.memmap(path, dtype=RECORD, mode='r', shape=(n,)) if n else np.zeros(0, dtype=RECORD)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def duration(self) -> float:
+        return float(self.records['media'][-1]) / PTS_HZ if len(self) else 0.0
+
+    def _at(self, column: str, value) -> Optional[int]:
+        if not len(self):
+            return None
+        i = int(np.searchsorted(self.records[column], value, side='right')) - 1
+        return max(i, 0)
+
+    def seek(self, seconds: float, keyframe: bool = True) -> Optional[np.void]:
+        """Entry at or before `seconds` of media time (a keyframe when available)."""
+        i = self._at('media', int(seconds * PTS_HZ))
+        if i is None:
+            return None
+        if keyframe:
+            # entries are keyframes unless the stream never flags random access,
+            # so this walk back is short
+            flags = self.records['flags']
+            j = i
+            while j > 0 and not flags[j] & FLAG_KEYFRAME and i - j < 256:
+                j -= 1
+            if flags[j] & FLAG_KEYFRAME:
+                i = j
+        return self.records[i]
+
+    def seek_wall(self, epoch: float) -> Optional[np.void]:
+        """Entry at or before wall-clock time `epoch`."""
+        i = self._at('wall', epoch)
+        return None if i is None else self.records[i]
+
+    def byte_range(self, start_s: float, end_s: float):
+        """Packet-aligned `(start, end)` byte offsets covering `[start_s, end_s]`.
+
+        `end` is None when the range runs to the end of the file.
+        """
+        first = self.seek(start_s)
+        if first is None:
+            return None
+        media = self.records['media']
+        j = int(np.searchsorted(media, int(end_s * PTS_HZ), side='left'))
+        end = int(self.records['offset'][j]) if j < len(self) else None
+        return int(first['offset']), end
+
+    def keyframe_after(self, offset: int) -> Optional[int]:
+        """Byte offset of the first keyframe entry at or after `offset`."""
+        i = int(np.searchsorted(self.records['offset'], offset, side='left'))
+        flags = self.records['flags'][i:]
+        keys = np.flatnonzero(flags & FLAG_KEYFRAME)
+        if len(keys):
+            i += int(keys[0])
+        return int(self.records['offset'][i]) if i < len(self) else None
+
+    def events(self, mask: int = FLAG_GAP | FLAG_RESTART) -> np.ndarray:
+        """Entries carrying any of `mask` (gaps and stream restarts by default)."""
+        return self.records[(self.records['flags'] & mask) != 0]
+
+
+def index_info(scanner: 'ts_check.TsScanner', path: str, count: int) -> dict:
+    """Summary stored in the sidecar under `index`."""
+    return {
+        'path': path,
+        'format': INDEX_FORMAT,
+        'record_size': RECORD.itemsize,
+        'entries': count,
+        'video_pid': scanner.video_pid,
+        'pat_offset': scanner.pat_offset,
+        'pmt_offset': scanner.pmt_offset,
+    }
+
+
+def _started_epoch(meta: dict) -> Optional[float]:
+    try:
+        return _dt.datetime.fromisoformat(meta['started_at']).timestamp()
+    except Exception:
+        return None
+
+
+def open_for_rescan(ts_path: str, scanner: 'ts_check.TsScanner', punched: int = 0) -> TimelineWriter:
+    """Truncate the index for a scan that starts at `punched`.
+
+    Entries of the hole-punched head cannot be rebuilt from the file, so
+    they are kept, and the scanner continues media time from the last one.
+    """
+    path = index_path_for(ts_path)
+    kept = np.zeros(0, dtype=RECORD)
+    if punched and os.path.exists(path):
+        records = TimelineIndex(path).records
+        kept = np.array(records[records['offset'] < punched])
+        del records
+    writer = TimelineWriter(path, truncate=True)
+    writer.write_records(kept)
+    if len(kept):
+        scanner.resume(int(kept['pts'][-1]), int(kept['media'][-1]), int(kept['flags'][-1]))
+    return writer
+
+
+def build(ts_path: str, write_meta: bool = True) -> dict:
+    """Rebuild the index of a finished file in one pass (integrity included).
+
+    A hole-punched head is not rescanned; its entries are kept from the
+    previous index (see `open_for_rescan`).
+    """
+    meta_path = ts_check.meta_path_for(ts_path)
+    meta = journal.read_meta(meta_path) or {}
+    punched = journal.punched_bytes(meta)
+    scanner = ts_check.TsScanner(index=True).skip_to(punched)
+    writer = open_for_rescan(ts_path, scanner, punched)
+    anchor = _started_epoch(meta) or os.path.getmtime(ts_path)
+    try:
+        scanner.scan_path(ts_path, final=True)
+        writer.append(scanner.take_entries(), wall_anchor=anchor)
+    finally:
+        writer.close()
+    info = index_info(scanner, writer.path, writer.count)
+    if write_meta and meta:
+        journal.update_meta(meta_path, index=info, integrity=scanner.report())
+    return info
+
+
+def main(argv: List[str]) -> int:
+    if len(argv) >= 2 and argv[0] == 'build':
+        for path in argv[1:]:
+            info = build(path)
+            print(f"[INDEX] {path}: {info['entries']} entries -> {info['path']}")
+        return 0
+    if len(argv) == 3 and argv[0] == 'seek':
+        idx = TimelineIndex(index_path_for(argv[1]))
+        rec = idx.seek(float(argv[2]))
+        if rec is None:
+            print('empty index')
+            return 1
+        print(f"media={rec['media'] / PTS_HZ:.3f}s offset={int(rec['offset'])} pts={int(rec['pts'])} "
+              f"seq={int(rec['seq'])} wall={_dt.datetime.fromtimestamp(float(rec['wall'])).isoformat(timespec='seconds')} "
+              f"flags={int(rec['flags'])}")
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""Benchmark the watcher's polling path against the replay stand-in.
+
+For every channel count, a child process runs the real `watcher.main_loop`
+against tools/replay_server.py with a stub recorder (no downloads), then
+reports poll cycle time, detection latency (went live -> recording started,
+went offline -> recording stopped) and API request counts.
+
+    python3 tools/bench_watcher.py                      # 10, 100, 1000 channels
+    python3 tools/bench_watcher.py --channels 100 --duration 120 --latency-ms 40 --error-rate 0.01
+"""
+import os, sys, json, time, argparse, tempfile, threading, subprocess, contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import replay_server
+
+def percentiles(values, points=(50, 90, 99)) -> dict:
+    if not values:
+        return {**{f'p{p}': None for p in points}, 'max': None, 'n': 0}
+    vals = sorted(values)
+    out = {f'p{p}': round(vals[min(len(vals) - 1, int(len(vals) * p / 100))], 3) for p in points}
+    out['max'] = round(vals[-1], 3)
+    out['n'] = len(vals)
+    return out
+
+class StubProcess:
+    """Stands in for the downloader Popen; records when the watcher stops it."""
+    _next_pid = 1 << 22
+
+    def __init__(self, on_kill):
+        StubProcess._next_pid += 1
+        self.pid = StubProcess._next_pid
+        self.returncode = None
+        self._on_kill = on_kill
+
+    def poll(self):
+        return self.returncode
+
+    def kill(self):
+        if self.returncode is None:
+            self.returncode = -9
+            self._on_kill()
+
+    terminate = kill
+
+def run_one(args) -> dict:
+    """Child side: run main_loop against a fresh replay server for one channel count."""
+    ids = replay_server.synthetic_ids(args.channels)
+    state = replay_server.ReplayState(ids, args.mean_live, args.mean_offline, args.live_fraction,
+                                      args.latency_ms, args.jitter_ms, args.error_rate, seed=args.seed)
+    httpd = replay_server.make_server(state, port=0)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    scratch = tempfile.mkdtemp(prefix='chzzk-bench-')
+    config_dir = os.path.join(scratch, 'config')
+    os.makedirs(config_dir)
+    with open(os.path.join(config_dir, 'session.json'), 'w', encoding='utf-8') as f:
+        json.dump({'cookies': [{'name': 'NID_AUT', 'value': 'bench'}, {'name': 'NID_SES', 'value': 'bench'}]}, f)
+    config = {
+        'TARGET_CHANNELS': ids,
+        'POLLING_INTERVAL_SECONDS': args.poll_interval,
+        'api_base_url': state.base_url,
+        'use_n_m3u8dlre': True,
+        'control_api_enabled': False,
+        'cleanup_enabled': False,
+        'thumbnails_enabled': False,
+        'integrity_check_enabled': False,
+        'timeline_index_enabled': False,
+        'abr_enabled': False,
+        'dynamic_threads': False,
+    }
+    with open(os.path.join(config_dir, 'config.json'), 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+
+    import watcher
+    started_at = time.time()
+    cycles, detect_start, detect_stop = [], [], []
+
+    def stub_start(details, config=None, continuation=None, quality=None, threads=None):
+        cid = details.get('channelId')
+        ch = state.channels[cid]
+        if ch.live and ch.since > started_at:
+            detect_start.append(time.time() - ch.since)
+
+        def on_kill():
+            state.channel(cid)
+            if not ch.live and ch.since > started_at:
+                detect_stop.append(time.time() - ch.since)
+
+        return {'process': StubProcess(on_kill), 'output': None, 'channel': details.get('channelName'),
+                'title': details.get('liveTitle'), 'meta_path': None, 'threads': threads}
+
+    poll = watcher._duty_poll
+
+    def timed_poll():
+        t0 = time.perf_counter()
+        try:
+            poll()
+        finally:
+            cycles.append(time.perf_counter() - t0)
+
+    watcher.start_recording = stub_start
+    watcher.get_session_cookies = lambda *a, **k: False
+    watcher._duty_poll = timed_poll
+
+    sink = open(os.devnull, 'w') if not args.verbose else sys.stderr
+    with contextlib.redirect_stdout(sink):
+        loop = threading.Thread(target=watcher.main_loop, args=(config_dir, os.path.join(scratch, 'recordings')),
+                                daemon=True)
+        loop.start()
+        time.sleep(args.duration)
+        if watcher.scheduler is not None:
+            watcher.scheduler.stop()
+        loop.join(timeout=5)
+    stats = state.stats()
+    duty = watcher.scheduler.stats().get('poll', {}) if watcher.scheduler else {}
+    httpd.shutdown()
+    total_requests = sum(stats['requests'].values())
+    return {
+        'channels': args.channels,
+        'duration': args.duration,
+        'poll_interval': args.poll_interval,
+        'cycles': len(cycles),
+        'cycle_seconds': percentiles(cycles, (50, 95)),
+        'overruns': duty.get('overruns', 0),
+        'detect_start_seconds': percentiles(detect_start),
+        'detect_stop_seconds': percentiles(detect_stop),
+        'went_live': stats['went_live'],
+        'requests': stats['requests'],
+        'requests_total': total_requests,
+        'requests_per_cycle': round(total_requests / len(cycles), 1) if cycles else None,
+        'errors_injected': sum(stats['errors'].values()),
+        'recording_at_end': len(watcher.currently_recording),
+        'live_at_end': stats['live'],
+    }
+
+def _fmt(p: dict) -> str:
+    if not p.get('n', 1) or p.get('max') is None:
+        return '-'
+    keys = [k for k in p if k.startswith('p')]
+    return '/'.join(f"{p[k]:.2f}" for k in keys) + f" max {p['max']:.2f}"
+
+def main(argv) -> int:
+    ap = argparse.ArgumentParser(description='Scale benchmark for the watcher polling path.')
+    ap.add_argument('--channels', default='10,100,1000', help='comma-separated channel counts')
+    ap.add_argument('--duration', type=float, default=60, help='seconds per run')
+    ap.add_argument('--poll-interval', type=float, default=5)
+    ap.add_argument('--mean-live', type=float, default=120)
+    ap.add_argument('--mean-offline', type=float, default=60)
+    ap.add_argument('--live-fraction', type=float, default=0.3)
+    ap.add_argument('--latency-ms', type=float, default=20)
+    ap.add_argument('--jitter-ms', type=float, default=10)
+    ap.add_argument('--error-rate', type=float, default=0.0)
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--json', help='also write the results to this file')
+    ap.add_argument('--verbose', action='store_true', help='show watcher output (stderr)')
+    ap.add_argument('--one', action='store_true', help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.one:
+        args.channels = int(args.channels)
+        print(json.dumps(run_one(args)))
+        return 0
+
+    results = []
+    for n in [int(x) for x in args.channels.split(',') if x.strip()]:
+        print(f"[BENCH] {n} channel(s) for {args.duration:g}s ...", flush=True)
+        cmd = [sys.executable, os.path.abspath(__file__), '--one', f'--channels={n}'] + _strip_opts(argv)
+        r = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
+        if r.returncode != 0 or not r.stdout.strip():
+            print(f"[BENCH] run with {n} channel(s) failed (exit {r.returncode})")
+            continue
+        results.append(json.loads(r.stdout.strip().splitlines()[-1]))
+
+    print()
+    print(f"{'channels':>8} {'cycles':>6} {'cycle s p50/p95':>22} {'detect live s p50/p90/p99':>30} "
+          f"{'detect end s p50/p90/p99':>30} {'requests':>9} {'req/cycle':>9} {'errors':>6}")
+    for res in results:
+        print(f"{res['channels']:>8} {res['cycles']:>6} {_fmt(res['cycle_seconds']):>22} "
+              f"{_fmt(res['detect_start_seconds']):>30} {_fmt(res['detect_stop_seconds']):>30} "
+              f"{res['requests_total']:>9} {res['requests_per_cycle'] or '-':>9} {res['errors_injected']:>6}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+def _strip_opts(argv) -> list:
+    """Options forwarded to the child run (everything but --channels / --json)."""
+    out, skip = [], False
+    for a in argv:
+        if skip:
+            skip = False
+            continue
+        if a in ('--channels', '--json'):
+            skip = True
+            continue
+        if a.startswith('--channels=') or a.startswith('--json='):
+            continue
+        out.append(a)
+    return out
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Cut clips out of recorded TS files without re-scanning or re-encoding.
+
+Byte ranges come from the recording's timeline index (`.idx`, see
+timeline.py); clips start on a keyframe packet and are copied in-kernel with
+os.sendfile, prefixed with the stream's PAT/PMT so every clip plays on its own.
+
+    python3 tools/clip.py REC.ts START END [-o OUT.ts]
+    python3 tools/clip.py REC.ts --batch ranges.txt [-o OUT_DIR]
+
+Times are seconds or [HH:]MM:SS of media time. A batch file has one
+`START END [NAME]` per line; all clips are cut in one forward pass.
+"""
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import journal
+import ts_check
+import timeline
+
+PACKET = ts_check.PACKET
+
+def parse_time(text: str) -> float:
+    parts = text.strip().split(':')
+    secs = 0.0
+    for p in parts:
+        secs = secs * 60 + float(p)
+    return secs
+
+def _fmt(secs: float) -> str:
+    secs = int(secs)
+    return f"{secs // 3600:02d}{secs % 3600 // 60:02d}{secs % 60:02d}"
+
+def load_index(ts_path: str):
+    """Open the timeline index, building it (one scan) if it is missing."""
+    idx_path = timeline.index_path_for(ts_path)
+    if not os.path.exists(idx_path) or os.path.getsize(idx_path) == 0:
+        print(f"[CLIP] No index for {ts_path}; building it once...")
+        timeline.build(ts_path)
+    return timeline.TimelineIndex(idx_path)
+
+def _copy_range(src_fd: int, dst_fd: int, start: int, end: int):
+    """Copy [start, end) between files in the kernel; fall back to read/write."""
+    offset = start
+    while offset < end:
+        try:
+            sent = os.sendfile(dst_fd, src_fd, offset, min(end - offset, 1 << 30))
+        except OSError:
+            chunk = os.pread(src_fd, min(end - offset, 1 << 24), offset)
+            sent = os.write(dst_fd, chunk) if chunk else 0
+        if sent <= 0:
+            break
+        offset += sent
+
+def extract_clips(ts_path: str, ranges, out_dir: str = None) -> list:
+    """Cut `ranges` ([(start_s, end_s, out_path_or_None), ...]) out of `ts_path`.
+
+    Clips are processed in file order so the source is read front to back
+    once. Bytes hole-punched after upload (`upload_punch_uploaded`) are not
+    copied: a clip starting there begins at the first keyframe after them.
+    Returns the written paths in the order of `ranges`.
+    """
+    index = load_index(ts_path)
+    if not len(index):
+        raise ValueError(f"empty timeline index for {ts_path}")
+    meta = journal.read_meta(ts_check.meta_path_for(ts_path))
+    header = ts_check.psi_packets(ts_path, meta)
+    punched = journal.punched_bytes(meta)
+    size = os.path.getsize(ts_path) // PACKET * PACKET
+    stem = os.path.splitext(os.path.basename(ts_path))[0]
+    out_dir = out_dir or os.path.dirname(os.path.abspath(ts_path))
+
+    jobs = []
+    for i, (start_s, end_s, out_path) in enumerate(ranges):
+        if end_s <= start_s:
+            raise ValueError(f"clip {i}: end {end_s} <= start {start_s}")
+        start, end = index.byte_range(start_s, end_s)
+        end = size if end is None else end
+        if end <= punched:
+            raise ValueError(f"clip {i}: {start_s}-{end_s}s was hole-punched after upload; "
+                             f"cut it from the uploaded object instead")
+        if start < punched:
+            # the punched head reads back as zeros; start at the first keyframe after it
+            start = index.keyframe_after(punched)
+            if start is None or start >= end:
+                raise ValueError(f"clip {i}: no keyframe after the hole-punched head before {end_s}s")
+            print(f"[CLIP] clip {i}: starts in the hole-punched head; cutting from byte {start}")
+        out_path = out_path or os.path.join(out_dir, f"{stem}_clip_{_fmt(start_s)}-{_fmt(end_s)}.ts")
+        jobs.append((start, end, out_path, i))
+
+    written = [None] * len(jobs)
+    src_fd = os.open(ts_path, os.O_RDONLY)
+    try:
+        try:
+            os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except (AttributeError, OSError):
+            pass
+        for start, end, out_path, i in sorted(jobs):
+            dst_fd = os.open(out_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.write(dst_fd, header)
+                _copy_range(src_fd, dst_fd, start, end)
+            finally:
+                os.close(dst_fd)
+            written[i] = out_path
+            print(f"[CLIP] {out_path} ({(end - start) / 1048576:.1f} MiB @ {start})")
+    finally:
+        os.close(src_fd)
+    return written
+
+def _read_batch(path: str):
+    ranges = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split()
+            name = parts[2] if len(parts) > 2 else None
+            ranges.append((parse_time(parts[0]), parse_time(parts[1]), name))
+    return ranges
+
+def main(argv):
+    out = None
+    if '-o' in argv:
+        i = argv.index('-o')
+        out = argv[i + 1]
+        argv = argv[:i] + argv[i + 2:]
+    if len(argv) == 3 and argv[1] == '--batch':
+        ranges = _read_batch(argv[2])
+        if out:
+            os.makedirs(out, exist_ok=True)
+            ranges = [(s, e, os.path.join(out, n if n.endswith('.ts') else n + '.ts') if n else None)
+                      for s, e, n in ranges]
+        extract_clips(argv[0], ranges, out_dir=out)
+        return 0
+    if len(argv) == 3:
+        extract_clips(argv[0], [(parse_time(argv[1]), parse_time(argv[2]), out)])
+        return 0
+    print(__doc__)
+    return 2
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
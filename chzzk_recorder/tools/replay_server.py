@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Local stand-in for api.chzzk.naver.com (live-detail / followings / videos).
+
+Serves synthetic channels, or recorded responses from a fixtures directory,
+with live/offline churn, added latency and injected errors, so the polling
+path can be exercised at scale. Point the watcher at it with
+`"api_base_url": "http://127.0.0.1:8787"` in config.json (or the
+CHZZK_API_BASE_URL environment variable).
+
+    python3 tools/replay_server.py --channels 100 --mean-live 600 --mean-offline 300 \\
+        --latency-ms 40 --jitter-ms 20 --error-rate 0.01
+
+Fixtures (optional, raw API responses saved e.g. with curl):
+
+    DIR/live-detail/<channelId>.json   served while the channel is live
+    DIR/videos/<channelId>.json
+    DIR/followings.json
+
+Channel ids are taken from `live-detail/` when fixtures are given. Counters
+and went-live events are at GET /_replay/stats and /_replay/events.
+
+Session-pool checks: --adult-fraction gates that share of channels behind a
+full login (the stream is only returned to cookies carrying NID_SES);
+--throttle-cookie / --reject-cookie answer 429 / 401 to requests whose
+Cookie header contains the given text.
+"""
+import os, sys, json, time, math, random, hashlib, argparse, threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+PREFIX = '/service/v1/channels/'
+
+def synthetic_ids(n: int, seed: str = 'bench') -> list:
+    return [hashlib.md5(f'{seed}{i}'.encode()).hexdigest() for i in range(n)]
+
+class ChannelState:
+    """Alternating live/offline periods with exponentially distributed lengths."""
+
+    def __init__(self, cid: str, rng: random.Random, mean_live: float, mean_offline: float, live_fraction: float):
+        self.cid = cid
+        self.rng = rng
+        self.mean_live = mean_live
+        self.mean_offline = mean_offline
+        self.live = rng.random() < live_fraction
+        self.since = time.time()
+        self.session = 0
+        self.until = self.since + self._period()
+
+    def _period(self) -> float:
+        mean = self.mean_live if self.live else self.mean_offline
+        return math.inf if mean <= 0 else self.rng.expovariate(1.0 / mean)
+
+    def advance(self, now: float, events: list):
+        while now >= self.until:
+            self.live = not self.live
+            self.since = self.until
+            self.until = self.since + self._period()
+            if self.live:
+                self.session += 1
+                events.append({'channelId': self.cid, 'at': self.since, 'videoId': self.video_id})
+
+    @property
+    def video_id(self) -> str:
+        return f'{self.cid[:8]}-{self.session}'
+
+class ReplayState:
+    def __init__(self, ids, mean_live=0.0, mean_offline=0.0, live_fraction=0.5, latency_ms=0.0,
+                 jitter_ms=0.0, error_rate=0.0, fixtures=None, seed=1, base_url='http://127.0.0.1',
+                 adult_fraction=0.0, throttle_cookie=None, reject_cookie=None):
+        self.rng = random.Random(seed)
+        self.adult = {cid for cid in ids if random.Random(f'adult{seed}{cid}').random() < adult_fraction}
+        self.throttle_cookie = throttle_cookie
+        self.reject_cookie = reject_cookie
+        self.lock = threading.Lock()
+        self.channels = {cid: ChannelState(cid, random.Random(f'{seed}{cid}'), mean_live, mean_offline, live_fraction)
+                         for cid in ids}
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.fixtures = fixtures
+        self.base_url = base_url
+        self.requests = Counter()
+        self.errors = Counter()
+        self.by_session = Counter()
+        self.events = []
+
+    def channel(self, cid: str):
+        ch = self.channels.get(cid)
+        if ch is not None:
+            with self.lock:
+                ch.advance(time.time(), self.events)
+        return ch
+
+    def set_live(self, cid: str, live: bool):
+        """Force a channel state now (benchmarks use this for scripted churn)."""
+        with self.lock:
+            ch = self.channels[cid]
+            if ch.live == live:
+                return
+            ch.live = live
+            ch.since = time.time()
+            ch.until = ch.since + ch._period()
+            if live:
+                ch.session += 1
+                self.events.append({'channelId': cid, 'at': ch.since, 'videoId': ch.video_id})
+
+    def stats(self) -> dict:
+        with self.lock:
+            live = sum(1 for ch in self.channels.values() if ch.live)
+            return {'requests': dict(self.requests), 'errors': dict(self.errors), 'by_session': dict(self.by_session),
+                    'channels': len(self.channels), 'live': live, 'went_live': len(self.events)}
+
+    def _fixture(self, *parts):
+        if not self.fixtures:
+            return None
+        path = os.path.join(self.fixtures, *parts)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    # --- responses -------------------------------------------------------------
+    def live_detail(self, cid: str, full_login: bool = True):
+        ch = self.channel(cid)
+        if ch is None:
+            return 404, {'code': 404, 'message': 'channel not found', 'content': None}
+        adult = cid in self.adult
+        if ch.live and adult and not full_login:
+            content = {'liveTitle': f'replay {cid[:6]} #{ch.session}', 'status': 'OPEN', 'adult': True,
+                       'channel': {'channelId': cid, 'channelName': f'ch_{cid[:6]}'}, 'livePlaybackJson': None}
+            return 200, {'code': 200, 'message': None, 'content': content}
+        if ch.live:
+            recorded = self._fixture('live-detail', f'{cid}.json')
+            if recorded is not None:
+                return 200, recorded
+            playback = {
+                'meta': {'videoId': ch.video_id, 'streamSeq': ch.session, 'liveId': ch.session},
+                'media': [{'mediaId': 'HLS', 'protocol': 'HLS',
+                           'path': f'{self.base_url}/hls/{cid}/{ch.session}/master.m3u8'}],
+            }
+            content = {'liveTitle': f'replay {cid[:6]} #{ch.session}', 'status': 'OPEN', 'adult': adult,
+                       'openDate': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ch.since)),
+                       'channel': {'channelId': cid, 'channelName': f'ch_{cid[:6]}'},
+                       'livePlaybackJson': json.dumps(playback)}
+        else:
+            content = {'liveTitle': None, 'status': 'CLOSE', 'adult': adult,
+                       'channel': {'channelId': cid, 'channelName': f'ch_{cid[:6]}'}, 'livePlaybackJson': None}
+        return 200, {'code': 200, 'message': None, 'content': content}
+
+    def videos(self, cid: str):
+        recorded = self._fixture('videos', f'{cid}.json')
+        if recorded is not None:
+            return 200, recorded
+        ch = self.channel(cid)
+        if ch is None:
+            return 404, {'code': 404, 'message': 'channel not found', 'content': None}
+        # every finished session has a VOD
+        finished = ch.session - (1 if ch.live else 0)
+        data = [{'videoNo': i, 'videoId': f'{cid[:8]}-{i}', 'videoTitle': f'replay #{i}'}
+                for i in range(finished, 0, -1)][:50]
+        return 200, {'code': 200, 'message': None,
+                     'content': {'page': 0, 'size': 50, 'totalCount': len(data), 'data': data}}
+
+    def followings(self):
+        recorded = self._fixture('followings.json')
+        if recorded is not None:
+            return 200, recorded
+        items = []
+        for cid in list(self.channels):
+            ch = self.channel(cid)
+            items.append({'channelId': cid, 'channel': {'channelId': cid, 'channelName': f'ch_{cid[:6]}'},
+                          'streamer': {'openLive': ch.live}, 'liveInfo': {'liveTitle': None}})
+        return 200, {'code': 200, 'message': None,
+                     'content': {'totalCount': len(items), 'totalPage': 1, 'followingList': items}}
+
+    def handle(self, path: str, cookie: str = ''):
+        """`(status, body)` for a request path; applies latency and error injection."""
+        route = 'other'
+        if path.startswith(PREFIX):
+            rest = path[len(PREFIX):].strip('/').split('/')
+            if rest == ['followings']:
+                route = 'followings'
+            elif len(rest) == 2 and rest[1] in ('live-detail', 'videos'):
+                route = rest[1]
+        with self.lock:
+            self.requests[route] += 1
+            self.by_session[cookie.split('NID_AUT=', 1)[-1].split(';', 1)[0] if 'NID_AUT=' in cookie else '-'] += 1
+            fail = self.rng.random() < self.error_rate
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        if delay:
+            time.sleep(delay)
+        if fail:
+            with self.lock:
+                self.errors[route] += 1
+            return 500, {'code': 500, 'message': 'injected error', 'content': None}
+        if self.throttle_cookie and self.throttle_cookie in cookie:
+            return 429, {'code': 429, 'message': 'too many requests', 'content': None}
+        if self.reject_cookie and self.reject_cookie in cookie:
+            return 401, {'code': 401, 'message': 'login required', 'content': None}
+        if route == 'live-detail':
+            return self.live_detail(rest[0], 'NID_SES=' in cookie)
+        if route == 'videos':
+            return self.videos(rest[0])
+        if route == 'followings':
+            return self.followings()
+        return 404, {'code': 404, 'message': 'unknown endpoint', 'content': None}
+
+def make_server(state: ReplayState, host: str = '127.0.0.1', port: int = 8787) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            if path == '/_replay/stats':
+                code, body = 200, state.stats()
+            elif path == '/_replay/events':
+                with state.lock:
+                    code, body = 200, list(state.events)
+            else:
+                code, body = state.handle(path, self.headers.get('Cookie', ''))
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    state.base_url = f'http://{host}:{httpd.server_address[1]}'
+    return httpd
+
+def main(argv) -> int:
+    ap = argparse.ArgumentParser(description='Replay stand-in for the Chzzk API.')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=8787)
+    ap.add_argument('--channels', type=int, default=100, help='number of synthetic channels')
+    ap.add_argument('--fixtures', help='directory of recorded responses (see module doc)')
+    ap.add_argument('--mean-live', type=float, default=600, help='mean live period, seconds (0 = never flips)')
+    ap.add_argument('--mean-offline', type=float, default=600, help='mean offline period, seconds (0 = never flips)')
+    ap.add_argument('--live-fraction', type=float, default=0.3, help='share of channels live at start')
+    ap.add_argument('--latency-ms', type=float, default=0)
+    ap.add_argument('--jitter-ms', type=float, default=0)
+    ap.add_argument('--error-rate', type=float, default=0, help='share of requests answered with HTTP 500')
+    ap.add_argument('--adult-fraction', type=float, default=0, help='share of channels gated behind a full login')
+    ap.add_argument('--throttle-cookie', help='answer 429 when the Cookie header contains this')
+    ap.add_argument('--reject-cookie', help='answer 401 when the Cookie header contains this')
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--print-ids', action='store_true', help='print channel ids (for TARGET_CHANNELS) and exit')
+    args = ap.parse_args(argv)
+
+    if args.fixtures and os.path.isdir(os.path.join(args.fixtures, 'live-detail')):
+        ids = sorted(f[:-5] for f in os.listdir(os.path.join(args.fixtures, 'live-detail')) if f.endswith('.json'))
+    else:
+        ids = synthetic_ids(args.channels)
+    if args.print_ids:
+        print(json.dumps(ids))
+        return 0
+    state = ReplayState(ids, args.mean_live, args.mean_offline, args.live_fraction, args.latency_ms,
+                        args.jitter_ms, args.error_rate, args.fixtures, args.seed,
+                        adult_fraction=args.adult_fraction, throttle_cookie=args.throttle_cookie,
+                        reject_cookie=args.reject_cookie)
+    httpd = make_server(state, args.host, args.port)
+    print(f"[REPLAY] {len(ids)} channel(s) on {state.base_url} "
+          f"(latency {args.latency_ms}±{args.jitter_ms} ms, errors {args.error_rate:.1%})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"[REPLAY] {json.dumps(state.stats())}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""Minimal S3-compatible stand-in for testing uploader.py locally.
+
+Path-style only (`/bucket/key`), objects stored under a directory. Supports
+what the uploader uses: CreateMultipartUpload, UploadPart (Content-MD5
+checked), ListParts, CompleteMultipartUpload, AbortMultipartUpload,
+PutObject, HeadObject and GetObject. With --secret-key the SigV4 signature
+of every request is verified too.
+
+    python3 tools/s3_stub.py --root /tmp/s3 --port 9000 --access-key dev --secret-key devsecret
+    # config.json: "upload_endpoint": "http://127.0.0.1:9000", "upload_bucket": "recordings", ...
+
+--fail-rate makes that share of UploadPart calls fail with 500, to exercise
+retries and resume.
+"""
+import os, sys, uuid, base64, hashlib, argparse, random, threading
+import datetime as _dt
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from uploader import S3Client, multipart_etag
+
+NS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+def _xml(tag: str, fields) -> bytes:
+    body = ''.join(f"<{k}>{v}</{k}>" for k, v in fields)
+    return f'<?xml version="1.0" encoding="UTF-8"?><{tag} xmlns="{NS}">{body}</{tag}>'.encode()
+
+def _error(code: str, message: str) -> bytes:
+    return _xml('Error', [('Code', code), ('Message', message)])
+
+class Store:
+    def __init__(self, root: str, fail_rate: float = 0.0):
+        self.root = root
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.etags = {}
+        self.counts = {}
+        os.makedirs(os.path.join(root, '.uploads'), exist_ok=True)
+
+    def object_path(self, bucket: str, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, bucket, key))
+        if not path.startswith(os.path.abspath(self.root)):
+            raise ValueError('bad key')
+        return path
+
+    def upload_dir(self, upload_id: str) -> str:
+        return os.path.join(self.root, '.uploads', os.path.basename(upload_id))
+
+    def etag_of(self, path: str) -> str:
+        with self.lock:
+            etag = self.etags.get(path)
+        if etag is None:
+            h = hashlib.md5()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            etag = h.hexdigest()
+        return etag
+
+def _verify_signature(handler, secret: str, access: str, path: str, query: str) -> bool:
+    auth = handler.headers.get('Authorization', '')
+    try:
+        fields = dict(p.strip().split('=', 1) for p in auth.split(' ', 1)[1].split(','))
+        credential = fields['Credential'].split('/')
+        signed = fields['SignedHeaders'].split(';')
+    except (IndexError, KeyError, ValueError):
+        return False
+    if credential[0] != access:
+        return False
+    client = S3Client('http://' + handler.headers.get('Host', ''), '', access, secret, region=credential[2])
+    headers = {h: handler.headers.get(h, '') for h in signed if h not in ('host', 'x-amz-date', 'x-amz-content-sha256')}
+    try:
+        stamp = _dt.datetime.strptime(handler.headers.get('x-amz-date', ''), '%Y%m%dT%H%M%SZ')
+    except ValueError:
+        return False
+    client._sign(handler.command, path, query, headers, now=stamp.replace(tzinfo=_dt.timezone.utc))
+    return headers['Authorization'].rsplit('Signature=', 1)[-1] == fields.get('Signature')
+
+def make_server(store: Store, host='127.0.0.1', port=9000, access_key=None, secret_key=None):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, code: int, body: bytes = b'', headers=None):
+            self.send_response(code)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            if self.command != 'HEAD' or 'Content-Length' not in (headers or {}):
+                self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        def _route(self):
+            split = urlsplit(self.path)
+            query = dict(parse_qsl(split.query, keep_blank_values=True))
+            bucket, _, key = unquote(split.path).lstrip('/').partition('/')
+            if secret_key and not _verify_signature(self, secret_key, access_key, split.path, split.query):
+                self._body()
+                return self._send(403, _error('SignatureDoesNotMatch', 'bad signature'))
+            if not bucket or not key:
+                self._body()
+                return self._send(400, _error('InvalidRequest', 'path-style /bucket/key only'))
+            try:
+                return self._handle(bucket, key, query)
+            except FileNotFoundError:
+                return self._send(404, _error('NoSuchKey', key))
+
+        def _handle(self, bucket, key, query):
+            cmd = self.command
+            store.counts[cmd] = store.counts.get(cmd, 0) + 1
+            if cmd == 'POST' and 'uploads' in query:
+                self._body()
+                upload_id = uuid.uuid4().hex
+                os.makedirs(store.upload_dir(upload_id))
+                with open(os.path.join(store.upload_dir(upload_id), 'key'), 'w') as f:
+                    f.write(f"{bucket}/{key}")
+                return self._send(200, _xml('InitiateMultipartUploadResult',
+                                            [('Bucket', bucket), ('Key', key), ('UploadId', upload_id)]))
+            if 'uploadId' in query:
+                updir = store.upload_dir(query['uploadId'])
+                if not os.path.isdir(updir):
+                    self._body()
+                    return self._send(404, _error('NoSuchUpload', query['uploadId']))
+                if cmd == 'PUT':
+                    return self._upload_part(updir, int(query['partNumber']))
+                if cmd == 'GET':
+                    return self._list_parts(updir, int(query.get('part-number-marker') or 0))
+                if cmd == 'POST':
+                    return self._complete(updir, bucket, key)
+                if cmd == 'DELETE':
+                    for name in os.listdir(updir):
+                        os.remove(os.path.join(updir, name))
+                    os.rmdir(updir)
+                    return self._send(204)
+            path = store.object_path(bucket, key)
+            if cmd == 'PUT':
+                data = self._body()
+                if not self._md5_ok(data):
+                    return self._send(400, _error('BadDigest', 'Content-MD5 mismatch'))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                etag = hashlib.md5(data).hexdigest()
+                with store.lock:
+                    store.etags[path] = etag
+                return self._send(200, headers={'ETag': f'"{etag}"'})
+            if cmd in ('GET', 'HEAD'):
+                size = os.path.getsize(path)
+                headers = {'ETag': f'"{store.etag_of(path)}"', 'Content-Length': str(size)}
+                if cmd == 'HEAD':
+                    return self._send(200, headers=headers)
+                with open(path, 'rb') as f:
+                    data = f.read()
+                return self._send(200, data, {'ETag': headers['ETag']})
+            self._body()
+            return self._send(405, _error('MethodNotAllowed', cmd))
+
+        def _md5_ok(self, data: bytes) -> bool:
+            given = self.headers.get('Content-MD5')
+            return not given or base64.b64decode(given) == hashlib.md5(data).digest()
+
+        def _upload_part(self, updir: str, n: int):
+            data = self._body()
+            if store.fail_rate and random.random() < store.fail_rate:
+                return self._send(500, _error('InternalError', 'injected failure'))
+            if not self._md5_ok(data):
+                return self._send(400, _error('BadDigest', 'Content-MD5 mismatch'))
+            with open(os.path.join(updir, f"{n:05d}.part"), 'wb') as f:
+                f.write(data)
+            return self._send(200, headers={'ETag': f'"{hashlib.md5(data).hexdigest()}"'})
+
+        def _parts(self, updir: str):
+            for name in sorted(os.listdir(updir)):
+                if name.endswith('.part'):
+                    yield int(name[:5]), os.path.join(updir, name)
+
+        def _list_parts(self, updir: str, marker: int):
+            items = []
+            for n, path in self._parts(updir):
+                if n <= marker:
+                    continue
+                with open(path, 'rb') as f:
+                    etag = hashlib.md5(f.read()).hexdigest()
+                items.append(('Part', f"<PartNumber>{n}</PartNumber><ETag>\"{etag}\"</ETag>"
+                                      f"<Size>{os.path.getsize(path)}</Size>"))
+            return self._send(200, _xml('ListPartsResult', [('IsTruncated', 'false')] + items))
+
+        def _complete(self, updir: str, bucket: str, key: str):
+            body = self._body()
+            wanted = []
+            for el in ET.fromstring(body).iter():
+                if el.tag.rsplit('}', 1)[-1] == 'Part':
+                    f = {c.tag.rsplit('}', 1)[-1]: c.text for c in el}
+                    wanted.append((int(f['PartNumber']), (f.get('ETag') or '').strip('"')))
+            have = dict(self._parts(updir))
+            path = store.object_path(bucket, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            md5s = []
+            with open(path + '.tmp', 'wb') as out:
+                for n, etag in wanted:
+                    if n not in have:
+                        return self._send(400, _error('InvalidPart', str(n)))
+                    with open(have[n], 'rb') as f:
+                        data = f.read()
+                    if hashlib.md5(data).hexdigest() != etag:
+                        return self._send(400, _error('InvalidPart', f"{n} etag"))
+                    md5s.append(etag)
+                    out.write(data)
+            os.replace(path + '.tmp', path)
+            etag = multipart_etag(md5s)
+            with store.lock:
+                store.etags[path] = etag
+            for name in os.listdir(updir):
+                os.remove(os.path.join(updir, name))
+            os.rmdir(updir)
+            return self._send(200, _xml('CompleteMultipartUploadResult',
+                                        [('Bucket', bucket), ('Key', key), ('ETag', f'"{etag}"')]))
+
+        do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = _route
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    return httpd
+
+def main(argv) -> int:
+    ap = argparse.ArgumentParser(description='Local S3-compatible stand-in.')
+    ap.add_argument('--root', default='/tmp/s3-stub')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=9000)
+    ap.add_argument('--access-key')
+    ap.add_argument('--secret-key', help='verify SigV4 signatures with this secret')
+    ap.add_argument('--fail-rate', type=float, default=0.0)
+    args = ap.parse_args(argv)
+    httpd = make_server(Store(args.root, args.fail_rate), args.host, args.port, args.access_key, args.secret_key)
+    print(f"[S3STUB] Serving {args.root} on http://{args.host}:{httpd.server_address[1]}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""MPEG-TS integrity checker.
+
+Scans recordings as NumPy arrays of 188-byte packets (memory-mapped, in
+chunks) and reports sync loss, per-PID continuity-counter errors and PCR
+gaps with an estimate of the lost duration. With `index=True` it also
+collects timeline entries (keyframe PES starts with their PTS and byte
+offset) for `timeline.py`. The same scanner runs incrementally on a growing
+live output (it resumes at the last full packet) and in batch over the
+archive:
+
+    python3 ts_check.py [--force] [PATH ...]
+
+Results go into the recording's `.meta.json` under `integrity`.
+"""
+
+import os
+import sys
+import mmap
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import journal
+
+PACKET = 188
+SYNC = 0x47
+NULL_PID = 0x1FFF
+PCR_HZ = 27_000_000
+PCR_WRAP = (1 << 33) * 300
+CHUNK_PACKETS = 1 << 16  # ~12 MiB per block
+RESYNC_WINDOW = 1 << 16
+MAX_LISTED = 100
+PSI_SCAN_BYTES = 4 * 1024 * 1024
+PTS_HZ = 90_000
+PTS_WRAP = 1 << 33
+VIDEO_STREAM_TYPES = (0x01, 0x02, 0x1B, 0x24)
+
+# Timeline entry flags (see timeline.py)
+FLAG_START = 0x1
+FLAG_KEYFRAME = 0x2
+FLAG_GAP = 0x4
+FLAG_RESTART = 0x8
+
+
+class TsScanner:
+    """Stateful scanner; call `scan_path` repeatedly on a growing file."""
+
+    def __init__(self, pcr_gap_seconds: float = 1.0, index: bool = False,
+                 index_interval_seconds: float = 1.0):
+        self.pcr_gap_ticks = int(pcr_gap_seconds * PCR_HZ)
+        self.index = index
+        self.pts_gap = int(pcr_gap_seconds * PTS_HZ)
+        self.index_interval = int(index_interval_seconds * PTS_HZ)
+        self.offset = 0
+        self.start_offset = 0
+        self.packets = 0
+        self.sync_losses = 0
+        self.skipped_bytes = 0
+        self.cc_errors: Dict[int, int] = {}
+        self.cc_error_offsets: List[int] = []
+        self.last_cc: Dict[int, int] = {}
+        self.pcr_pid: Optional[int] = None
+        self.first_pcr: Optional[int] = None
+        self.last_pcr: Optional[int] = None
+        self.pcr_interval: Optional[int] = None
+        self.media_ticks = 0
+        self.gaps: List[dict] = []
+        self.gap_count = 0
+        self.lost_ticks = 0
+        self.pcr_discontinuities = 0
+        # PSI / timeline state
+        self.pat_offset: Optional[int] = None
+        self.pmt_pid: Optional[int] = None
+        self.pmt_offset: Optional[int] = None
+        self.video_pid: Optional[int] = None
+        self.entries: List[tuple] = []
+        self._pts_wrap = 0
+        self._last_raw_pts: Optional[int] = None
+        self._seg_pts: Optional[int] = None
+        self._seg_media = 0
+        self._media_high = 0
+        self._last_entry_media: Optional[int] = None
+        self._rai_seen = False
+        self._pending_flags = 0
+
+    # --- public -------------------------------------------------------------
+    def scan_path(self, path: str, final: bool = False, limit: Optional[int] = None) -> 'TsScanner':
+        """Scan `path` from the current offset up to its last full packet.
+
+        With `final` (batch mode / finished recording) trailing bytes that
+        cannot be resynchronised are counted as skipped. `limit` stops the
+        scan at that byte offset.
+        """
+        size = os.path.getsize(path)
+        if limit is not None:
+            size = min(size, limit)
+        if size - self.offset < PACKET:
+            return self
+        mm = np.memmap(path, dtype=np.uint8, mode='r', shape=(size,))
+        try:
+            try:
+                mm._mmap.madvise(mmap.MADV_SEQUENTIAL)
+            except Exception:
+                pass
+            while size - self.offset >= PACKET:
+                n = min(CHUNK_PACKETS, (size - self.offset) // PACKET)
+                consumed = self._process(mm[self.offset:self.offset + n * PACKET], self.offset)
+                self.offset += consumed
+                if consumed == n * PACKET:
+                    continue
+                skip = self._resync(mm, self.offset, size, final)
+                if skip is None:
+                    break
+                self.sync_losses += 1
+                self.skipped_bytes += skip
+                self.offset += skip
+        finally:
+            del mm
+        return self
+
+    def skip_to(self, offset: int) -> 'TsScanner':
+        """Start scanning at the first packet at or after `offset` (before any scan)."""
+        self.offset = self.start_offset = -(-offset // PACKET) * PACKET
+        return self
+
+    def resume(self, pts: int, media: int, flags: int = 0) -> 'TsScanner':
+        """Continue media time from an index entry `(pts, media, flags)` before the scan start."""
+        self._rai_seen = bool(flags & FLAG_KEYFRAME)
+        self._pts_wrap = pts - pts % PTS_WRAP
+        self._last_raw_pts = pts % PTS_WRAP
+        self._seg_pts = pts
+        self._seg_media = self._media_high = media
+        return self
+
+    def take_entries(self) -> List[tuple]:
+        """Timeline entries found since the last call: (pts, media_time, offset, flags)."""
+        out, self.entries = self.entries, []
+        return out
+
+    def report(self) -> dict:
+        return {
+            'bytes_scanned': self.offset,
+            'scanned_from': self.start_offset,
+            'packets': self.packets,
+            'sync_losses': self.sync_losses,
+            'skipped_bytes': self.skipped_bytes,
+            'continuity_errors': {str(pid): n for pid, n in sorted(self.cc_errors.items())},
+            'continuity_error_offsets': self.cc_error_offsets[:MAX_LISTED],
+            'pcr_pid': self.pcr_pid,
+            'duration_seconds': round(self.media_ticks / PCR_HZ, 3),
+            'timestamp_gaps': self.gaps[:MAX_LISTED],
+            'timestamp_gap_count': self.gap_count,
+            'pcr_discontinuities': self.pcr_discontinuities,
+            'lost_seconds': round(self.lost_ticks / PCR_HZ, 3),
+            'ok': not (self.sync_losses or self.cc_errors or self.gap_count),
+        }
+
+    # --- internals ----------------------------------------------------------
+    def _resync(self, mm, offset: int, size: int, final: bool) -> Optional[int]:
+        """Bytes to skip from `offset` to the next run of three sync bytes."""
+        end = min(size, offset + RESYNC_WINDOW + 2 * PACKET)
+        window = np.asarray(mm[offset:end])
+        for c in np.flatnonzero(window == SYNC):
+            c = int(c)
+            if c + 2 * PACKET >= len(window):
+                break
+            if window[c + PACKET] == SYNC and window[c + 2 * PACKET] == SYNC:
+                return c
+        if end - offset >= RESYNC_WINDOW + 2 * PACKET:
+            return RESYNC_WINDOW
+        return (size - offset) if final else None
+
+    def _process(self, block: np.ndarray, base: int) -> int:
+        """Analyse whole packets of `block`; stop at the first lost sync byte."""
+        pk = block.reshape(-1, PACKET)
+        bad = np.flatnonzero(pk[:, 0] != SYNC)
+        if len(bad):
+            pk = pk[:bad[0]]
+        n = len(pk)
+        if n == 0:
+            return 0
+        self.packets += n
+
+        pid = ((pk[:, 1].astype(np.int32) & 0x1F) << 8) | pk[:, 2]
+        afc = (pk[:, 3] >> 4) & 0x3
+        cc = (pk[:, 3] & 0x0F).astype(np.int16)
+        has_af = (afc & 0x2) != 0
+        af_len = np.where(has_af, pk[:, 4], 0)
+        flags = np.where(has_af & (af_len > 0), pk[:, 5], 0)
+        disc = (flags & 0x80) != 0
+
+        has_payload = (afc & 0x1) != 0
+        self._check_continuity(pid, cc, has_payload, disc, base)
+        self._check_pcr(pk, pid, af_len, flags, disc, base)
+        if self.index:
+            if self.video_pid is None:
+                self._find_psi(pk, pid, base)
+            if self.video_pid is not None:
+                self._collect_entries(pk, pid, has_payload, has_af, af_len, flags, base)
+        return n * PACKET
+
+    @staticmethod
+    def _section(packet: np.ndarray) -> Optional[bytes]:
+        """PSI section payload of a packet that starts a section."""
+        if not packet[1] & 0x40:
+            return None
+        afc = (packet[3] >> 4) & 0x3
+        start = 4 + (1 + int(packet[4]) if afc & 0x2 else 0)
+        if start >= PACKET:
+            return None
+        start += 1 + int(packet[start])  # pointer_field
+        return bytes(packet[start:])
+
+    def _find_psi(self, pk: np.ndarray, pid: np.ndarray, base: int):
+        """Locate PAT, PMT and the video elementary PID from the first PSI sections."""
+        if self.pmt_pid is None:
+            for i in np.flatnonzero(pid == 0)[:8]:
+                sec = self._section(pk[i])
+                if not sec or sec[0] != 0x00:
+                    continue
+                length = ((sec[1] & 0x0F) << 8) | sec[2]
+                for j in range(8, min(3 + length - 4, len(sec) - 4), 4):
+                    program = (sec[j] << 8) | sec[j + 1]
+                    if program != 0:
+                        self.pmt_pid = ((sec[j + 2] & 0x1F) << 8) | sec[j + 3]
+                        self.pat_offset = base + int(i) * PACKET
+                        break
+                if self.pmt_pid is not None:
+                    break
+        if self.pmt_pid is None:
+            return
+        for i in np.flatnonzero(pid == self.pmt_pid)[:8]:
+            sec = self._section(pk[i])
+            if not sec or sec[0] != 0x02:
+                continue
+            length = ((sec[1] & 0x0F) << 8) | sec[2]
+            end = min(3 + length - 4, len(sec))
+            j = 12 + (((sec[10] & 0x0F) << 8) | sec[11])
+            while j + 5 <= end:
+                stream_type = sec[j]
+                es_pid = ((sec[j + 1] & 0x1F) << 8) | sec[j + 2]
+                if stream_type in VIDEO_STREAM_TYPES:
+                    self.video_pid = es_pid
+                    self.pmt_offset = base + int(i) * PACKET
+                    return
+                j += 5 + (((sec[j + 3] & 0x0F) << 8) | sec[j + 4])
+            # no video stream: index the PCR PID instead
+            if self.pcr_pid is not None:
+                self.video_pid = self.pcr_pid
+                self.pmt_offset = base + int(i) * PACKET
+            return
+
+    def _collect_entries(self, pk, pid, has_payload, has_af, af_len, flags, base: int):
+        pusi = (pk[:, 1] & 0x40) != 0
+        sel = np.flatnonzero((pid == self.video_pid) & pusi & has_payload)
+        if not len(sel):
+            return
+        start = 4 + np.where(has_af[sel], 1 + af_len[sel].astype(np.int32), 0)
+        ok = start + 14 <= PACKET
+        sel, start = sel[ok], start[ok]
+        if not len(sel):
+            return
+        cols = start[:, None] + np.arange(14)
+        hdr = np.take_along_axis(pk[sel], cols, axis=1).astype(np.int64)
+        has_pts = (hdr[:, 0] == 0) & (hdr[:, 1] == 0) & (hdr[:, 2] == 1) & ((hdr[:, 7] & 0x80) != 0)
+        sel, hdr = sel[has_pts], hdr[has_pts]
+        pts = (((hdr[:, 9] >> 1) & 0x7) << 30) | (hdr[:, 10] << 22) | ((hdr[:, 11] >> 1) << 15) \
+            | (hdr[:, 12] << 7) | (hdr[:, 13] >> 1)
+        rai = (flags[sel] & 0x40) != 0
+        for i in range(len(sel)):
+            self._timeline_step(int(pts[i]), bool(rai[i]), base + int(sel[i]) * PACKET)
+
+    def _timeline_step(self, raw: int, rai: bool, offset: int):
+        """Unwrap one PES PTS and decide whether it becomes an index entry.
+
+        Media time stays monotonic across 33-bit wraps, gaps (kept as time)
+        and stream restarts (PTS jumping backwards), which are flagged.
+        """
+        flags = self._pending_flags
+        if self._last_raw_pts is None:
+            flags |= FLAG_START
+            self._seg_pts = raw
+        else:
+            if raw < self._last_raw_pts - PTS_WRAP // 2:
+                self._pts_wrap += PTS_WRAP
+            elif raw > self._last_raw_pts + PTS_WRAP // 2:
+                self._pts_wrap -= PTS_WRAP
+        self._last_raw_pts = raw
+        pts = raw + self._pts_wrap
+        media = self._seg_media + (pts - self._seg_pts)
+        if media < self._media_high - self.pts_gap:
+            # PTS went backwards beyond B-frame reordering: encoder restarted
+            flags |= FLAG_RESTART
+            self._seg_media = self._media_high + PTS_HZ // 30
+            self._seg_pts = pts
+            media = self._seg_media
+        elif media > self._media_high + self.pts_gap and self._last_entry_media is not None:
+            flags |= FLAG_GAP
+        if rai:
+            self._rai_seen = True
+        due = self._last_entry_media is None or media - self._last_entry_media >= self.index_interval
+        keyframe = rai or not self._rai_seen
+        if (flags or (keyframe and due)) and (self._last_entry_media is None or media > self._last_entry_media):
+            self.entries.append((pts, media, offset, flags | (FLAG_KEYFRAME if rai else 0)))
+            self._last_entry_media = media
+            self._pending_flags = 0
+        else:
+            # carry GAP/RESTART to the next recorded entry
+            self._pending_flags = flags & (FLAG_GAP | FLAG_RESTART)
+        self._media_high = max(self._media_high, media)
+
+    def _check_continuity(self, pid, cc, has_payload, disc, base: int):
+        sel = np.flatnonzero(has_payload & (pid != NULL_PID))
+        if not len(sel):
+            return
+        order = sel[np.argsort(pid[sel], kind='stable')]
+        p, c, d = pid[order], cc[order], disc[order]
+        # previous CC for every packet: the packet before it in the same PID
+        prev = np.empty_like(c)
+        prev[1:] = c[:-1]
+        first = np.ones(len(p), dtype=bool)
+        first[1:] = p[1:] != p[:-1]
+        for i in np.flatnonzero(first):
+            prev[i] = self.last_cc.get(int(p[i]), -1)
+        err = (prev >= 0) & (c != ((prev + 1) & 0x0F)) & (c != prev) & ~d
+        for i in np.flatnonzero(err):
+            key = int(p[i])
+            self.cc_errors[key] = self.cc_errors.get(key, 0) + 1
+            if len(self.cc_error_offsets) < MAX_LISTED:
+                self.cc_error_offsets.append(base + int(order[i]) * PACKET)
+        last = np.ones(len(p), dtype=bool)
+        last[:-1] = p[1:] != p[:-1]
+        for i in np.flatnonzero(last):
+            self.last_cc[int(p[i])] = int(c[i])
+
+    def _check_pcr(self, pk, pid, af_len, flags, disc, base: int):
+        has_pcr = (af_len >= 7) & ((flags & 0x10) != 0)
+        if self.pcr_pid is None:
+            idx = np.flatnonzero(has_pcr)
+            if not len(idx):
+                return
+            self.pcr_pid = int(pid[idx[0]])
+        idx = np.flatnonzero(has_pcr & (pid == self.pcr_pid))
+        if not len(idx):
+            return
+        b = pk[idx, 6:12].astype(np.int64)
+        pcr_base = (b[:, 0] << 25) | (b[:, 1] << 17) | (b[:, 2] << 9) | (b[:, 3] << 1) | (b[:, 4] >> 7)
+        pcr = pcr_base * 300 + (((b[:, 4] & 0x1) << 8) | b[:, 5])
+        if self.first_pcr is None:
+            self.first_pcr = int(pcr[0])
+        prev = np.empty_like(pcr)
+        prev[1:] = pcr[:-1]
+        prev[0] = self.last_pcr if self.last_pcr is not None else pcr[0]
+        diff = (pcr - prev) % PCR_WRAP
+        # jumps of more than half the wrap range are backwards steps
+        backwards = diff > PCR_WRAP // 2
+        signalled = disc[idx]
+        normal = ~backwards & ~signalled & (diff <= self.pcr_gap_ticks)
+        if normal.any():
+            self.media_ticks += int(diff[normal].sum())
+            steps = diff[normal & (diff > 0)]
+            if len(steps):
+                self.pcr_interval = int(np.median(steps))
+        self.pcr_discontinuities += int((backwards | (signalled & (diff > self.pcr_gap_ticks))).sum())
+        gaps = np.flatnonzero(~backwards & ~signalled & (diff > self.pcr_gap_ticks))
+        interval = self.pcr_interval or PCR_HZ // 25
+        for i in gaps:
+            ticks = int(diff[i])
+            lost = max(ticks - interval, 0)
+            self.gap_count += 1
+            self.lost_ticks += lost
+            self.media_ticks += ticks
+            if len(self.gaps) < MAX_LISTED:
+                self.gaps.append({
+                    'offset': base + int(idx[i]) * PACKET,
+                    'seconds': round(ticks / PCR_HZ, 3),
+                })
+        self.last_pcr = int(pcr[-1])
+
+
+def meta_path_for(ts_path: str) -> str:
+    root, _ = os.path.splitext(ts_path)
+    return root + journal.META_SUFFIX
+
+
+def psi_packets(ts_path: str, meta: Optional[dict] = None) -> bytes:
+    """PAT + PMT packets of a recording, for prefixing a slice cut out of it.
+
+    Offsets come from the sidecar's `index`; if they are missing or fall in
+    the hole-punched head, the first PSI after the hole is looked up.
+    """
+    punched = journal.punched_bytes(meta)
+    info = (meta or {}).get('index') or {}
+    offsets = [info.get('pat_offset'), info.get('pmt_offset')]
+    if None in offsets or min(offsets) < punched:
+        scanner = TsScanner(index=True).skip_to(punched)
+        scanner.scan_path(ts_path, limit=scanner.offset + PSI_SCAN_BYTES)
+        offsets = [scanner.pat_offset, scanner.pmt_offset]
+    out = b''
+    with open(ts_path, 'rb') as f:
+        for off in offsets:
+            if off is None:
+                continue
+            f.seek(off)
+            out += f.read(PACKET)
+    return out
+
+
+def write_report(meta_path: str, report: dict) -> None:
+    if meta_path and os.path.exists(meta_path):
+        journal.update_meta(meta_path, integrity=report)
+
+
+def check_file(ts_path: str, write_meta: bool = True) -> dict:
+    """Batch-scan one finished file and store the result in its sidecar.
+
+    Bytes hole-punched after upload are not scanned (`scanned_from`).
+    """
+    meta_path = meta_path_for(ts_path)
+    punched = journal.punched_bytes(journal.read_meta(meta_path))
+    report = TsScanner().skip_to(punched).scan_path(ts_path, final=True).report()
+    if write_meta:
+        write_report(meta_path, report)
+    return report
+
+
+def _iter_ts(paths: List[str]):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                for fname in sorted(files):
+                    if fname.endswith('.ts') and not fname.startswith('.'):
+                        yield os.path.join(root, fname)
+        elif path.endswith('.ts'):
+            yield path
+
+
+def main(argv: List[str]) -> int:
+    force = '--force' in argv
+    paths = [a for a in argv if not a.startswith('--')] or ['/app/recordings', '/app/recordings_archive']
+    bad = 0
+    for ts_path in _iter_ts(paths):
+        meta_path = meta_path_for(ts_path)
+        meta = journal.read_meta(meta_path) or {}
+        if meta.get('status') == journal.STATUS_RECORDING:
+            continue  # live outputs are checked incrementally by the watcher
+        try:
+            size = os.path.getsize(ts_path)
+        except OSError:
+            continue
+        prev = meta.get('integrity') or {}
+        if not force and prev.get('bytes_scanned') and size - prev['bytes_scanned'] < PACKET:
+            continue
+        report = check_file(ts_path)
+        bad += 0 if report['ok'] else 1
+        print(json.dumps({'file': ts_path, **{k: report[k] for k in (
+            'ok', 'sync_losses', 'continuity_errors', 'timestamp_gap_count', 'lost_seconds', 'duration_seconds')}},
+            ensure_ascii=False))
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
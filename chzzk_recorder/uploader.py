@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Stream recordings to S3-compatible object storage while they are recorded.
+
+Every `.ts` output becomes one multipart upload. As soon as a full part is
+on disk it is read once, MD5-summed and uploaded with `Content-MD5`; the
+returned ETag is checked against the local digest. When the recording ends
+the short tail becomes the last part, the upload is completed and the
+object is verified (multipart ETag and size) before the sidecar and the
+timeline index are copied next to it.
+
+Progress lives in the sidecar under `upload`, so a watcher restart resumes
+the same multipart upload (reconciled with ListParts) instead of starting
+over. Memory is bounded: at most `upload_max_inflight_mb` of part data is
+held at once. Optionally, uploaded ranges older than the local buffer are
+hole-punched out of the live file, and finished files are removed once the
+object is verified.
+
+A punched range reads back as zeros. Its end is kept in the sidecar as
+`upload.punched`, and the local readers start after it: the batch ts_check,
+timeline rebuilds, thumbnails and tools/clip.py. Footage in that range
+exists only in the uploaded object.
+
+Requests are signed with AWS SigV4 (path-style), so MinIO or
+tools/s3_stub.py work as well as S3.
+"""
+
+import os
+import hmac
+import base64
+import hashlib
+import threading
+import datetime as _dt
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import quote, urlsplit
+
+import requests
+
+import journal
+import timeline
+from writer import fallocate, FALLOC_FL_KEEP_SIZE, FALLOC_FL_PUNCH_HOLE
+
+UPLOADING = 'uploading'
+COMPLETE = 'complete'
+FAILED = 'failed'
+MIN_PART_SIZE = 5 * 1024 * 1024
+PUNCH_ALIGN = 1024 * 1024
+
+
+class S3Error(Exception):
+    def __init__(self, response: requests.Response):
+        self.status = response.status_code
+        self.code = _xml_text(response.content, 'Code') or str(response.status_code)
+        super().__init__(f"S3 {response.request.method} -> {self.status} {self.code}")
+
+
+def _xml_text(body: bytes, tag: str) -> Optional[str]:
+    try:
+        for el in ET.fromstring(body).iter():
+            if el.tag.rsplit('}', 1)[-1] == tag:
+                return el.text
+    except ET.ParseError:
+        pass
+    return None
+
+
+def _q(text: str) -> str:
+    return quote(text, safe='-_.~')
+
+
+class S3Client:
+    """The handful of S3 calls a multipart upload needs, signed with SigV4."""
+
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str,
+                 region: str = 'us-east-1', timeout: float = 120):
+        self.endpoint = endpoint.rstrip('/')
+        self.host = urlsplit(self.endpoint).netloc
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def url(self, key: str) -> str:
+        return f"{self.endpoint}/{self.bucket}/{quote(key, safe='/-_.~')}"
+
+    def _sign(self, method: str, path: str, query: str, headers: Dict[str, str],
+              now: Optional[_dt.datetime] = None):
+        now = now or _dt.datetime.now(_dt.timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        scope = f"{now:%Y%m%d}/{self.region}/s3/aws4_request"
+        headers.update({'host': self.host, 'x-amz-date': amz_date, 'x-amz-content-sha256': 'UNSIGNED-PAYLOAD'})
+        names = sorted(k.lower() for k in headers)
+        lowered = {k.lower(): str(v).strip() for k, v in headers.items()}
+        canonical = '\n'.join([
+            method, path, query,
+            ''.join(f"{k}:{lowered[k]}\n" for k in names),
+            ';'.join(names), 'UNSIGNED-PAYLOAD',
+        ])
+        to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical.encode()).hexdigest()])
+        key = ('AWS4' + self.secret_key).encode()
+        for part in (f"{now:%Y%m%d}", self.region, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, to_sign.encode(), hashlib.sha256).hexdigest()
+        headers['Authorization'] = (f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                                    f"SignedHeaders={';'.join(names)}, Signature={signature}")
+
+    def _request(self, method: str, key: str, query: Optional[dict] = None, headers: Optional[dict] = None,
+                 data: bytes = b'', ok=(200,)) -> requests.Response:
+        path = f"/{self.bucket}/{quote(key, safe='/-_.~')}"
+        qs = '&'.join(f"{_q(k)}={_q(str(v))}" for k, v in sorted((query or {}).items()))
+        hdrs = dict(headers or {})
+        self._sign(method, path, qs, hdrs)
+        del hdrs['host']
+        r = self.session.request(method, self.endpoint + path + (f"?{qs}" if qs else ''), headers=hdrs,
+                                 data=data, timeout=self.timeout)
+        if r.status_code not in ok:
+            raise S3Error(r)
+        return r
+
+    def create_multipart(self, key: str) -> str:
+        r = self._request('POST', key, {'uploads': ''}, {'Content-Type': 'video/mp2t'})
+        return _xml_text(r.content, 'UploadId')
+
+    def upload_part(self, key: str, upload_id: str, number: int, data: bytes, md5: bytes) -> str:
+        r = self._request('PUT', key, {'partNumber': number, 'uploadId': upload_id},
+                          {'Content-MD5': base64.b64encode(md5).decode()}, data)
+        return r.headers.get('ETag', '').strip('"')
+
+    def list_parts(self, key: str, upload_id: str) -> Optional[Dict[int, dict]]:
+        """Parts the server holds for `upload_id`, or None if the upload is gone."""
+        parts, marker = {}, 0
+        while True:
+            try:
+                r = self._request('GET', key, {'uploadId': upload_id, 'part-number-marker': marker})
+            except S3Error as e:
+                if e.status == 404:
+                    return None
+                raise
+            root = ET.fromstring(r.content)
+            for el in root.iter():
+                if el.tag.rsplit('}', 1)[-1] != 'Part':
+                    continue
+                fields = {c.tag.rsplit('}', 1)[-1]: c.text for c in el}
+                parts[int(fields['PartNumber'])] = {'etag': (fields.get('ETag') or '').strip('"'),
+                                                    'size': int(fields.get('Size') or 0)}
+            if (_xml_text(r.content, 'IsTruncated') or 'false').lower() != 'true':
+                return parts
+            marker = int(_xml_text(r.content, 'NextPartNumberMarker') or 0)
+
+    def complete(self, key: str, upload_id: str, parts: List[dict]) -> str:
+        body = '<CompleteMultipartUpload>' + ''.join(
+            f"<Part><PartNumber>{p['n']}</PartNumber><ETag>\"{p['etag']}\"</ETag></Part>" for p in parts
+        ) + '</CompleteMultipartUpload>'
+        r = self._request('POST', key, {'uploadId': upload_id}, {'Content-Type': 'application/xml'}, body.encode())
+        # errors can arrive with 200 once the response has started streaming
+        if _xml_text(r.content, 'Code'):
+            raise S3Error(r)
+        return (_xml_text(r.content, 'ETag') or '').strip('"')
+
+    def abort(self, key: str, upload_id: str):
+        self._request('DELETE', key, {'uploadId': upload_id}, ok=(200, 204, 404))
+
+    def head(self, key: str) -> Optional[dict]:
+        r = self._request('HEAD', key, ok=(200, 404))
+        return dict(r.headers) if r.status_code == 200 else None
+
+    def put_object(self, key: str, data: bytes, content_type: str = 'application/octet-stream') -> str:
+        md5 = hashlib.md5(data).digest()
+        r = self._request('PUT', key, headers={'Content-Type': content_type,
+                                               'Content-MD5': base64.b64encode(md5).decode()}, data=data)
+        etag = r.headers.get('ETag', '').strip('"')
+        if etag and etag != md5.hex():
+            raise ValueError(f"checksum mismatch for {key}")
+        return etag
+
+
+def multipart_etag(md5_hexes: List[str]) -> str:
+    """ETag S3 reports for a completed multipart upload of these parts."""
+    joined = b''.join(bytes.fromhex(h) for h in md5_hexes)
+    return f"{hashlib.md5(joined).hexdigest()}-{len(md5_hexes)}"
+
+
+def punch_hole(fd: int, offset: int, length: int) -> bool:
+    """Release `[offset, offset + length)` of a file's blocks, keeping its size (Linux)."""
+    return fallocate(fd, FALLOC_FL_KEEP_SIZE | FALLOC_FL_PUNCH_HOLE, offset, length)
+
+
+def needs_local_file(meta: dict, config: Optional[dict]) -> bool:
+    """True while uploads are configured and the output behind `meta` is not uploaded (or given up on).
+
+    Needs no manager, so the recorder can keep such files where the
+    uploader will look for them.
+    """
+    cfg = config or {}
+    if not (cfg.get('upload_enabled') and cfg.get('upload_endpoint') and cfg.get('upload_bucket')):
+        return False
+    return (meta.get('upload') or {}).get('status') not in (COMPLETE, FAILED)
+
+
+class _Job:
+    def __init__(self, meta_path: str):
+        self.meta_path = meta_path
+        self.lock = threading.Lock()
+        self.state: dict = {}
+        self.inflight = set()
+        self.failures = 0
+        self.error = None
+        self.resumed = False
+
+
+class UploadManager:
+    """Drives one multipart upload per tracked sidecar; `poll()` is called periodically."""
+
+    def __init__(self, config: Optional[dict] = None):
+        self._jobs: Dict[str, _Job] = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._slots = None
+        self.client = None
+        self.configure(config or {})
+
+    def configure(self, config: dict):
+        enabled = bool(config.get('upload_enabled', False))
+        self.prefix = (config.get('upload_prefix') or '').lstrip('/')
+        self.part_size = max(MIN_PART_SIZE, int(float(config.get('upload_part_size_mb', 16)) * 1024 * 1024))
+        self.delete_local = bool(config.get('upload_delete_local', False))
+        self.delete_grace = float(config.get('upload_delete_grace_seconds', 300))
+        # opt-in: punched bytes read back as zeros; readers skip up to `punched`
+        self.punch = bool(config.get('upload_punch_uploaded', False))
+        self.buffer_bytes = int(float(config.get('upload_local_buffer_mb', 512)) * 1024 * 1024)
+        self.max_failures = int(config.get('upload_max_failures', 10))
+        if not enabled:
+            self.client = None
+            return
+        endpoint, bucket = config.get('upload_endpoint'), config.get('upload_bucket')
+        if not endpoint or not bucket:
+            print("[UPLOAD] upload_enabled is set but upload_endpoint/upload_bucket are missing; uploads stay off.")
+            self.client = None
+            return
+        self.client = S3Client(endpoint, bucket, config.get('upload_access_key') or '',
+                               config.get('upload_secret_key') or '', config.get('upload_region') or 'us-east-1')
+        slots = max(1, int(float(config.get('upload_max_inflight_mb', 64)) * 1024 * 1024) // self.part_size)
+        if self._pool is None or slots != self._slot_count:
+            # parts already in flight finish on the old pool and release the old semaphore
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+            self._slot_count = slots
+            self._slots = threading.BoundedSemaphore(slots)
+            self._pool = ThreadPoolExecutor(max_workers=slots, thread_name_prefix='upload')
+
+    @property
+    def enabled(self) -> bool:
+        return self.client is not None
+
+    def track(self, meta_path: Optional[str]):
+        if not meta_path or not self.enabled:
+            return
+        with self._lock:
+            self._jobs.setdefault(str(meta_path), _Job(str(meta_path)))
+
+    def resume_pending(self, base_dirs: List[str]):
+        """Track every sidecar whose output has not been uploaded yet."""
+        if not self.enabled:
+            return
+        for meta_path in journal.iter_meta_files(base_dirs):
+            meta = journal.read_meta(meta_path) or {}
+            if (meta.get('upload') or {}).get('status') == COMPLETE:
+                continue
+            if meta.get('output') and os.path.exists(meta['output']):
+                self.track(meta_path)
+
+    def pending(self, meta: dict) -> bool:
+        """True while the recording behind `meta` still needs its local file for an upload."""
+        return self.enabled and (meta.get('upload') or {}).get('status') not in (COMPLETE, FAILED)
+
+    def status(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {j.meta_path: {'uploaded': j.state.get('uploaded', 0), 'parts': len(j.state.get('parts', [])),
+                              'inflight': sorted(j.inflight), 'failures': j.failures} for j in jobs}
+
+    # --- driving -------------------------------------------------------------------
+    def poll(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            done = False
+            try:
+                done = self._advance(job)
+            except Exception as e:
+                job.failures += 1
+                job.error = str(e)
+                print(f"[UPLOAD] {job.meta_path}: {e}")
+            if not done and job.failures >= self.max_failures and not job.inflight:
+                self._fail(job, f"gave up after {job.failures} failures: {job.error}")
+                done = True
+            if done:
+                with self._lock:
+                    self._jobs.pop(job.meta_path, None)
+
+    def _fail(self, job: _Job, error: str):
+        print(f"[UPLOAD] {job.meta_path}: {error}")
+        job.state = dict(job.state, status=FAILED, error=error)
+        journal.update_meta(job.meta_path, upload=job.state)
+
+    def _key_for(self, output: str) -> str:
+        rel = os.path.join(os.path.basename(os.path.dirname(output)), os.path.basename(output))
+        return f"{self.prefix.rstrip('/')}/{rel}" if self.prefix else rel
+
+    def _advance(self, job: _Job) -> bool:
+        """Push `job` forward; True once there is nothing left to do for it."""
+        meta = journal.read_meta(job.meta_path)
+        if meta is None:
+            return True
+        output = meta.get('output')
+        state = meta.get('upload') or {}
+        if state.get('status') == COMPLETE:
+            return self._finish_local(job, meta, state)
+        if state.get('status') == FAILED:
+            return True
+        ended = meta.get('status') != journal.STATUS_RECORDING
+        try:
+            size = os.path.getsize(output)
+        except (OSError, TypeError):
+            if ended:
+                print(f"[UPLOAD] {output} is gone; giving up on {job.meta_path}.")
+                return True
+            return False
+
+        with job.lock:
+            if not job.state:
+                if not state.get('upload_id'):
+                    if not ended and size < self.part_size:
+                        return False
+                    if size == 0:
+                        return True
+                    key = self._key_for(output)
+                    state = {'status': UPLOADING, 'key': key, 'upload_id': self.client.create_multipart(key),
+                             'part_size': self.part_size, 'parts': [], 'uploaded': 0,
+                             'started_at': _dt.datetime.now().isoformat(timespec='seconds')}
+                    journal.update_meta(job.meta_path, upload=state)
+                    print(f"[UPLOAD] Started {self.client.url(key)}")
+                job.state = state
+            if not job.resumed:
+                self._reconcile(job)
+                job.resumed = True
+                if job.state.get('status') == FAILED:
+                    return True
+            part_size = job.state['part_size']
+            done = {p['n'] for p in job.state['parts']}
+
+        # dispatch every part that is fully on disk (and the tail once the recording ended)
+        n = 1
+        while (n - 1) * part_size < size:
+            start = (n - 1) * part_size
+            length = min(part_size, size - start)
+            if length < part_size and not ended:
+                break
+            if n not in done and n not in job.inflight:
+                if not self._slots.acquire(blocking=False):
+                    break
+                job.inflight.add(n)
+                self._pool.submit(self._upload_part, job, output, n, start, length, self._slots)
+            n += 1
+
+        if self.punch and not ended:
+            self._punch_uploaded(job, output, size)
+        if ended and not job.inflight and self._covered(job, size):
+            self._complete(job, meta, size)
+            return self._finish_local(job, journal.read_meta(job.meta_path) or meta, job.state)
+        return False
+
+    def _reconcile(self, job: _Job):
+        """Trust only the parts the server still has (with matching ETags)."""
+        server = self.client.list_parts(job.state['key'], job.state['upload_id'])
+        kept = [] if server is None else [
+            p for p in job.state['parts'] if server.get(p['n'], {}).get('etag') == p['etag']]
+        lost = [p for p in job.state['parts'] if p not in kept]
+        if any((p['n'] - 1) * job.state['part_size'] < job.state.get('punched', 0) for p in lost):
+            # those bytes were already released locally
+            self._fail(job, 'parts lost on the server after their local bytes were released')
+            return
+        if server is None:
+            print(f"[UPLOAD] Upload {job.state['upload_id']} no longer exists; restarting {job.state['key']}.")
+            job.state['upload_id'] = self.client.create_multipart(job.state['key'])
+        elif lost:
+            print(f"[UPLOAD] {len(lost)} part(s) of {job.state['key']} will be re-sent.")
+        job.state['parts'] = kept
+        job.state['uploaded'] = sum(p['size'] for p in kept)
+        journal.update_meta(job.meta_path, upload=job.state)
+
+    def _upload_part(self, job: _Job, output: str, n: int, start: int, length: int, slots):
+        try:
+            with open(output, 'rb') as f:
+                f.seek(start)
+                data = f.read(length)
+            if len(data) != length:
+                raise IOError(f"short read at {start} ({len(data)}/{length})")
+            md5 = hashlib.md5(data).digest()
+            etag = self.client.upload_part(job.state['key'], job.state['upload_id'], n, data, md5)
+            del data
+            if etag != md5.hex():
+                raise ValueError(f"ETag {etag} does not match local MD5 {md5.hex()}")
+            with job.lock:
+                job.state['parts'] = sorted(job.state['parts'] + [{'n': n, 'size': length, 'etag': etag,
+                                                                    'md5': md5.hex()}], key=lambda p: p['n'])
+                job.state['uploaded'] = job.state.get('uploaded', 0) + length
+                journal.update_meta(job.meta_path, upload=job.state)
+        except Exception as e:
+            job.failures += 1
+            job.error = str(e)
+            print(f"[UPLOAD] Part {n} of {output} failed: {e}")
+        finally:
+            job.inflight.discard(n)
+            slots.release()
+
+    def _covered(self, job: _Job, size: int) -> bool:
+        parts = job.state['parts']
+        return (bool(parts) and [p['n'] for p in parts] == list(range(1, len(parts) + 1))
+                and sum(p['size'] for p in parts) == size)
+
+    def _complete(self, job: _Job, meta: dict, size: int):
+        state, key = job.state, job.state['key']
+        etag = self.client.complete(key, state['upload_id'], state['parts'])
+        expected = multipart_etag([p['md5'] for p in state['parts']])
+        head = self.client.head(key) or {}
+        remote_size = int(head.get('Content-Length', -1))
+        if (etag and etag != expected) or remote_size != size:
+            raise ValueError(f"verification failed for {key}: etag={etag} expected={expected} "
+                             f"size={remote_size}/{size}")
+        state.update(status=COMPLETE, etag=expected, size=size, url=self.client.url(key),
+                     completed_at=_dt.datetime.now().isoformat(timespec='seconds'))
+        journal.update_meta(job.meta_path, upload=state)
+        # companions: timeline index and the sidecar itself
+        idx = timeline.index_path_for(meta['output'])
+        if os.path.exists(idx):
+            with open(idx, 'rb') as f:
+                self.client.put_object(os.path.splitext(key)[0] + timeline.INDEX_SUFFIX, f.read())
+        with open(job.meta_path, 'rb') as f:
+            self.client.put_object(os.path.splitext(key)[0] + journal.META_SUFFIX, f.read(), 'application/json')
+        print(f"[UPLOAD] Completed and verified {state['url']} ({size / 1048576:.1f} MiB, {len(state['parts'])} parts)")
+
+    def _finish_local(self, job: _Job, meta: dict, state: dict) -> bool:
+        """Drop the local copy of a verified upload after the grace period."""
+        if not self.delete_local:
+            return True
+        output = meta.get('output')
+        try:
+            ended = _dt.datetime.fromisoformat(meta.get('ended_at') or '').timestamp()
+        except ValueError:
+            ended = os.path.getmtime(output) if output and os.path.exists(output) else 0
+        if _dt.datetime.now().timestamp() - ended < self.delete_grace:
+            return False
+        if output and os.path.exists(output):
+            os.remove(output)
+            print(f"[UPLOAD] Removed local copy {output} (object: {state.get('url')})")
+        return True
+
+    def _punch_uploaded(self, job: _Job, output: str, size: int):
+        """Free disk for uploaded bytes that are older than the local buffer."""
+        with job.lock:
+            contiguous = 0
+            for i, p in enumerate(job.state['parts'], start=1):
+                if p['n'] != i:
+                    break
+                contiguous += p['size']
+            start = job.state.get('punched', 0)
+            end = min(contiguous, size - self.buffer_bytes) // PUNCH_ALIGN * PUNCH_ALIGN
+            if end <= start:
+                return
+            fd = os.open(output, os.O_WRONLY)
+            try:
+                if not punch_hole(fd, start, end - start):
+                    self.punch = False
+                    print("[UPLOAD] Hole punching is not supported here; keeping uploaded bytes on disk.")
+                    return
+            finally:
+                os.close(fd)
+            job.state['punched'] = end
+            journal.update_meta(job.meta_path, upload=job.state)
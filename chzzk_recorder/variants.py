@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""HLS playlist parsing and throughput-aware variant selection."""
+
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import requests
+
+# Most recent measured download throughput (bits/s), shared by all channels.
+# All variants come from the same CDN, so one probe says a lot about the link.
+last_throughput_bps: Optional[float] = None
+last_throughput_at: float = 0.0
+
+# Playlist/segment requests share keep-alive connections, so a new stream on
+# the same CDN host skips the TCP/TLS handshake on its critical start path.
+http = requests.Session()
+
+
+def recent_throughput(max_age: float) -> Optional[float]:
+    """The shared throughput measurement if it is younger than `max_age` seconds."""
+    if last_throughput_bps is None or time.monotonic() - last_throughput_at > max_age:
+        return None
+    return last_throughput_bps
+
+
+def parse_master(text: str, master_url: str) -> List[dict]:
+    """Return the variants of a master playlist, best first."""
+    base = master_url.rsplit('/', 1)[0] + '/'
+    lines = text.splitlines()
+    variants = []
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        if line.startswith('#EXT-X-STREAM-INF'):
+            m_res = re.search(r'RESOLUTION=\s*(\d+)x(\d+)', line)
+            h = int(m_res.group(2)) if m_res else -1
+            m_bw = re.search(r'BANDWIDTH=\s*(\d+)', line)
+            bw = int(m_bw.group(1)) if m_bw else -1
+            m_fps = re.search(r'FRAME-RATE=\s*([0-9.]+)', line)
+            fps = float(m_fps.group(1)) if m_fps else 0.0
+            j = i + 1
+            while j < len(lines) and lines[j].strip().startswith('#'):
+                j += 1
+            if j < len(lines):
+                uri = lines[j].strip()
+                variants.append({
+                    'url': urljoin(base, uri),
+                    'height': h,
+                    'fps': fps,
+                    'bandwidth': bw,
+                })
+            i = j
+        i += 1
+    variants.sort(key=lambda v: (v['height'], v['fps'], v['bandwidth']), reverse=True)
+    return variants
+
+
+def parse_media_playlist(text: str, playlist_url: str) -> dict:
+    """Parse a media playlist into its segments with media sequence numbers."""
+    base = playlist_url.rsplit('/', 1)[0] + '/'
+    media_sequence = 0
+    target_duration = None
+    segments = []
+    duration = None
+    pdt = None
+    discontinuity = False
+    ended = False
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            try:
+                media_sequence = int(line.split(':', 1)[1])
+            except ValueError:
+                pass
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            try:
+                target_duration = float(line.split(':', 1)[1])
+            except ValueError:
+                pass
+        elif line.startswith('#EXTINF:'):
+            try:
+                duration = float(line.split(':', 1)[1].split(',', 1)[0])
+            except ValueError:
+                duration = None
+        elif line.startswith('#EXT-X-PROGRAM-DATE-TIME:'):
+            pdt = line.split(':', 1)[1]
+        elif line.startswith('#EXT-X-DISCONTINUITY'):
+            discontinuity = True
+        elif line.startswith('#EXT-X-ENDLIST'):
+            ended = True
+        elif not line.startswith('#'):
+            segments.append({
+                'seq': media_sequence + len(segments),
+                'url': urljoin(base, line),
+                'duration': duration,
+                'program_date_time': pdt,
+                'discontinuity': discontinuity,
+            })
+            duration = None
+            pdt = None
+            discontinuity = False
+    return {
+        'media_sequence': media_sequence,
+        'target_duration': target_duration,
+        'segments': segments,
+        'ended': ended,
+    }
+
+
+def probe_throughput(variant_url: str, hdrs: Dict[str, str], timeout: float = 8) -> Optional[float]:
+    """Download the newest complete segment of a variant and return bits/s."""
+    global last_throughput_bps, last_throughput_at
+    try:
+        r = http.get(variant_url, headers=hdrs, timeout=timeout)
+        if not r.ok:
+            return None
+        playlist = parse_media_playlist(r.text, variant_url)
+        if not playlist['segments']:
+            return None
+        seg = playlist['segments'][-1]
+        t0 = time.monotonic()
+        nbytes = 0
+        with http.get(seg['url'], headers=hdrs, timeout=timeout, stream=True) as sr:
+            if not sr.ok:
+                return None
+            for chunk in sr.iter_content(chunk_size=64 * 1024):
+                nbytes += len(chunk)
+        elapsed = max(time.monotonic() - t0, 1e-3)
+        bps = nbytes * 8 / elapsed
+        last_throughput_bps = bps
+        last_throughput_at = time.monotonic()
+        return bps
+    except Exception:
+        return None
+
+
+def _within(variant: dict, min_height: Optional[int], max_height: Optional[int]) -> bool:
+    if min_height and variant['height'] < min_height:
+        return False
+    if max_height and variant['height'] > max_height:
+        return False
+    return True
+
+
+def constrain(variants: List[dict], min_height: Optional[int] = None,
+              max_height: Optional[int] = None) -> List[dict]:
+    """Variants allowed by the quality bounds, best first.
+
+    If nothing fits the bounds the closest variants are used instead, so a
+    misconfigured channel still records something.
+    """
+    allowed = [v for v in variants if _within(v, min_height, max_height)]
+    if allowed:
+        return allowed
+    if max_height:
+        below = [v for v in variants if v['height'] <= max_height]
+        if below:
+            return below
+    return variants[-1:] if min_height is None else variants[:1]
+
+
+def pick(allowed: List[dict], throughput_bps: Optional[float], headroom: float = 1.2) -> dict:
+    """Best variant whose BANDWIDTH fits the measured throughput with headroom.
+
+    The lowest allowed variant is the floor even if it does not fit.
+    """
+    if throughput_bps is None:
+        return allowed[0]
+    for v in allowed:
+        if v['bandwidth'] <= 0 or v['bandwidth'] * headroom <= throughput_bps:
+            return v
+    return allowed[-1]
+
+
+def select_variant(master_url: str, hdrs: Dict[str, str], min_height: Optional[int] = None,
+                   max_height: Optional[int] = None, probe: bool = True,
+                   headroom: float = 1.2, throughput: Optional[float] = None) -> Tuple[Optional[dict], List[dict]]:
+    """Choose a variant from the master playlist.
+
+    Returns `(chosen, variants)`. `chosen` is None when the URL is not a
+    master playlist (or could not be fetched) and should be used as-is.
+    Without `probe`, a known `throughput` (bits/s) still caps the choice.
+    """
+    try:
+        r = http.get(master_url, headers=hdrs, timeout=8)
+        if not r.ok or '#EXT-X-STREAM-INF' not in r.text:
+            return None, []
+        variants = parse_master(r.text, master_url)
+    except Exception:
+        return None, []
+    if not variants:
+        return None, []
+    allowed = constrain(variants, min_height, max_height)
+    if probe and len(allowed) > 1:
+        throughput = probe_throughput(allowed[0]['url'], hdrs)
+    return pick(allowed, throughput, headroom), variants
+
+
+def next_lower(variants: List[dict], current: dict, min_height: Optional[int] = None) -> Optional[dict]:
+    """The next variant below `current` that still respects the quality floor."""
+    lower = [v for v in variants
+             if (v['height'], v['bandwidth']) < (current['height'], current['bandwidth'])
+             and _within(v, min_height, None)]
+    return lower[0] if lower else None
+
+
+def next_higher(variants: List[dict], current: dict, max_height: Optional[int] = None) -> Optional[dict]:
+    """The next variant above `current` that still respects the quality cap."""
+    higher = [v for v in variants
+              if (v['height'], v['bandwidth']) > (current['height'], current['bandwidth'])
+              and _within(v, None, max_height)]
+    return higher[-1] if higher else None
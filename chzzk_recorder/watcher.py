@@ -2,12 +2,62 @@
 import json
 import os
 import datetime
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from chzzk_api import ChzzkAPI
-from recorder import start_recording
+from recorder import start_recording, channel_options, session_headers, start_latencies
 from auth import get_session_cookies
+import admission
+import journal
+import llhls
+import variants
+import writer
+import budget
+import ts_check
+import timeline
+from thumbnails import ThumbnailPool, thumbs_dir_for
+import control
+from control import ControlServer, REPLY_TIMEOUT
+from scheduler import Scheduler
+from profiling import profiler, phase
+from uploader import UploadManager
 
 # State dictionary to manage recording processes
 currently_recording = {}
+# channelId -> continuation info for recordings interrupted mid-broadcast
+pending_continuations = {}
+# Background thumbnail/sprite workers (created in main_loop)
+thumbnail_pool = None
+# Local control API (created in main_loop when enabled)
+control_server = None
+# Streaming object-storage uploads (created in main_loop)
+upload_manager = None
+# Runtime state shared by the loop, config hot-reload and control commands
+runtime = {
+    'config': {},
+    'config_path': None,
+    'config_mtime': None,
+    'settings': {},
+    'targets': set(),
+    'forced': set(),      # started via control API although not a target
+    'suppressed': set(),  # stopped via control API; not restarted until offline
+    'paused': False,
+    'api': None,
+    'starting': set(),    # channels with a start/restart in flight
+    'queued': {},         # channelId -> why/since it waits for a recording slot
+    'capped': {},         # channelId -> height it is held to while under load
+    'last_cleanup_date': None,
+    'last_refresh_hour': -1,
+}
+CONFIG_CHECK_SECONDS = 2
+# Guards currently_recording / pending_continuations / runtime sets across duty threads
+state_lock = threading.RLock()
+# Duty scheduler (created in main_loop)
+scheduler = None
+# Recording starts run here so one slow start does not hold up the poll sweep
+start_pool = None
+start_pool_workers = 0
 
 
 def load_config(config_path):
@@ -16,12 +66,17 @@ def load_config(config_path):
         return json.load(f)
 
 
-def main_loop():
-    """The main loop to watch for live channels and trigger recordings."""
+def main_loop(config_dir: str = None, recordings_dir: str = None):
+    """Set up the watcher and run its duties on independent schedules.
+
+    `config_dir` / `recordings_dir` default to the directories next to this
+    file; tools/bench_watcher.py points them at a scratch tree.
+    """
+    global thumbnail_pool, control_server, scheduler, upload_manager
 
     # --- Initial Setup ---
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    config_dir = os.path.join(base_dir, 'config')
+    config_dir = config_dir or os.path.join(base_dir, 'config')
     config_path = os.path.join(config_dir, 'config.json')
     session_path = os.path.join(config_dir, 'session.json')
 
@@ -29,178 +84,1069 @@ def main_loop():
         print(f"Error: Config file not found at {config_path}. Please run auth.py first.")
         return
     config = load_config(config_path)
+    runtime['config_dir'] = config_dir
+    runtime['config_path'] = config_path
+    runtime['session_path'] = session_path
+    runtime['config_mtime'] = os.path.getmtime(config_path)
+    _apply_config(config)
 
-    target_ids = set(config.get("TARGET_CHANNELS", []))
-    if not target_ids:
+    control_enabled = bool(config.get("control_api_enabled", True))
+    if not runtime['targets'] and not control_enabled:
         print("No target channels specified in config.json. Watcher will exit.")
         return
 
-    polling_interval = config.get("POLLING_INTERVAL_SECONDS", 30)
-    # Stall/fast restart settings
-    stall_restart_seconds = int(config.get("stall_restart_seconds", config.get("stall_seconds", 180)))
-    fast_restart_seconds = int(config.get("fast_restart_seconds", min(60, stall_restart_seconds)))
-    # Daily cleanup schedule (hour in local time)
-    cleanup_enabled = bool(config.get("cleanup_enabled", True))
-    cleanup_hour = int(config.get("cleanup_hour", 5))
-    last_cleanup_date = None
-    last_refresh_hour = -1
-
     try:
-        api = ChzzkAPI(config_dir)
+        runtime['api'] = ChzzkAPI(config_dir, base_url=config.get('api_base_url'), accounts=config.get('ACCOUNTS'))
     except FileNotFoundError as e:
         print(f"Session file not found: {e}. Please run auth.py to create it.")
         return
 
-    print(f"Watcher started. Monitoring {len(target_ids)} channel(s)...")
-
-    # --- Main Loop ---
-    while True:
-        now = datetime.datetime.now()
-        print(f"\n[{now.strftime('%Y-%m-%d %H:%M:%S')}] Checking status...")
-
-        # 1. Session Refresh Logic
-        if now.hour in [6, 18] and now.hour != last_refresh_hour:
-            print(f"--- Scheduled session refresh triggered at {now.hour}:00 ---")
-            refresh_success = get_session_cookies(config_path, session_path, headless=True)
-            last_refresh_hour = now.hour
-
-            if refresh_success:
-                print("Session refreshed successfully. Re-initializing API module.")
-                api = ChzzkAPI(config_dir)
-                # Do NOT restart active recordings to avoid file splits.
-                if currently_recording:
-                    print("Active recordings detected — skipping restart to preserve single files.")
-                else:
-                    print("No active recordings at refresh time.")
-            else:
-                print("Session refresh failed. Will retry at the next scheduled time.")
+    thumbnail_pool = ThumbnailPool(config)
+    if control_enabled:
+        try:
+            control_server = ControlServer(int(config.get("control_api_port", control.DEFAULT_PORT)),
+                                           token=config.get("control_api_token"))
+            control_server.start()
+        except OSError as e:
+            print(f"[CONTROL] Could not start control API: {e}")
+            control_server = None
 
-        # 2. Process Health/Progress Check
-        for channel_id, info in list(currently_recording.items()):
-            # If process exited, cleanup
-            if info['process'].poll() is not None:
-                print(f"! Recording process for '{info['channel_name']}' ({channel_id}) found dead. Cleaning up.")
-                del currently_recording[channel_id]
+    recordings_dir = recordings_dir or os.path.join(base_dir, 'recordings')
+    storage_dirs = _storage_dirs(config, recordings_dir)
+    _restore_from_journal(storage_dirs)
+    upload_manager = UploadManager(config)
+    upload_manager.resume_pending(storage_dirs)
+
+    print(f"Watcher started. Monitoring {len(runtime['targets'])} channel(s)...")
+
+    # --- Duties ---
+    # Each duty has its own cadence and timeout; a slow one never delays the others.
+    settings = lambda: runtime['settings']
+    scheduler = Scheduler()
+    scheduler.run_hook = profiler.run
+    profiler.wait_duties.add('control')
+    profiler.install_signals()
+    scheduler.add('poll', _duty_poll, lambda: settings()['polling_interval'], timeout=300)
+    scheduler.add('health', _duty_health, lambda: settings()['health_check_interval'], timeout=120)
+    scheduler.add('media', _duty_media, lambda: settings()['media_check_interval'], timeout=600,
+                  initial_delay=5)
+    scheduler.add('cleanup', _duty_cleanup, 60, timeout=3600, initial_delay=10)
+    scheduler.add('refresh', _duty_refresh, 60, timeout=600)
+    scheduler.add('config', _duty_config, CONFIG_CHECK_SECONDS, timeout=30)
+    scheduler.add('upload', lambda: upload_manager.poll(),
+                  lambda: float(runtime['config'].get('upload_interval_seconds', 10)), timeout=600)
+    scheduler.add('tracemalloc', profiler.memory_snapshot,
+                  lambda: float(runtime['config'].get('profiling_tracemalloc_interval_seconds', 300)),
+                  timeout=120, initial_delay=30)
+    if control_server is not None:
+        scheduler.add('control', _duty_control, 0, timeout=REPLY_TIMEOUT)
+    scheduler.run_forever()
+
+
+def _duty_poll():
+    """Live check: start new recordings, stop ended ones, rebalance threads."""
+    config = runtime['config']
+    api = runtime['api']
+    now = datetime.datetime.now()
+    print(f"\n[{now.strftime('%Y-%m-%d %H:%M:%S')}] Checking status...")
+
+    if runtime['paused']:
+        print("Polling is paused (control API). Health checks continue.")
+        return
+
+    with state_lock:
+        polled_ids = runtime['targets'] | runtime['forced']
+    live_channels_details = {}
+    starts = []
+    admitted = set()
+    try:
+        for cid in polled_ids:
+            with phase('poll.api'):
+                details = api.get_live_details(cid)
+            if not details:
                 continue
-            # Stall detection on output file size
-            out_path = info.get('output')
-            if not out_path:
+            live_channels_details[cid] = details
+            # Start New Recordings as soon as a channel is seen live, not after the
+            # whole sweep; the start itself runs on the start pool
+            with state_lock:
+                new = cid not in currently_recording and cid not in runtime['suppressed']
+            if new and _admit(cid, details, config, admitted):
+                admitted.add(cid)
+                starts.append(_start_pool(config).submit(
+                    profiler.run, 'start', lambda cid=cid, details=details: _start_channel(cid, details, config)))
+    except Exception as e:
+        print(f"Error during API call: {e}. Skipping this check cycle.")
+        return
+    finally:
+        with phase('poll.start'):
+            for fut in starts:
+                try:
+                    fut.result()
+                except Exception as e:
+                    print(f"     Start failed: {e}")
+
+    live_now_ids = set(live_channels_details.keys())
+    with state_lock:
+        # Control-API overrides last until the stream goes offline
+        runtime['forced'] &= live_now_ids | set(currently_recording)
+        runtime['suppressed'] &= live_now_ids
+        to_stop = [cid for cid in currently_recording if cid not in live_now_ids]
+        runtime['queued'] = {cid: q for cid, q in runtime['queued'].items()
+                             if cid in live_now_ids and cid not in currently_recording}
+        runtime['capped'] = {cid: h for cid, h in runtime['capped'].items() if cid in live_now_ids}
+
+    # Stop Old Recordings
+    for channel_id in to_stop:
+        recording_info = currently_recording.get(channel_id)
+        if not recording_info:
+            continue
+        print(f"  -> Stream ended for '{recording_info['channel_name']}' ({channel_id})")
+        with phase('poll.stop'):
+            _stop_channel(channel_id, 'stream ended')
+        with state_lock:
+            runtime['forced'].discard(channel_id)
+
+    # Hold unprotected recordings to their quality floor while under load
+    try:
+        with phase('poll.admission'):
+            _enforce_load(api, config)
+    except Exception as e:
+        print(f"[ADMISSION] Load check failed: {e}")
+
+    # Rebalance download threads across the recordings that remain
+    try:
+        with phase('poll.rebalance'):
+            _rebalance_threads(api, config)
+    except Exception as e:
+        print(f"[THREADS] Rebalance failed: {e}")
+
+    # --- Reporting ---
+    if not currently_recording:
+        print("No target channels are currently live or being recorded.")
+    else:
+        recording_names = [info['channel_name'] for info in list(currently_recording.values())]
+        print(f"Currently recording: {recording_names}")
+    with state_lock:
+        queued = sorted(runtime['queued'])
+    if queued:
+        print(f"Waiting for a recording slot: {queued}")
+
+
+def _duty_health():
+    """Process liveness and stall detection on output growth."""
+    config = runtime['config']
+    settings = runtime['settings']
+    api = runtime['api']
+    stall_restart_seconds = settings['stall_restart_seconds']
+    fast_restart_seconds = settings['fast_restart_seconds']
+    for channel_id, info in list(currently_recording.items()):
+        # If process exited, cleanup
+        if info['process'].poll() is not None:
+            # a make-before-break restart may have replaced this entry meanwhile
+            if not _claim(channel_id, info):
                 continue
             try:
-                sz = os.path.getsize(out_path)
-            except Exception:
-                sz = -1
-            last_sz = info.get('last_size', -2)
-            last_grow = info.get('last_grow', time.time())
-            now_ts = time.time()
-            if sz is not None and sz >= 0:
-                if sz > last_sz:
-                    info['last_size'] = sz
-                    info['last_grow'] = now_ts
-                else:
-                    # no growth
-                    threshold = min(stall_restart_seconds, fast_restart_seconds) if fast_restart_seconds else stall_restart_seconds
-                    if (now_ts - last_grow) >= threshold:
-                        print(f"! Stall detected for '{info['channel_name']}' ({channel_id}). size={sz}, last_grow={int(now_ts - last_grow)}s >= {stall_restart_seconds}s. Restarting.")
-                        try:
-                            info['process'].kill()
-                        except Exception:
-                            pass
-                        del currently_recording[channel_id]
-                        # try immediate restart with fresh details
-                        try:
-                            det = api.get_live_details(channel_id)
-                            if det and det.get('m3u8_url'):
-                                det['channelId'] = channel_id
-                                restarted = start_recording(det, config)
-                                if restarted and restarted.get('process'):
-                                    currently_recording[channel_id] = {
-                                        'process': restarted['process'],
-                                        'channel_name': det.get('channelName', channel_id),
-                                        'output': restarted.get('output'),
-                                        'title': restarted.get('title'),
-                                        'log_dir': restarted.get('log_dir'),
-                                        'last_size': 0,
-                                        'last_grow': time.time(),
-                                    }
-                                    print(f"  -> Restarted recording for '{currently_recording[channel_id]['channel_name']}' ({channel_id})")
-                        except Exception as e:
-                            print(f"  -> Restart attempt failed: {e}")
-
-        # 3. Daily Cleanup (once per day)
+                print(f"! Recording process for '{info['channel_name']}' ({channel_id}) found dead. Cleaning up.")
+                _end_recording(channel_id, journal.STATUS_INTERRUPTED, 'downloader exited', info)
+            finally:
+                _release(channel_id)
+            continue
+        # Stall detection on output file size
+        out_path = info.get('output')
+        if not out_path:
+            continue
         try:
-            if cleanup_enabled:
-                today = now.date()
-                if (last_cleanup_date is None or last_cleanup_date != today) and now.hour >= cleanup_hour:
-                    _run_daily_cleanup(api, config)
-                    last_cleanup_date = today
-        except Exception as e:
-            print(f"[CLEANUP] Error during daily cleanup scheduling: {e}")
+            sz = os.path.getsize(out_path)
+        except Exception:
+            sz = -1
+        last_sz = info.get('last_size', -2)
+        last_grow = info.get('last_grow', time.time())
+        now_ts = time.time()
+        if sz < 0:
+            continue
+        if sz > last_sz:
+            info['last_size'] = sz
+            info['last_grow'] = now_ts
+            continue
+        # no growth
+        threshold = min(stall_restart_seconds, fast_restart_seconds) if fast_restart_seconds else stall_restart_seconds
+        if info.get('capture') == 'llhls':
+            # a fetched part counts as progress even while ffmpeg still buffers it
+            progress = llhls.read_progress(info.get('progress_path'))
+            if progress and progress.get('at', 0) > last_grow:
+                info['last_grow'] = last_grow = progress['at']
+            threshold = settings['llhls_stall_seconds']
+        if (now_ts - last_grow) < threshold:
+            continue
+        if not _claim(channel_id, info):
+            continue
+        try:
+            print(f"! Stall detected for '{info['channel_name']}' ({channel_id}). size={sz}, last_grow={int(now_ts - last_grow)}s >= {threshold}s. Restarting.")
+            _stop_process(info)
+            _end_recording(channel_id, journal.STATUS_INTERRUPTED, 'stall', info)
+            # try immediate restart with fresh details
+            try:
+                with phase('health.api'):
+                    det = api.get_live_details(channel_id)
+                if det and det.get('m3u8_url'):
+                    det['channelId'] = channel_id
+                    restarted = start_recording(det, config, _take_continuation(channel_id, det),
+                                                quality=_capped_quality(channel_id),
+                                                threads=_thread_allocation(config, channel_id).get(channel_id))
+                    if restarted and restarted.get('process'):
+                        _register_recording(channel_id, det.get('channelName', channel_id), restarted)
+                        print(f"  -> Restarted recording for '{det.get('channelName', channel_id)}' ({channel_id})")
+            except Exception as e:
+                print(f"  -> Restart attempt failed: {e}")
+        finally:
+            _release(channel_id)
+
 
-        # 4. Check Live Status
+def _duty_media():
+    """Incremental TS scan / timeline index / thumbnails, then live variant checks."""
+    config = runtime['config']
+    for channel_id, info in list(currently_recording.items()):
+        now_ts = time.time()
+        # Incremental TS integrity scan + timeline index of the newly written bytes
+        with phase('media.scan'):
+            _scan_output(info, config, now_ts)
+        # Throughput-aware live variant downgrade/upgrade
+        if now_ts - info.get('last_grow', now_ts) > runtime['settings']['media_check_interval']:
+            continue
         try:
-            live_channels_details = {cid: api.get_live_details(cid) for cid in target_ids}
-            live_channels_details = {k: v for k, v in live_channels_details.items() if v}  # Filter out non-live
+            with phase('media.variant'):
+                _check_variant(channel_id, info, runtime['api'], config, now_ts)
         except Exception as e:
-            print(f"Error during API call: {e}. Skipping this check cycle.")
-            time.sleep(polling_interval)
-            continue
+            print(f"[ABR] Variant check failed for {channel_id}: {e}")
 
-        live_now_ids = set(live_channels_details.keys())
-
-        # 4. Start New Recordings
-        for channel_id in live_now_ids:
-            if channel_id not in currently_recording:
-                details = live_channels_details[channel_id]
-                details['channelId'] = channel_id
-                channel_name = details.get("channelName", channel_id)
-                print(f"  -> New live stream detected for '{channel_name}' ({channel_id})")
-
-                started_info = start_recording(details, config)
-                if started_info and started_info.get("process"):
-                    process = started_info["process"]
-                    print(f"     Recording process started for '{channel_name}' (PID: {process.pid})")
-                    currently_recording[channel_id] = {
-                        "process": process,
-                        "channel_name": channel_name,
-                        "output": started_info.get("output"),
-                        "title": started_info.get("title"),
-                        "log_dir": started_info.get("log_dir"),
-                        "last_size": 0,
-                        "last_grow": time.time(),
-                    }
-                else:
-                    print(f"     Failed to start recording for {channel_id}.")
-
-        # 6. Stop Old Recordings
-        for channel_id in list(currently_recording.keys()):
-            if channel_id not in live_now_ids:
-                recording_info = currently_recording[channel_id]
-                print(f"  -> Stream ended for '{recording_info['channel_name']}' ({channel_id})")
-                try:
-                    recording_info['process'].kill()
-                    print(f"     Recording process for '{recording_info['channel_name']}' terminated.")
-                except Exception as e:
-                    print(f"     An unexpected error occurred during process termination: {e}")
-                del currently_recording[channel_id]
 
-        # --- Reporting ---
-        if not currently_recording:
-            print("No target channels are currently live or being recorded.")
+def _duty_cleanup():
+    """Daily Cleanup (once per day, at or after `cleanup_hour`)."""
+    settings = runtime['settings']
+    if not settings['cleanup_enabled']:
+        return
+    now = datetime.datetime.now()
+    today = now.date()
+    if runtime['last_cleanup_date'] != today and now.hour >= settings['cleanup_hour']:
+        runtime['last_cleanup_date'] = today
+        _run_daily_cleanup(runtime['api'], runtime['config'])
+
+
+def _duty_refresh():
+    """Session Refresh at 06:00 and 18:00, plus benched sessions whose cookies were rejected."""
+    api = runtime['api']
+    now = datetime.datetime.now()
+    if now.hour in [6, 18] and now.hour != runtime['last_refresh_hour']:
+        print(f"--- Scheduled session refresh triggered at {now.hour}:00 ---")
+        runtime['last_refresh_hour'] = now.hour
+        refreshed = [s for s in api.pool.sessions if _refresh_session(s)]
+        if refreshed:
+            print(f"Refreshed {len(refreshed)}/{len(api.pool.sessions)} session(s). Reloading them in place.")
+            api.reload_sessions(refreshed)
+            # Do NOT restart active recordings to avoid file splits.
+            if currently_recording:
+                print("Active recordings detected — skipping restart to preserve single files.")
+            else:
+                print("No active recordings at refresh time.")
         else:
-            recording_names = [info['channel_name'] for info in currently_recording.values()]
-            print(f"Currently recording: {recording_names}")
+            print("Session refresh failed. Will retry at the next scheduled time.")
+        return
 
-        print(f"Check complete. Waiting for {polling_interval} seconds.")
-        time.sleep(polling_interval)
+    cooldown = float(runtime['config'].get('session_refresh_cooldown_seconds', 1800))
+    for session in api.pool.needing_refresh():
+        if time.time() - session.last_refresh_attempt < cooldown:
+            continue
+        print(f"--- Refreshing rejected session {session.path} ---")
+        if _refresh_session(session):
+            api.reload_sessions([session])
 
 
-if __name__ == "__main__":
-    # Change directory to the script's location
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    main_loop()
+def _refresh_session(session) -> bool:
+    """Log in again for one pool session (primary credentials come from config.json)."""
+    session.last_refresh_attempt = time.time()
+    return get_session_cookies(runtime['config_path'], session.path, headless=True,
+                               credentials=session.account or None)
+
+
+def _duty_config():
+    _reload_config_if_changed()
+
+
+def _duty_control():
+    """Execute queued control-API commands (blocks up to a second waiting for one)."""
+    cmd = control_server.get_command(timeout=1)
+    if cmd is None:
+        return
+    name, args, reply = cmd
+    try:
+        with phase(f'control.{name}'):
+            result = _handle_command(name, args)
+    except Exception as e:
+        result = {'ok': False, 'error': str(e)}
+    reply.put(result)
+
 
 # --- Helpers ---
+def _runtime_settings(config: dict) -> dict:
+    stall_restart_seconds = int(config.get("stall_restart_seconds", config.get("stall_seconds", 180)))
+    return {
+        'polling_interval': config.get("POLLING_INTERVAL_SECONDS", 30),
+        # Stall/fast restart settings
+        'stall_restart_seconds': stall_restart_seconds,
+        'fast_restart_seconds': int(config.get("fast_restart_seconds", min(60, stall_restart_seconds))),
+        # LL-HLS captures report progress per part, so a stall shows much sooner
+        'llhls_stall_seconds': float(config.get("llhls_stall_seconds", 10)),
+        # Daily cleanup schedule (hour in local time)
+        'cleanup_enabled': bool(config.get("cleanup_enabled", True)),
+        'cleanup_hour': int(config.get("cleanup_hour", 5)),
+        # Independent duty cadences
+        'health_check_interval': float(config.get("health_check_interval_seconds", 5)),
+        'media_check_interval': float(config.get("media_check_interval_seconds", 10)),
+    }
+
+
+def _apply_config(config: dict) -> list:
+    """Swap in a new config; only channels removed from the targets are touched.
+
+    Returns the recordings to stop. The caller stops them after releasing
+    `state_lock`, since each stop runs a final scan of its output.
+    """
+    old_targets = runtime['targets']
+    new_targets = set(config.get("TARGET_CHANNELS", []))
+    runtime['config'] = config
+    runtime['settings'] = _runtime_settings(config)
+    runtime['targets'] = new_targets
+    profiler.configure(config)
+    if runtime['api'] is not None:
+        runtime['api'].set_accounts(config.get('ACCOUNTS') or [])
+    if upload_manager is not None:
+        upload_manager.configure(config)
+    if runtime['config_mtime'] is None or not old_targets:
+        return []
+    added, removed = new_targets - old_targets, old_targets - new_targets
+    if added:
+        print(f"[CONFIG] Channels added: {sorted(added)}")
+    if removed:
+        print(f"[CONFIG] Channels removed: {sorted(removed)}")
+    return [cid for cid in removed if cid in currently_recording and cid not in runtime['forced']]
+
+
+def _reload_config_if_changed(force: bool = False) -> bool:
+    with state_lock:
+        changed, to_stop = _reload_config_locked(force)
+    for channel_id in to_stop:
+        _stop_channel(channel_id, 'removed from TARGET_CHANNELS')
+    return changed
+
+
+def _reload_config_locked(force: bool):
+    """`(changed, recordings to stop)`; see `_apply_config`."""
+    path = runtime['config_path']
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return False, []
+    if not force and mtime == runtime['config_mtime']:
+        return False, []
+    try:
+        config = load_config(path)
+    except Exception as e:
+        print(f"[CONFIG] Ignoring unreadable config change: {e}")
+        runtime['config_mtime'] = mtime
+        return False, []
+    runtime['config_mtime'] = mtime
+    print("[CONFIG] config.json changed; applying in place.")
+    return True, _apply_config(config)
+
+
+def _persist_targets():
+    """Write the runtime target list back so a later reload keeps it."""
+    path = runtime['config_path']
+    config = load_config(path)
+    with state_lock:
+        config['TARGET_CHANNELS'] = sorted(runtime['targets'])
+    # write a temp file and swap it in, so a crash or a concurrent reload never sees a partial config
+    head, tail = os.path.split(path)
+    tmp_path = os.path.join(head, f'.{tail}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    runtime['config']['TARGET_CHANNELS'] = config['TARGET_CHANNELS']
+    runtime['config_mtime'] = os.path.getmtime(path)
+
+
+def _claim(channel_id: str, info: dict = None) -> bool:
+    """Reserve `channel_id` for a start/restart so no other duty races it.
+
+    With `info` the claim only succeeds if that recording is still current.
+    """
+    with state_lock:
+        if channel_id in runtime['starting']:
+            return False
+        current = currently_recording.get(channel_id)
+        if (info is None and current is not None) or (info is not None and current is not info):
+            return False
+        runtime['starting'].add(channel_id)
+        return True
+
+
+def _release(channel_id: str):
+    with state_lock:
+        runtime['starting'].discard(channel_id)
+
+
+def _start_pool(config: dict) -> ThreadPoolExecutor:
+    """Workers that launch recordings in parallel with the rest of the poll sweep."""
+    global start_pool, start_pool_workers
+    workers = max(1, int(config.get('start_workers', 4)))
+    if start_pool is None or start_pool_workers != workers:
+        if start_pool is not None:
+            start_pool.shutdown(wait=False)
+        start_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='start')
+        start_pool_workers = workers
+    return start_pool
+
+
+def _start_channel(channel_id: str, details: dict, config: dict) -> bool:
+    if not _claim(channel_id):
+        return False
+    try:
+        details['channelId'] = channel_id
+        channel_name = details.get("channelName", channel_id)
+        print(f"  -> New live stream detected for '{channel_name}' ({channel_id})")
+
+        started_info = start_recording(details, config, _take_continuation(channel_id, details),
+                                       quality=_capped_quality(channel_id),
+                                       threads=_thread_allocation(config, channel_id).get(channel_id))
+        if started_info and started_info.get("process"):
+            process = started_info["process"]
+            print(f"     Recording process started for '{channel_name}' (PID: {process.pid})")
+            _register_recording(channel_id, channel_name, started_info)
+            return True
+        print(f"     Failed to start recording for {channel_id}.")
+        return False
+    finally:
+        _release(channel_id)
+
+
+def _priority(config: dict, channel_id: str) -> float:
+    return float(channel_options(config, channel_id).get('priority', admission.DEFAULT_PRIORITY))
+
+
+def _capped_quality(channel_id: str):
+    """Quality override for a channel held to its floor under load (None = its own bounds)."""
+    with state_lock:
+        cap = runtime['capped'].get(channel_id)
+    return {'max_height': cap} if cap else None
+
+
+def _admit(channel_id: str, details: dict, config: dict, admitted: set) -> bool:
+    """Apply `max_concurrent_recordings` to a newly live channel (see admission.py).
+
+    `admitted` are the starts already submitted in this sweep. A preempted
+    recording is closed as interrupted, so it continues into its next part
+    once it gets a slot again.
+    """
+    cap = int(config.get('max_concurrent_recordings', 0))
+    protected_at = admission.protected_priority(config)
+    priority = _priority(config, channel_id)
+    name = details.get('channelName', channel_id)
+    with state_lock:
+        running_ids = set(currently_recording) | runtime['starting'] | admitted
+        running = {cid: _priority(config, cid) for cid in running_ids}
+        waiting = {cid: q['priority'] for cid, q in runtime['queued'].items() if cid != channel_id}
+        action, victim = admission.decide(priority, running, cap, waiting, protected_at,
+                                          preemptible=set(currently_recording) - runtime['starting'])
+        info = currently_recording.get(victim) if victim else None
+        if action == admission.PREEMPT and not (info and _claim(victim, info)):
+            action = admission.QUEUE
+        if action == admission.QUEUE:
+            if channel_id not in runtime['queued']:
+                print(f"  -> '{name}' ({channel_id}) waits for a recording slot ({len(running)}/{cap} in use)")
+                runtime['queued'][channel_id] = {'priority': priority, 'since': time.time(), 'reason': 'slots full'}
+            return False
+        runtime['queued'].pop(channel_id, None)
+        if action == admission.ADMIT and cap and len(running) >= cap:
+            print(f"  -> '{name}' ({channel_id}) is protected; recording over the cap of {cap}")
+        bandwidth = sum(max((i.get('variant') or {}).get('bandwidth', 0), 0) for i in currently_recording.values())
+        if (not admission.is_protected(priority, protected_at)
+                and admission.under_load(len(running) + (action == admission.ADMIT), bandwidth, config)):
+            runtime['capped'][channel_id] = admission.floor_height(channel_options(config, channel_id), config)
+    if action == admission.PREEMPT:
+        try:
+            print(f"  -> Preempting '{info['channel_name']}' ({victim}) for higher-priority '{name}' ({channel_id})")
+            _stop_process(info)
+            _end_recording(victim, journal.STATUS_INTERRUPTED, f'preempted by {channel_id}', info)
+            with state_lock:
+                runtime['queued'][victim] = {'priority': running[victim], 'since': time.time(),
+                                             'reason': f'preempted by {channel_id}'}
+        finally:
+            _release(victim)
+    return True
+
+
+def _enforce_load(api: ChzzkAPI, config: dict):
+    """Hold unprotected recordings to their quality floor while under load.
+
+    Lowest priority first, one make-before-break variant switch per sweep.
+    When the load passes the caps are lifted and the ABR upgrade check
+    brings the recordings back up.
+    """
+    with state_lock:
+        recs = dict(currently_recording)
+        capped = dict(runtime['capped'])
+    bandwidth = sum(max((i.get('variant') or {}).get('bandwidth', 0), 0) for i in recs.values())
+    if not admission.under_load(len(recs), bandwidth, config):
+        # lift only if the capped recordings also fit at full quality, or they would flap
+        full = 0
+        for cid, info in recs.items():
+            variant = info.get('variant') or {}
+            if cid in capped and variant:
+                opts = channel_options(config, cid)
+                variant = variants.constrain(info.get('variants') or [variant],
+                                             opts.get('min_height'), opts.get('max_height'))[0]
+            full += max(variant.get('bandwidth', 0), 0)
+        if capped and admission.under_load(len(recs), full, config):
+            return
+        with state_lock:
+            if runtime['capped']:
+                print(f"[ADMISSION] Load is back under the limits; lifting quality caps of {sorted(runtime['capped'])}")
+            runtime['capped'].clear()
+        return
+    protected_at = admission.protected_priority(config)
+    for channel_id in admission.downgrade_order({cid: _priority(config, cid) for cid in recs}, protected_at):
+        info = recs[channel_id]
+        floor = admission.floor_height(channel_options(config, channel_id), config)
+        with state_lock:
+            runtime['capped'][channel_id] = floor
+        variant = info.get('variant')
+        if not variant or variant['height'] <= floor:
+            continue
+        target = variants.constrain(info.get('variants') or [variant], max_height=floor)[0]
+        if target['height'] >= variant['height']:
+            continue
+        print(f"[ADMISSION] Under load: holding '{info['channel_name']}' ({channel_id}) to {target['height']}p")
+        _switch_variant(channel_id, info, api, config, target)
+        return
+
+
+def _stop_channel(channel_id: str, reason: str):
+    recording_info = currently_recording.get(channel_id)
+    if not recording_info:
+        return
+    try:
+        _stop_process(recording_info)
+        print(f"     Recording process for '{recording_info['channel_name']}' terminated ({reason}).")
+    except Exception as e:
+        print(f"     An unexpected error occurred during process termination: {e}")
+    _end_recording(channel_id, journal.STATUS_ENDED, reason, recording_info)
+    with state_lock:
+        pending_continuations.pop(channel_id, None)
+
+
+def _handle_command(name: str, args: dict) -> dict:
+    """Execute one control-API command (on the control duty thread)."""
+    channel_id = (args or {}).get('channel_id')
+    persist = bool((args or {}).get('persist', True))
+    if name == 'status':
+        recordings = {}
+        for cid, info in list(currently_recording.items()):
+            variant = info.get('variant') or {}
+            recordings[cid] = {
+                'channel_name': info.get('channel_name'),
+                'priority': _priority(runtime['config'], cid),
+                'capped_height': runtime['capped'].get(cid),
+                'output': info.get('output'),
+                'pid': getattr(info.get('process'), 'pid', None),
+                'size': info.get('last_size'),
+                'height': variant.get('height'),
+                'threads': info.get('threads'),
+                'backfill': info['backfill'].status() if info.get('backfill') else None,
+                'capture': info.get('capture'),
+                'llhls': llhls.read_progress(info.get('progress_path')),
+            }
+        with state_lock:
+            overrides = {
+                'targets': sorted(runtime['targets']),
+                'forced': sorted(runtime['forced']),
+                'suppressed': sorted(runtime['suppressed']),
+                'queued': dict(runtime['queued']),
+            }
+        return {
+            'ok': True,
+            'paused': runtime['paused'],
+            **overrides,
+            'recordings': recordings,
+            'max_concurrent_recordings': int(runtime['config'].get('max_concurrent_recordings', 0)),
+            'duties': scheduler.stats() if scheduler else {},
+            'profiling': profiler.status(),
+            'uploads': upload_manager.status() if upload_manager else {},
+            'sessions': runtime['api'].pool_status() if runtime['api'] else {},
+            'start_latency': _latency_summary(list(start_latencies)),
+        }
+    if name == 'pause':
+        runtime['paused'] = True
+        return {'ok': True, 'paused': True}
+    if name == 'resume':
+        runtime['paused'] = False
+        return {'ok': True, 'paused': False}
+    if name == 'reload':
+        return {'ok': True, 'changed': _reload_config_if_changed(force=True)}
+    if name == 'profile':
+        return _profile_command(args or {})
+    if not channel_id:
+        return {'ok': False, 'error': 'channel_id is required'}
+    if name == 'add_channel':
+        with state_lock:
+            runtime['targets'].add(channel_id)
+            targets = sorted(runtime['targets'])
+        if persist:
+            _persist_targets()
+        return {'ok': True, 'targets': targets}
+    if name == 'remove_channel':
+        with state_lock:
+            runtime['targets'].discard(channel_id)
+            runtime['forced'].discard(channel_id)
+            targets = sorted(runtime['targets'])
+        _stop_channel(channel_id, 'removed via control API')
+        if persist:
+            _persist_targets()
+        return {'ok': True, 'targets': targets}
+    if name == 'start':
+        if channel_id in currently_recording:
+            return {'ok': True, 'already_recording': True}
+        details = runtime['api'].get_live_details(channel_id)
+        if not details or not details.get('m3u8_url'):
+            return {'ok': False, 'error': 'channel is not live'}
+        with state_lock:
+            runtime['suppressed'].discard(channel_id)
+            runtime['forced'].add(channel_id)
+        return {'ok': _start_channel(channel_id, details, runtime['config'])}
+    if name == 'stop':
+        if channel_id not in currently_recording:
+            return {'ok': False, 'error': 'channel is not being recorded'}
+        with state_lock:
+            runtime['suppressed'].add(channel_id)
+            runtime['forced'].discard(channel_id)
+        _stop_channel(channel_id, 'stopped via control API')
+        return {'ok': True}
+    return {'ok': False, 'error': f'unknown command {name}'}
+
+
+def _latency_summary(values: list) -> dict:
+    """p50/p90/max of recent detection -> first byte times (seconds)."""
+    if not values:
+        return {'n': 0}
+    vals = sorted(values)
+    return {'n': len(vals), 'p50': round(vals[len(vals) // 2], 3),
+            'p90': round(vals[min(len(vals) - 1, int(len(vals) * 0.9))], 3), 'max': round(vals[-1], 3)}
+
+
+def _profile_command(args: dict) -> dict:
+    """`mode`: cprofile / sample (capture for `seconds`), timers / tracemalloc (`enable`), snapshot."""
+    mode = args.get('mode', 'cprofile')
+    if mode in ('cprofile', 'sample'):
+        return profiler.start_capture(mode, args.get('seconds'))
+    if mode == 'timers':
+        profiler.set_timers(bool(args.get('enable', True)))
+    elif mode == 'tracemalloc':
+        profiler.set_tracemalloc(bool(args.get('enable', True)))
+    elif mode == 'snapshot':
+        profiler.memory_snapshot()
+    else:
+        return {'ok': False, 'error': f'unknown profile mode {mode}'}
+    return {'ok': True, 'profiling': profiler.status()}
+
+
+def _register_recording(channel_id: str, channel_name: str, started_info: dict):
+    with state_lock:
+        currently_recording[channel_id] = _recording_entry(channel_name, started_info)
+    if upload_manager is not None:
+        upload_manager.track(started_info.get("meta_path"))
+        if started_info.get("backfill") is not None:
+            started_info["backfill"].add_done_callback(upload_manager.track)
+
+
+def _recording_entry(channel_name: str, started_info: dict) -> dict:
+    return {
+        "process": started_info["process"],
+        "channel_name": channel_name,
+        "output": started_info.get("output"),
+        "title": started_info.get("title"),
+        "log_dir": started_info.get("log_dir"),
+        "meta_path": started_info.get("meta_path"),
+        "variant": started_info.get("variant"),
+        "variants": started_info.get("variants") or [],
+        "threads": started_info.get("threads"),
+        "session_path": started_info.get("session_path"),
+        "backfill": started_info.get("backfill"),
+        "writer_pid": started_info.get("writer_pid"),
+        "capture": started_info.get("capture"),
+        "progress_path": started_info.get("progress_path"),
+        "last_size": 0,
+        "last_grow": time.time(),
+        "lock": threading.Lock(),
+    }
+
+
+def _stop_process(info: dict):
+    """Stop a recording's downloader.
+
+    An LL-HLS capture gets SIGTERM first so it closes its output (final
+    fsync, trimming the preallocated extent); it is killed only if it has
+    not exited within `output_writer_exit_timeout_seconds`.
+    """
+    proc = info['process']
+    if info.get('capture') == 'llhls':
+        try:
+            proc.terminate()
+        except Exception:
+            pass
+        timeout = float(runtime['config'].get('output_writer_exit_timeout_seconds', 10))
+        if writer.wait_exit(proc.pid, timeout):
+            proc.poll()
+            return
+        print(f"[LLHLS] Capture PID {proc.pid} for {info.get('output')} ignored SIGTERM for {timeout:.0f}s; killing it.")
+    try:
+        proc.kill()
+    except Exception:
+        pass
+
+
+def _end_recording(channel_id: str, status: str, reason: str, info: dict = None):
+    """Drop a recording from the in-memory state and close its journal entry.
+
+    Interrupted recordings are remembered so the next start for the same
+    broadcast continues into a new part file. With `info` only that entry
+    is ended, not one a restart registered in its place.
+    """
+    with state_lock:
+        if info is not None and currently_recording.get(channel_id) is not info:
+            return
+        info = currently_recording.pop(channel_id, None)
+    if not info:
+        return
+    if info.get('writer_pid'):
+        # writer.py still flushes its buffer after the downloader is gone; the
+        # final scan and the end mark (which completes the upload) need the tail
+        timeout = float(runtime['config'].get('output_writer_exit_timeout_seconds', 10))
+        if not writer.wait_exit(info['writer_pid'], timeout):
+            print(f"[WRITER] Writer PID {info['writer_pid']} for {info.get('output')} still running after {timeout:.0f}s.")
+    _scan_output(info, config=None, now_ts=None, final=True)
+    if info.get('timeline'):
+        info['timeline'].close()
+    meta = journal.mark_ended(info.get('meta_path'), status, reason)
+    if info.get('progress_path') and status != journal.STATUS_INTERRUPTED:
+        # only the backfill of an interrupted part needs the LL-HLS position
+        try:
+            os.remove(info['progress_path'])
+        except OSError:
+            pass
+    if status == journal.STATUS_INTERRUPTED and meta:
+        meta['meta_path'] = info.get('meta_path')
+        with state_lock:
+            pending_continuations[channel_id] = journal.continuation_of(meta)
+
+
+def _take_continuation(channel_id: str, details: dict):
+    """Return the pending continuation for `channel_id` if it is the same broadcast."""
+    with state_lock:
+        cont = pending_continuations.pop(channel_id, None)
+    if cont and cont.get('videoId') and cont.get('videoId') == (details or {}).get('videoId'):
+        return cont
+    return None
+
+
+def _live_edge_sequence(info: dict, config: dict):
+    """`(seq, segment_seconds)` of the newest segment in the recorded variant's playlist.
+
+    `seq` is -1 if unknown; `segment_seconds` is the playlist's mean segment duration.
+    """
+    variant = info.get('variant')
+    if not variant:
+        return -1, None
+    try:
+        r = variants.http.get(variant['url'], headers=session_headers(config, info.get('session_path')), timeout=5)
+        if not r.ok:
+            return -1, None
+        playlist = variants.parse_media_playlist(r.text, variant['url'])
+        segments = playlist['segments']
+        if not segments:
+            return -1, None
+        durations = [seg['duration'] for seg in segments if seg.get('duration')]
+        seg_seconds = (sum(durations) / len(durations)) if durations else playlist.get('target_duration')
+        return segments[-1]['seq'], seg_seconds
+    except Exception:
+        return -1, None
+
+
+def _scan_output(info: dict, config: dict, now_ts: float, final: bool = False):
+    """Scan what the downloader wrote since the last check.
+
+    One pass feeds both the integrity report and the timeline index; both
+    land in the sidecar. Either can be turned off on its own
+    (`integrity_check_enabled`, `timeline_index_enabled`). Runs every
+    `integrity_check_interval_seconds` while recording and once more when
+    the recording ends.
+    """
+    lock = info.get('lock')
+    if lock is None:
+        return _scan_output_locked(info, config, now_ts, final)
+    with lock:
+        return _scan_output_locked(info, config, now_ts, final)
+
+
+def _scan_output_locked(info: dict, config: dict, now_ts: float, final: bool):
+    scanner = info.get('ts_scanner')
+    if not final:
+        check_integrity = bool(config.get('integrity_check_enabled', True))
+        with_index = bool(config.get('timeline_index_enabled', True))
+        if not check_integrity and not with_index:
+            return
+        interval = float(config.get('integrity_check_interval_seconds', 60))
+        if now_ts - info.get('integrity_checked_at', 0) < interval:
+            return
+        info['integrity_checked_at'] = now_ts
+        if scanner is None:
+            info['integrity_enabled'] = check_integrity
+            # a reattached output may have its uploaded head hole-punched already
+            punched = journal.punched_bytes(journal.read_meta(info.get('meta_path')))
+            scanner = info['ts_scanner'] = ts_check.TsScanner(index=with_index).skip_to(punched)
+            if with_index and info.get('output'):
+                # a fresh scanner starts at the file head, so the index is rebuilt too
+                info['timeline'] = timeline.open_for_rescan(info['output'], scanner, punched)
+    if scanner is None or not info.get('output') or not os.path.exists(info['output']):
+        return
+    try:
+        scanner.scan_path(info['output'], final=final)
+        report = scanner.report()
+        check_integrity = info.get('integrity_enabled', True)
+        fields = {'integrity': report} if check_integrity else {}
+        index_writer = info.get('timeline')
+        if index_writer is not None:
+            entries = scanner.take_entries()
+            if entries:
+                seq, seg_seconds = (-1, None) if final else _live_edge_sequence(info, config)
+                index_writer.append(entries, media_seq=seq, segment_seconds=seg_seconds)
+                keyframes = [e for e in entries if e[3] & ts_check.FLAG_KEYFRAME]
+                if keyframes:
+                    info['last_keyframe'] = (keyframes[-1][1] / ts_check.PTS_HZ, keyframes[-1][2])
+            fields['index'] = timeline.index_info(scanner, index_writer.path, index_writer.count)
+        if fields and info.get('meta_path') and os.path.exists(info['meta_path']):
+            journal.update_meta(info['meta_path'], **fields)
+        if thumbnail_pool is not None:
+            thumbnail_pool.maybe_submit(info, final=final)
+        if check_integrity and not report['ok'] and report != info.get('integrity_reported'):
+            print(f"[INTEGRITY] {info['channel_name']}: cc_errors={report['continuity_errors']} "
+                  f"gaps={report['timestamp_gap_count']} lost={report['lost_seconds']}s sync_losses={report['sync_losses']}")
+        info['integrity_reported'] = report
+    except Exception as e:
+        print(f"[INTEGRITY] Scan failed for {info.get('output')}: {e}")
+
+
+def _check_variant(channel_id: str, info: dict, api: ChzzkAPI, config: dict, now_ts: float):
+    """Switch variants when sustained throughput no longer fits (or fits again).
+
+    Downgrade: the output grew slower than `abr_downgrade_ratio` x BANDWIDTH
+    over `abr_window_seconds` and a probe of the current variant confirms
+    the link cannot sustain it. Upgrade: every `abr_upgrade_interval_seconds`
+    the next higher allowed variant is probed and taken if the measured
+    throughput clears its BANDWIDTH by `abr_upgrade_headroom`.
+    """
+    if not bool(config.get('abr_enabled', True)):
+        return
+    variant = info.get('variant')
+    all_variants = info.get('variants') or []
+    if not variant or len(all_variants) < 2:
+        return
+    opts = channel_options(config, channel_id)
+    window = float(config.get('abr_window_seconds', 60))
+    samples = info.setdefault('abr_samples', [])
+    samples.append((now_ts, info.get('last_size', 0)))
+    while len(samples) > 2 and now_ts - samples[1][0] >= window:
+        samples.pop(0)
+
+    hdrs = None
+    target = None
+    span = now_ts - samples[0][0]
+    if span >= window and variant.get('bandwidth', 0) > 0:
+        rate_bps = (samples[-1][1] - samples[0][1]) * 8 / span
+        if rate_bps < variant['bandwidth'] * float(config.get('abr_downgrade_ratio', 0.5)):
+            lower = variants.next_lower(all_variants, variant, opts.get('min_height'))
+            if lower:
+                hdrs = session_headers(config, info.get('session_path'))
+                measured = variants.probe_throughput(variant['url'], hdrs)
+                if measured is not None and measured < variant['bandwidth']:
+                    print(f"[ABR] {info['channel_name']}: {int(measured)} bps < {variant['bandwidth']} bps, downgrading to {lower['height']}p")
+                    target = lower
+            # Start a fresh window either way so one slow stretch is probed once
+            del samples[:-1]
+
+    if target is None:
+        interval = float(config.get('abr_upgrade_interval_seconds', 300))
+        last_check = info.setdefault('abr_last_upgrade_check', now_ts)
+        if now_ts - last_check >= interval:
+            info['abr_last_upgrade_check'] = now_ts
+            max_height = opts.get('max_height')
+            cap = runtime['capped'].get(channel_id)
+            if cap:
+                max_height = min(max_height or cap, cap)
+            higher = variants.next_higher(all_variants, variant, max_height)
+            if higher:
+                hdrs = hdrs or session_headers(config, info.get('session_path'))
+                measured = variants.probe_throughput(higher['url'], hdrs)
+                headroom = float(config.get('abr_upgrade_headroom', 1.5))
+                if measured is not None and measured >= higher['bandwidth'] * headroom:
+                    print(f"[ABR] {info['channel_name']}: {int(measured)} bps has headroom, upgrading to {higher['height']}p")
+                    target = higher
+
+    if target is not None:
+        _switch_variant(channel_id, info, api, config, target)
+
+
+def _switch_variant(channel_id: str, info: dict, api: ChzzkAPI, config: dict, target: dict):
+    _restart_into_next_part(
+        channel_id, info, api, config, f"variant switch to {target['height']}p",
+        quality={'min_height': target['height'], 'max_height': target['height']},
+    )
+
+
+def _restart_into_next_part(channel_id: str, info: dict, api: ChzzkAPI, config: dict, reason: str,
+                            quality: dict = None, threads: int = None):
+    """Make-before-break restart of a healthy recording into its next part file.
+
+    The new downloader starts on the next segment before the old one is
+    stopped, so the switch happens on a segment boundary without a gap.
+    """
+    if not _claim(channel_id, info):
+        return False
+    try:
+        return _restart_locked(channel_id, info, api, config, reason, quality, threads)
+    finally:
+        _release(channel_id)
+
+
+def _restart_locked(channel_id: str, info: dict, api: ChzzkAPI, config: dict, reason: str,
+                    quality: dict, threads: int) -> bool:
+    det = api.get_live_details(channel_id)
+    if not det or not det.get('m3u8_url'):
+        return False
+    det['channelId'] = channel_id
+    meta = journal.read_meta(info.get('meta_path')) or {}
+    meta['meta_path'] = info.get('meta_path')
+    if threads is None:
+        threads = _thread_allocation(config).get(channel_id)
+    started = start_recording(det, config, journal.continuation_of(meta, interrupted=False),
+                              quality=quality, threads=threads)
+    if not started or not started.get('process'):
+        print(f"[RESTART] {reason} for {channel_id} failed; keeping current recording.")
+        return False
+    _stop_process(info)
+    _end_recording(channel_id, journal.STATUS_ENDED, reason, info)
+    _register_recording(channel_id, info['channel_name'], started)
+    return True
+
+
+def _thread_allocation(config: dict, extra_channel_id: str = None) -> dict:
+    """Threads per recording for the current set of recordings (plus one about to start)."""
+    ids = set(currently_recording)
+    if extra_channel_id:
+        ids.add(extra_channel_id)
+    if not bool(config.get('dynamic_threads', True)):
+        fixed = int(config.get('n_m3u8dlre_threads', 8))
+        return {cid: fixed for cid in ids}
+    priorities = {cid: channel_options(config, cid).get('priority', 1) for cid in ids}
+    total = budget.total_threads(config, per_connection_bps=variants.last_throughput_bps)
+    return budget.allocate(
+        priorities, total,
+        min_per=int(config.get('min_threads_per_recording', 2)),
+        max_per=int(config.get('max_threads_per_recording', 16)),
+    )
+
+
+def _rebalance_threads(api: ChzzkAPI, config: dict):
+    """Recompute thread shares after recordings started or stopped.
+
+    N_m3u8DL-RE cannot change its thread count while running, so new shares
+    take effect at each recording's next (re)start. With
+    `thread_rebalance_restart` a recording whose share changed by at least
+    2x is moved into a new part file right away.
+    """
+    if not currently_recording:
+        return
+    alloc = _thread_allocation(config)
+    restart = bool(config.get('thread_rebalance_restart', False))
+    for channel_id, target in alloc.items():
+        info = currently_recording.get(channel_id)
+        if not info:
+            continue
+        info['threads_target'] = target
+        current = info.get('threads') or target
+        if restart and max(current, target) >= 2 * min(current, target):
+            variant = info.get('variant')
+            quality = {'min_height': variant['height'], 'max_height': variant['height']} if variant else None
+            print(f"[THREADS] {info['channel_name']}: {current} -> {target} threads")
+            _restart_into_next_part(channel_id, info, api, config, f"thread rebalance to {target}",
+                                    quality=quality, threads=target)
+
+
+def _storage_dirs(config: dict, recordings_dir: str) -> list:
+    """The default recordings directory plus every per-channel `storage_path`."""
+    dirs = [recordings_dir]
+    for opts in (config.get('CHANNEL_OPTIONS') or {}).values():
+        path = isinstance(opts, dict) and opts.get('storage_path')
+        if path and path not in dirs:
+            dirs.append(path)
+    return dirs
+
+
+def _restore_from_journal(base_dirs):
+    """Reattach to downloaders that survived a watcher restart.
+
+    Journal entries whose process is gone are closed as interrupted and
+    queued as continuations, so the next poll resumes into a `_partN` file
+    instead of archiving the previous output.
+    """
+    for meta in journal.scan_active(base_dirs):
+        channel_id = meta.get('channelId')
+        meta_path = meta.get('meta_path')
+        if not channel_id:
+            journal.mark_ended(meta_path, journal.STATUS_INTERRUPTED, 'journal entry without channelId')
+            continue
+        proc = journal.reattach(meta)
+        if proc is not None:
+            out_path = meta.get('output')
+            try:
+                last_size = os.path.getsize(out_path) if out_path else 0
+            except OSError:
+                last_size = 0
+            currently_recording[channel_id] = {
+                "process": proc,
+                "channel_name": meta.get('channelName', channel_id),
+                "output": out_path,
+                "title": meta.get('liveTitle'),
+                "log_dir": meta.get('log_dir'),
+                "meta_path": meta_path,
+                "variant": meta.get('variant'),
+                "variants": meta.get('variants') or [],
+                "threads": meta.get('threads'),
+                "session_path": meta.get('session_path'),
+                "writer_pid": meta.get('writer_pid'),
+                "capture": meta.get('capture'),
+                "progress_path": meta.get('llhls_progress'),
+                "last_size": last_size,
+                "last_grow": time.time(),
+                "lock": threading.Lock(),
+            }
+            print(f"[JOURNAL] Reattached to '{meta.get('channelName')}' ({channel_id}) PID {proc.pid} -> {out_path}")
+        else:
+            journal.mark_ended(meta_path, journal.STATUS_INTERRUPTED, 'downloader gone after watcher restart')
+            pending_continuations[channel_id] = journal.continuation_of(meta)
+            print(f"[JOURNAL] Downloader for '{meta.get('channelName')}' ({channel_id}) is gone; next start continues as part {pending_continuations[channel_id]['part']}.")
+
+
 def _run_daily_cleanup(api: ChzzkAPI, config: dict):
     """Check recorded TS files' metadata against VOD list; delete if VOD exists.
     Runs once per day.
@@ -214,44 +1160,52 @@ def _run_daily_cleanup(api: ChzzkAPI, config: dict):
         # Build map: channelId -> set(videoIds in VOD list)
         vod_cache = {}
 
-        for root, dirs, files in os.walk(base_dir):
-            for fname in files:
-                if not fname.endswith('.meta.json'):
-                    continue
-                meta_path = os.path.join(root, fname)
-                try:
-                    with open(meta_path, 'r', encoding='utf-8') as f:
-                        meta = json.load(f)
-                except Exception:
-                    continue
-
-                channel_id = meta.get('channelId')
-                video_id = meta.get('videoId')
-                out_path = meta.get('output')
-                if not channel_id or not video_id:
-                    continue
-
-                # Fetch and cache VOD list videoIds
-                if channel_id not in vod_cache:
+        for meta_path in journal.iter_meta_files(_storage_dirs(config, base_dir)):
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except Exception:
+                continue
+
+            channel_id = meta.get('channelId')
+            video_id = meta.get('videoId')
+            out_path = meta.get('output')
+            if not channel_id or not video_id:
+                continue
+
+            # Fetch and cache VOD list videoIds
+            if channel_id not in vod_cache:
+                with phase('cleanup.api'):
                     items = api.get_channel_videos(channel_id, page=0, size=50, sort='LATEST')
-                    vod_ids = {it.get('videoId') for it in items if isinstance(it, dict) and it.get('videoId')}
-                    vod_cache[channel_id] = vod_ids
-                else:
-                    vod_ids = vod_cache[channel_id]
-
-                if video_id in vod_ids:
-                    # Delete the TS file and meta
-                    reason = f"VOD exists for videoId={video_id}. Deleting local copy."
-                    try:
-                        if out_path and os.path.exists(out_path):
-                            os.remove(out_path)
-                    except Exception as e:
-                        reason += f" (file delete error: {e})"
+                vod_ids = {it.get('videoId') for it in items if isinstance(it, dict) and it.get('videoId')}
+                vod_cache[channel_id] = vod_ids
+            else:
+                vod_ids = vod_cache[channel_id]
+
+            if video_id in vod_ids and upload_manager is not None and upload_manager.pending(meta):
+                print(f"[CLEANUP] Keeping {out_path} until its upload completes.")
+                continue
+            if video_id in vod_ids:
+                # Delete the TS file and meta
+                reason = f"VOD exists for videoId={video_id}. Deleting local copy."
+                try:
+                    if out_path and os.path.exists(out_path):
+                        os.remove(out_path)
+                except Exception as e:
+                    reason += f" (file delete error: {e})"
+                try:
+                    os.remove(meta_path)
+                except Exception as e:
+                    reason += f" (meta delete error: {e})"
+                if out_path:
                     try:
-                        os.remove(meta_path)
+                        idx_path = timeline.index_path_for(out_path)
+                        if os.path.exists(idx_path):
+                            os.remove(idx_path)
+                        shutil.rmtree(thumbs_dir_for(out_path), ignore_errors=True)
                     except Exception as e:
-                        reason += f" (meta delete error: {e})"
-                    _append_cleanup_log(cleanup_log, meta, reason)
+                        reason += f" (index/thumbnail delete error: {e})"
+                _append_cleanup_log(cleanup_log, meta, reason)
     except Exception as e:
         print(f"[CLEANUP] Unexpected error: {e}")
 
@@ -272,3 +1226,9 @@ def _append_cleanup_log(cleanup_log: str, meta: dict, reason: str):
         print(f"[CLEANUP] {reason} -> {meta.get('output')}")
     except Exception as e:
         print(f"[CLEANUP] Failed to write cleanup log: {e}")
+
+
+if __name__ == "__main__":
+    # Change directory to the script's location
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    main_loop()
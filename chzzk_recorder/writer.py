@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Write-behind output writer with preallocation and an fsync policy.
+
+With `output_writer_enabled` the downloader's muxer writes into a FIFO and
+this process (detached like the downloader, so it survives a watcher
+restart) owns the real `.ts` file:
+
+- space is reserved ahead of the write position in `output_extent_mb`
+  extents with `fallocate(FALLOC_FL_KEEP_SIZE)`, so concurrent recordings
+  on one volume get long contiguous runs and the visible size still only
+  grows with data (stall detection, scans and uploads are unaffected);
+- data is batched in a `output_buffer_mb` write-behind buffer and written
+  when it is full or `output_flush_ms` old;
+- `fdatasync` runs every `output_fsync_seconds` and/or every
+  `output_fsync_mb` of data (set it to `upload_part_size_mb` to sync on
+  upload part boundaries), and always at the end;
+- at the end the unused reservation is released with `ftruncate`.
+
+    python3 writer.py --fifo .NAME.pipe.ts --out NAME.ts [--extent-mb 256] [--buffer-mb 8]
+"""
+
+import os
+import sys
+import time
+import errno
+import ctypes
+import select
+import argparse
+from typing import Optional
+
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+READ_CHUNK = 1 << 20
+PIPE_SUFFIX = '.pipe'
+
+_libc = None
+
+
+def fallocate(fd: int, mode: int, offset: int, length: int) -> bool:
+    """Linux `fallocate(2)`; False where the call or the filesystem does not support it."""
+    global _libc
+    try:
+        if _libc is None:
+            _libc = ctypes.CDLL(None, use_errno=True)
+            _libc.fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+        return _libc.fallocate(fd, mode, offset, length) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+def pipe_name_for(basename: str) -> str:
+    """Downloader save-name whose output is the FIFO of `basename` (hidden, skipped by archiving)."""
+    return f".{basename}{PIPE_SUFFIX}"
+
+
+class OutputWriter:
+    def __init__(self, path: str, extent_bytes: int = 256 << 20, buffer_bytes: int = 8 << 20,
+                 flush_seconds: float = 1.0, fsync_seconds: float = 10.0, fsync_bytes: int = 0):
+        self.path = path
+        self.extent = max(extent_bytes, 0)
+        self.buffer_bytes = max(buffer_bytes, 64 * 1024)
+        self.flush_seconds = flush_seconds
+        self.fsync_seconds = fsync_seconds
+        self.fsync_bytes = fsync_bytes
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+        self.pos = os.lseek(self.fd, 0, os.SEEK_END)
+        self.reserved = self.pos
+        self.buf = bytearray()
+        self.buf_since: Optional[float] = None
+        self.synced_at = time.monotonic()
+        self.synced_pos = self.pos
+        self.stats = {'writes': 0, 'fsyncs': 0, 'extents': 0, 'bytes': 0}
+
+    def feed(self, data: bytes):
+        if not self.buf:
+            self.buf_since = time.monotonic()
+        self.buf += data
+        if len(self.buf) >= self.buffer_bytes:
+            self.flush()
+
+    def tick(self):
+        """Flush an aged buffer and run the time-based fsync (call at least every flush interval)."""
+        now = time.monotonic()
+        if self.buf and now - self.buf_since >= self.flush_seconds:
+            self.flush()
+        if self.fsync_seconds and self.pos > self.synced_pos and now - self.synced_at >= self.fsync_seconds:
+            self.sync()
+
+    def flush(self):
+        if not self.buf:
+            return
+        self._reserve(self.pos + len(self.buf))
+        view = memoryview(self.buf)
+        while view:
+            n = os.write(self.fd, view)
+            view = view[n:]
+        self.pos += len(self.buf)
+        self.stats['writes'] += 1
+        self.stats['bytes'] += len(self.buf)
+        self.buf = bytearray()
+        self.buf_since = None
+        if self.fsync_bytes and self.pos // self.fsync_bytes != self.synced_pos // self.fsync_bytes:
+            self.sync()
+
+    def sync(self):
+        os.fdatasync(self.fd)
+        self.synced_at = time.monotonic()
+        self.synced_pos = self.pos
+        self.stats['fsyncs'] += 1
+
+    def _reserve(self, end: int):
+        if not self.extent or end <= self.reserved:
+            return
+        start = self.reserved
+        while self.reserved < end:
+            self.reserved += self.extent
+        if fallocate(self.fd, FALLOC_FL_KEEP_SIZE, start, self.reserved - start):
+            self.stats['extents'] += 1
+        else:
+            # unsupported here (tmpfs, some network filesystems): plain appends from now on
+            self.extent = 0
+
+    def close(self):
+        try:
+            self.flush()
+            self.sync()
+        finally:
+            # blocks reserved past EOF go back to the filesystem
+            if self.reserved > self.pos:
+                os.ftruncate(self.fd, self.pos)
+            os.close(self.fd)
+
+
+def _alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    try:
+        # an exited child its parent has not reaped yet still answers kill(0)
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] not in ('Z', 'X')
+    except (OSError, IndexError):
+        return True
+
+
+def wait_exit(pid: Optional[int], timeout: float = 10.0) -> bool:
+    """Wait for a writer to flush and exit after its downloader is gone; False on timeout."""
+    if not pid:
+        return True
+    deadline = time.monotonic() + timeout
+    while _alive(pid):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def run(fifo: str, writer: OutputWriter, owner_pid: Optional[int] = None) -> int:
+    """Copy the FIFO into `writer` until the muxer closes it.
+
+    The read end is non-blocking so a downloader (`owner_pid`) that dies
+    before its muxer ever opens the FIFO does not leave this process behind.
+    """
+    rfd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+    opened = False
+    try:
+        while True:
+            ready, _, _ = select.select([rfd], [], [], writer.flush_seconds)
+            if not ready and not opened and not _alive(owner_pid):
+                break
+            if ready:
+                try:
+                    data = os.read(rfd, READ_CHUNK)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                if data:
+                    opened = True
+                    writer.feed(data)
+                elif opened:
+                    break
+                elif not _alive(owner_pid):
+                    break
+                else:
+                    # no writer on the FIFO yet
+                    time.sleep(0.2)
+            writer.tick()
+    finally:
+        os.close(rfd)
+        writer.close()
+        try:
+            os.remove(fifo)
+        except OSError:
+            pass
+    return 0
+
+
+def main(argv) -> int:
+    ap = argparse.ArgumentParser(description='Preallocating write-behind writer for a downloader FIFO.')
+    ap.add_argument('--fifo', required=True)
+    ap.add_argument('--out', required=True)
+    ap.add_argument('--extent-mb', type=float, default=256)
+    ap.add_argument('--buffer-mb', type=float, default=8)
+    ap.add_argument('--flush-ms', type=float, default=1000)
+    ap.add_argument('--fsync-seconds', type=float, default=10)
+    ap.add_argument('--fsync-mb', type=float, default=0)
+    ap.add_argument('--owner-pid', type=int, help='give up if this process exits before writing')
+    args = ap.parse_args(argv)
+    if not os.path.exists(args.fifo):
+        try:
+            os.mkfifo(args.fifo)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    writer = OutputWriter(args.out, int(args.extent_mb * 1048576), int(args.buffer_mb * 1048576),
+                          args.flush_ms / 1000.0, args.fsync_seconds, int(args.fsync_mb * 1048576))
+    started = time.time()
+    code = run(args.fifo, writer, args.owner_pid)
+    s = writer.stats
+    print(f"[WRITER] {args.out}: {s['bytes']} bytes in {s['writes']} writes, {s['extents']} extents, "
+          f"{s['fsyncs']} fsyncs, {time.time() - started:.0f}s", flush=True)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))